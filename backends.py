@@ -0,0 +1,1016 @@
+#!/usr/bin/env python
+#
+# backends.py -- storage backends for tournament.py
+#
+# tournament.py implements the tournament rules (name lookups, byes,
+# pairing) on top of the small set of storage primitives defined by
+# Backend. tournament.PostgresBackend is the default; MemoryBackend and
+# SQLiteBackend keep the same semantics without a PostgreSQL server, e.g.
+# for offline simulations. Select one with tournament.setBackend().
+#
+
+import sqlite3
+import threading
+from array import array
+from collections import defaultdict
+from contextlib import contextmanager
+from decimal import Decimal
+from fractions import Fraction
+
+# Tiebreakers known to Backend.tiebreakStandings(), in column order. See
+# migrations/004_tiebreaks.sql for their definitions.
+TIEBREAKS = ('buchholz', 'sonneborn_berger', 'opponent_win_pct')
+
+# Decimal places opponent_win_pct is rounded to, half up, as in
+# migrations/012_exact_opponent_win_pct.sql.
+WIN_PCT_PLACES = 12
+
+
+def _roundFraction(value, places):
+    scaled = (2 * value.numerator * 10 ** places + value.denominator) // \
+        (2 * value.denominator)
+    return Decimal(scaled).scaleb(-places)
+
+
+def computeTiebreaks(standings, results):
+    """Computes the tiebreakers of every player from the raw results.
+
+    Args:
+      standings: (id, name, wins, losses) rows of the registered players.
+      results: (winner, loser) tuples of every match of the tournament.
+
+    Returns:
+      A list of (id, name, wins, losses, buchholz, sonneborn_berger,
+      opponent_win_pct) rows, in the order of standings. opponent_win_pct
+      is a Decimal computed exactly, as the database does, so that equal
+      percentages compare equal.
+    """
+    records = dict((row[0], (row[2], row[3])) for row in standings)
+    buchholz = {}
+    sonneborn_berger = {}
+    win_pct = {}
+    faced = {}
+
+    for winner, loser in results:
+        if winner == loser:
+            continue
+        for player, opponent, won in ((winner, loser, 1), (loser, winner, 0)):
+            if player not in records or opponent not in records:
+                continue
+            wins, losses = records[opponent]
+            buchholz[player] = buchholz.get(player, 0) + wins
+            if won:
+                sonneborn_berger[player] = \
+                    sonneborn_berger.get(player, 0) + wins
+            ratio = Fraction(wins, wins + losses) if wins + losses else 0
+            win_pct[player] = win_pct.get(player, 0) + \
+                max(ratio, Fraction(1, 3))
+            faced[player] = faced.get(player, 0) + 1
+
+    return [tuple(row[:4]) + (buchholz.get(row[0], 0),
+                              sonneborn_berger.get(row[0], 0),
+                              _roundFraction(win_pct.get(row[0], 0) /
+                                             Fraction(faced.get(row[0], 1)),
+                                             WIN_PCT_PLACES))
+            for row in standings]
+
+
+def refuseArchived(tid):
+    """Raises the ValueError of a write to an archived tournament."""
+    raise ValueError(
+        "Tournament {tid} is archived and cannot be played any more."
+        .format(tid=tid))
+
+
+class TournamentState(object):
+    """The players, records and played pairs of one tournament, in memory.
+
+    Holds what pairing a round needs, so that within a round standings,
+    byes and rematch checks are answered without queries. Players are kept
+    in id order in parallel arrays; recordMatch() keeps them up to date as
+    results are reported.
+
+    Args:
+      tid: the tournament id.
+      round: the round the state was loaded in.
+      players: (id, name, wins, losses) rows of the registered players.
+      pairs: the (winner, loser) tuples of every match, byes included.
+      version: the version of the tournament the state describes (see
+        Backend.tournamentVersion), None if the backend keeps none.
+    """
+
+    __slots__ = ('tid', 'round', 'version', 'ids', 'names', 'wins',
+                 'losses', 'byes', 'played', '_index', '_lock')
+
+    def __init__(self, tid, round, players, pairs, version=None):
+        players = sorted(players)
+        self.tid = tid
+        self.round = round
+        self.version = version
+        self.ids = array('l', [row[0] for row in players])
+        self.names = [row[1] for row in players]
+        self.wins = array('l', [row[2] for row in players])
+        self.losses = array('l', [row[3] for row in players])
+        self.byes = bytearray(len(players))
+        self.played = set()
+        self._index = dict((pid, i) for i, pid in enumerate(self.ids))
+        self._lock = threading.Lock()
+
+        for winner, loser in pairs:
+            self.played.add((winner, loser) if winner <= loser
+                            else (loser, winner))
+            if winner == loser and winner in self._index:
+                self.byes[self._index[winner]] = 1
+
+    def countPlayers(self):
+        """Returns the number of registered players."""
+        return len(self.ids)
+
+    def standings(self):
+        """Returns the standings rows, as Backend.standings()."""
+        wins = self.wins
+        order = sorted(range(len(self.ids)), key=lambda i: (-wins[i], i))
+
+        return [(self.ids[i], self.names[i], wins[i], self.losses[i])
+                for i in order]
+
+    def matchExists(self, winner, loser):
+        """Returns True if the two players already met, as Backend."""
+        if winner > loser:
+            winner, loser = loser, winner
+        return (winner, loser) in self.played
+
+    def playedPairs(self):
+        """Returns the pairs who met, as Backend.playedPairs()."""
+        return set(pair for pair in self.played if pair[0] != pair[1])
+
+    def nextByePlayer(self):
+        """Returns the lowest id registered player who had no bye, or None."""
+        i = self.byes.find(b'\x00')
+        return self.ids[i] if i >= 0 else None
+
+    def recordMatch(self, winner, loser):
+        """Counts a match reported after the state was loaded."""
+        with self._lock:
+            self.played.add((winner, loser) if winner <= loser
+                            else (loser, winner))
+            if winner in self._index:
+                self.wins[self._index[winner]] += 1
+            if winner == loser:
+                if winner in self._index:
+                    self.byes[self._index[winner]] = 1
+            elif loser in self._index:
+                self.losses[self._index[loser]] += 1
+
+
+class Backend(object):
+    """Storage primitives used by the public tournament functions.
+
+    Tournament and player arguments are ids; name resolution, validation
+    and caching happen in tournament.py. Standings rows are
+    (id, name, wins, losses) tuples ordered by wins, then id. A match whose
+    winner and loser are the same player is a bye.
+    """
+
+    @contextmanager
+    def transaction(self, readonly=False):
+        """Groups the calls made in the block into one atomic unit.
+
+        Nested blocks join the outermost one. A readonly block does not
+        write, which lets backends with replicas serve it from one.
+        """
+        raise NotImplementedError
+
+    def onRollback(self, callback):
+        """Registers callback to run if the current transaction rolls back."""
+        raise NotImplementedError
+
+    def onCommit(self, callback):
+        """Registers callback to run once the current transaction commits."""
+        raise NotImplementedError
+
+    def close(self):
+        """Releases the resources held by the backend."""
+
+    def findTournament(self, name):
+        """Returns the id of the named tournament, or None."""
+        raise NotImplementedError
+
+    def findTournaments(self, names):
+        """Returns a dict mapping the names of existing tournaments to ids."""
+        with self.transaction():
+            ids = ((name, self.findTournament(name)) for name in names)
+            return dict((name, tid) for name, tid in ids if tid is not None)
+
+    def createTournament(self, name):
+        """Creates a tournament and returns its id."""
+        raise NotImplementedError
+
+    def tournamentVersion(self, tid):
+        """Returns the change version of a tournament, or None.
+
+        The version changes with the players and matches of the tournament.
+        Results computed from it are cached until it does; backends keeping
+        no versions return None and their results are not cached.
+        """
+        return None
+
+    def tournamentStamp(self, tid):
+        """Returns the (version, round) of a tournament."""
+        with self.transaction(readonly=True):
+            return self.tournamentVersion(tid), self.currentRound(tid)
+
+    def tournamentVersions(self, tids):
+        """Returns the change versions of several tournaments, by id."""
+        with self.transaction(readonly=True):
+            return dict((tid, self.tournamentVersion(tid)) for tid in tids)
+
+    def findPlayer(self, name):
+        """Returns the id of the named player, or None."""
+        raise NotImplementedError
+
+    def createPlayer(self, name):
+        """Creates a player and returns its id."""
+        raise NotImplementedError
+
+    def isEnrolled(self, pid, tid):
+        """Returns True if the player is registered in the tournament."""
+        raise NotImplementedError
+
+    def enroll(self, pid, tid):
+        """Registers an existing player in a tournament.
+
+        As the other writes, raises ValueError (see refuseArchived) if the
+        tournament is archived.
+        """
+        raise NotImplementedError
+
+    def enrollMany(self, names, tid):
+        """Creates missing players and registers all of them in a tournament.
+
+        Returns:
+          A list of (name, pid, enrolled) tuples, one per distinct name,
+          where enrolled is False if the player was already registered.
+        """
+        raise NotImplementedError
+
+    def countPlayers(self, tid):
+        """Returns the number of players registered in a tournament."""
+        raise NotImplementedError
+
+    def deleteMatches(self, tid=None):
+        """Deletes the matches of a tournament, or of all if tid is None."""
+        raise NotImplementedError
+
+    def deletePlayers(self, tid=None):
+        """Unregisters the players of a tournament.
+
+        If tid is None, every registration and every player is deleted.
+        """
+        raise NotImplementedError
+
+    def standings(self, tid):
+        """Returns the standings rows of a tournament."""
+        raise NotImplementedError
+
+    def standingsPage(self, tid, after, limit):
+        """Returns the standings rows following a key.
+
+        Args:
+          tid: the tournament id.
+          after: the (wins, id) of the last row already seen, or None to
+            start from the first row.
+          limit: the maximum number of rows returned, None for no limit.
+        """
+        rows = self.standings(tid)
+        if after is not None:
+            wins, pid = after
+            rows = [row for row in rows
+                    if row[2] < wins or (row[2] == wins and row[0] > pid)]
+
+        return rows if limit is None else rows[:limit]
+
+    def iterStandings(self, tid, batch_size):
+        """Yields the standings rows, reading batch_size rows at a time."""
+        for row in self.standings(tid):
+            yield row
+
+    def results(self, tid):
+        """Returns the (winner, loser) tuples of every match, byes included."""
+        raise NotImplementedError
+
+    def loadState(self, tid):
+        """Returns the TournamentState of a tournament."""
+        with self.transaction():
+            return TournamentState(tid, self.currentRound(tid),
+                                   self.standings(tid), self.results(tid),
+                                   self.tournamentVersion(tid))
+
+    def loadStates(self, tids):
+        """Returns the TournamentState of several tournaments, by id."""
+        with self.transaction():
+            return dict((tid, self.loadState(tid)) for tid in tids)
+
+    def tiebreakStandings(self, tid, tiebreaks):
+        """Returns the standings ordered by wins, then the given tiebreakers.
+
+        Args:
+          tid: the tournament id.
+          tiebreaks: names from TIEBREAKS, most significant first.
+
+        Returns:
+          (id, name, wins, losses, tiebreak values...) rows, one value per
+          name in tiebreaks, ordered by wins, each tiebreak (all
+          descending) and id.
+        """
+        columns = [4 + TIEBREAKS.index(name) for name in tiebreaks]
+        rows = [row[:4] + tuple(row[column] for column in columns)
+                for row in computeTiebreaks(self.standings(tid),
+                                            self.results(tid))]
+        rows.sort(key=lambda row: tuple(-value for value in row[2:3] +
+                                        row[4:]) + (row[0],))
+
+        return rows
+
+    def matchExists(self, winner, loser, tid):
+        """Returns True if the two players already met in the tournament."""
+        raise NotImplementedError
+
+    def recordMatch(self, winner, loser, tid):
+        """Stores a match result unless the two players already met.
+
+        The check and the write are atomic.
+
+        Returns:
+          True if the match was stored, False for a rematch.
+        """
+        raise NotImplementedError
+
+    def recordMatches(self, results, tid):
+        """Stores the (winner, loser) results that are not rematches.
+
+        Returns:
+          A list with one boolean per result, False for rematches (including
+          pairs repeated within results).
+        """
+        raise NotImplementedError
+
+    def playedPairs(self, tid):
+        """Returns the set of (id1, id2), id1 < id2, who met (byes excluded)."""
+        raise NotImplementedError
+
+    def nextByePlayer(self, tid):
+        """Returns the lowest id registered player who had no bye, or None."""
+        raise NotImplementedError
+
+    def currentRound(self, tid):
+        """Returns the number of the round last paired, 0 before the first."""
+        raise NotImplementedError
+
+    def startRound(self, tid):
+        """Moves a tournament to its next round and returns its number.
+
+        Matches recorded from then on belong to that round.
+        """
+        raise NotImplementedError
+
+    def startRounds(self, tids):
+        """Starts the next round of several tournaments.
+
+        Returns:
+          A dict mapping each tournament id to its new round number.
+        """
+        with self.transaction():
+            return dict((tid, self.startRound(tid)) for tid in tids)
+
+    def saveStandings(self, tid, round):
+        """Keeps the current standings as those of round.
+
+        Does nothing if standings were already kept for round.
+        """
+        raise NotImplementedError
+
+    def saveStandingsMany(self, rounds):
+        """Calls saveStandings for each tid: round item of rounds."""
+        with self.transaction():
+            for tid, round in rounds.items():
+                self.saveStandings(tid, round)
+
+    def recordByes(self, byes):
+        """Records a bye for each tid: player id item of byes."""
+        with self.transaction():
+            for tid, pid in byes.items():
+                self.recordMatch(pid, pid, tid)
+
+    def savePairings(self, tid, round, pairs):
+        """Keeps the (id1, id2) pairs, in order, as the pairings of round."""
+        raise NotImplementedError
+
+    def savePairingsMany(self, pairings):
+        """Calls savePairings for each tid: (round, pairs) item of pairings."""
+        with self.transaction():
+            for tid, (round, pairs) in pairings.items():
+                self.savePairings(tid, round, pairs)
+
+    def archiveTournament(self, tid):
+        """Keeps the final standings of a tournament and drops the rest.
+
+        Returns:
+          False if the tournament was already archived, True otherwise.
+        """
+        raise NotImplementedError
+
+    def archivedStandings(self, tid):
+        """Returns the standings rows kept by archiveTournament()."""
+        raise NotImplementedError
+
+    def roundStandings(self, tid, round):
+        """Returns the standings rows kept for round, [] if there are none."""
+        raise NotImplementedError
+
+    def roundPairings(self, tid, round):
+        """Returns the (id1, name1, id2, name2) pairings kept for round."""
+        raise NotImplementedError
+
+
+class _MemoryTournament(object):
+    """The state of one tournament held by MemoryBackend."""
+
+    __slots__ = ('enrolled', 'wins', 'losses', 'byes', 'played', 'matches',
+                 'round', 'round_standings', 'round_pairings', 'archived')
+
+    def __init__(self):
+        self.enrolled = set()
+        self.archived = None
+        self.resetMatches()
+
+    def resetMatches(self):
+        self.wins = defaultdict(int)
+        self.losses = defaultdict(int)
+        self.byes = set()
+        self.played = set()
+        self.matches = []
+        self.round = 0
+        self.round_standings = {}
+        self.round_pairings = {}
+
+
+class MemoryBackend(Backend):
+    """Keeps everything in Python dicts and sets; nothing is persisted.
+
+    Transactions serialize callers on a lock but are not rolled back: a
+    failing call keeps the changes it made before the failure.
+    """
+
+    def __init__(self, main_tournament=None):
+        self._lock = threading.RLock()
+        self._tournament_ids = {}
+        self._tournaments = {}
+        self._player_ids = {}
+        self._player_names = {}
+        self._last_pid = 0
+        if main_tournament is not None:
+            self.createTournament(main_tournament)
+
+    @contextmanager
+    def transaction(self, readonly=False):
+        with self._lock:
+            yield self
+
+    def onRollback(self, callback):
+        pass
+
+    def onCommit(self, callback):
+        callback()
+
+    def findTournament(self, name):
+        return self._tournament_ids.get(name)
+
+    def createTournament(self, name):
+        with self._lock:
+            tid = len(self._tournament_ids) + 1
+            self._tournament_ids[name] = tid
+            self._tournaments[tid] = _MemoryTournament()
+            return tid
+
+    def _playable(self, tid):
+        state = self._tournaments[tid]
+        if state.archived is not None:
+            refuseArchived(tid)
+        return state
+
+    def findPlayer(self, name):
+        return self._player_ids.get(name)
+
+    def createPlayer(self, name):
+        with self._lock:
+            self._last_pid += 1
+            pid = self._last_pid
+            self._player_ids[name] = pid
+            self._player_names[pid] = name
+            return pid
+
+    def isEnrolled(self, pid, tid):
+        return pid in self._tournaments[tid].enrolled
+
+    def enroll(self, pid, tid):
+        with self._lock:
+            self._playable(tid).enrolled.add(pid)
+
+    def enrollMany(self, names, tid):
+        rows = []
+        with self._lock:
+            enrolled = self._playable(tid).enrolled
+            seen = set()
+            for name in names:
+                if name in seen:
+                    continue
+                seen.add(name)
+
+                pid = self._player_ids.get(name)
+                if pid is None:
+                    pid = self.createPlayer(name)
+                fresh = pid not in enrolled
+                enrolled.add(pid)
+                rows.append((name, pid, fresh))
+
+        return rows
+
+    def countPlayers(self, tid):
+        return len(self._tournaments[tid].enrolled)
+
+    def deleteMatches(self, tid=None):
+        with self._lock:
+            tids = self._tournaments if tid is None else [tid]
+            for tid in tids:
+                self._tournaments[tid].resetMatches()
+
+    def deletePlayers(self, tid=None):
+        with self._lock:
+            if tid is not None:
+                self._tournaments[tid].enrolled.clear()
+                return
+
+            for state in self._tournaments.values():
+                if state.matches:
+                    # As the Matches foreign keys do in PostgreSQL.
+                    raise ValueError(
+                        "Cannot delete players who still have matches.")
+            for state in self._tournaments.values():
+                state.enrolled.clear()
+                if state.archived is not None:
+                    state.archived = []
+            self._player_ids.clear()
+            self._player_names.clear()
+
+    def standings(self, tid):
+        state = self._tournaments[tid]
+        wins = state.wins
+        losses = state.losses
+        names = self._player_names
+        rows = [(pid, names[pid], wins.get(pid, 0), losses.get(pid, 0))
+                for pid in state.enrolled]
+        rows.sort(key=lambda row: (-row[2], row[0]))
+
+        return rows
+
+    def results(self, tid):
+        return list(self._tournaments[tid].matches)
+
+    def matchExists(self, winner, loser, tid):
+        if winner > loser:
+            winner, loser = loser, winner
+        return (winner, loser) in self._tournaments[tid].played
+
+    def recordMatch(self, winner, loser, tid):
+        return self.recordMatches([(winner, loser)], tid)[0]
+
+    def recordMatches(self, results, tid):
+        recorded = []
+        record = recorded.append
+        with self._lock:
+            state = self._playable(tid)
+            played = state.played
+            wins = state.wins
+            losses = state.losses
+            log = state.matches.append
+            for winner, loser in results:
+                key = (winner, loser) if winner <= loser else (loser, winner)
+                if key in played:
+                    record(False)
+                    continue
+
+                played.add(key)
+                log((winner, loser))
+                wins[winner] += 1
+                if winner == loser:
+                    state.byes.add(winner)
+                else:
+                    losses[loser] += 1
+                record(True)
+
+        return recorded
+
+    def playedPairs(self, tid):
+        return set(pair for pair in self._tournaments[tid].played
+                   if pair[0] != pair[1])
+
+    def nextByePlayer(self, tid):
+        state = self._tournaments[tid]
+        candidates = state.enrolled - state.byes
+
+        return min(candidates) if candidates else None
+
+    def currentRound(self, tid):
+        return self._tournaments[tid].round
+
+    def startRound(self, tid):
+        with self._lock:
+            state = self._tournaments[tid]
+            state.round += 1
+            return state.round
+
+    def saveStandings(self, tid, round):
+        with self._lock:
+            state = self._tournaments[tid]
+            if round not in state.round_standings:
+                state.round_standings[round] = [
+                    (pid, state.wins.get(pid, 0), state.losses.get(pid, 0))
+                    for pid in state.enrolled]
+
+    def savePairings(self, tid, round, pairs):
+        with self._lock:
+            self._tournaments[tid].round_pairings[round] = list(pairs)
+
+    def archiveTournament(self, tid):
+        with self._lock:
+            state = self._tournaments[tid]
+            if state.archived is not None:
+                return False
+
+            state.archived = self.standings(tid)
+            state.enrolled.clear()
+            state.resetMatches()
+            return True
+
+    def archivedStandings(self, tid):
+        return list(self._tournaments[tid].archived or ())
+
+    def roundStandings(self, tid, round):
+        state = self._tournaments[tid]
+        names = self._player_names
+        rows = [(pid, names[pid], wins, losses)
+                for pid, wins, losses in state.round_standings.get(round, ())
+                if pid in state.enrolled]
+        rows.sort(key=lambda row: (-row[2], row[0]))
+
+        return rows
+
+    def roundPairings(self, tid, round):
+        state = self._tournaments[tid]
+        names = self._player_names
+
+        return [(id1, names[id1], id2, names[id2])
+                for id1, id2 in state.round_pairings.get(round, ())
+                if id1 in state.enrolled and id2 in state.enrolled]
+
+
+# Schema used by SQLiteBackend, the equivalent of the migrations/ scripts
+# without the PostgreSQL-only parts.
+SQLITE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS Players(
+    id INTEGER primary key,
+    name TEXT not null unique);
+CREATE TABLE IF NOT EXISTS Tournaments(
+    id INTEGER primary key,
+    name TEXT not null unique,
+    round INT not null default 0,
+    archived_at TEXT);
+CREATE TABLE IF NOT EXISTS Matches(
+    id INTEGER primary key,
+    winner INT references Players(id),
+    loser INT references Players(id),
+    tid INT references Tournaments(id),
+    round INT not null default 0);
+CREATE TABLE IF NOT EXISTS PlayersTournaments(
+    id INTEGER primary key,
+    pid INT references Players(id),
+    tid INT references Tournaments(id),
+    unique (tid, pid));
+CREATE TABLE IF NOT EXISTS RoundStandings(
+    tid INT not null,
+    round INT not null,
+    pid INT not null,
+    wins INT not null,
+    losses INT not null,
+    primary key (tid, round, pid),
+    foreign key (tid, pid) references PlayersTournaments (tid, pid)
+        on delete cascade);
+CREATE TABLE IF NOT EXISTS RoundPairings(
+    tid INT not null,
+    round INT not null,
+    board INT not null,
+    pid1 INT not null,
+    pid2 INT not null,
+    primary key (tid, round, board),
+    foreign key (tid, pid1) references PlayersTournaments (tid, pid)
+        on delete cascade,
+    foreign key (tid, pid2) references PlayersTournaments (tid, pid)
+        on delete cascade);
+CREATE TABLE IF NOT EXISTS ArchivedStandings(
+    tid INT not null references Tournaments(id),
+    pid INT not null references Players(id),
+    wins INT not null,
+    losses INT not null,
+    primary key (tid, pid));
+CREATE UNIQUE INDEX IF NOT EXISTS matches_tid_pair_key
+    ON Matches (tid, min(winner, loser), max(winner, loser));
+CREATE INDEX IF NOT EXISTS matches_tid_winner_idx ON Matches (tid, winner);
+CREATE INDEX IF NOT EXISTS matches_tid_loser_idx ON Matches (tid, loser);
+"""
+
+
+class SQLiteBackend(Backend):
+    """Stores tournaments in an SQLite database (in memory by default).
+
+    One connection is shared by all threads, which take turns on a lock.
+    """
+
+    def __init__(self, path=':memory:', main_tournament=None):
+        self._db = sqlite3.connect(path, check_same_thread=False,
+                                   isolation_level=None)
+        self._db.execute("PRAGMA foreign_keys = ON")
+        self._db.executescript(SQLITE_SCHEMA)
+        self._lock = threading.RLock()
+        self._depth = 0
+        self._on_rollback = []
+        self._on_commit = []
+        if main_tournament is not None and \
+                self.findTournament(main_tournament) is None:
+            self.createTournament(main_tournament)
+
+    @contextmanager
+    def transaction(self, readonly=False):
+        with self._lock:
+            if self._depth:
+                self._depth += 1
+                try:
+                    yield self
+                finally:
+                    self._depth -= 1
+                return
+
+            self._depth = 1
+            self._db.execute("BEGIN")
+            try:
+                yield self
+                self._db.execute("COMMIT")
+            except Exception:
+                self._db.execute("ROLLBACK")
+                for callback in self._on_rollback:
+                    callback()
+                raise
+            else:
+                for callback in self._on_commit:
+                    callback()
+            finally:
+                self._depth = 0
+                self._on_rollback = []
+                self._on_commit = []
+
+    def onRollback(self, callback):
+        if self._depth:
+            self._on_rollback.append(callback)
+
+    def onCommit(self, callback):
+        if self._depth:
+            self._on_commit.append(callback)
+        else:
+            callback()
+
+    def close(self):
+        self._db.close()
+
+    def _value(self, query, parameter=()):
+        with self.transaction():
+            row = self._db.execute(query, parameter).fetchone()
+        return row[0] if row is not None else None
+
+    def findTournament(self, name):
+        return self._value("SELECT id FROM Tournaments WHERE name = ?",
+                           (name,))
+
+    def createTournament(self, name):
+        with self.transaction():
+            return self._db.execute(
+                "INSERT INTO Tournaments (name) VALUES (?)",
+                (name,)).lastrowid
+
+    def _checkPlayable(self, tid):
+        if self._value("SELECT archived_at IS NOT NULL FROM Tournaments " +
+                       "WHERE id = ?", (tid,)):
+            refuseArchived(tid)
+
+    def findPlayer(self, name):
+        return self._value("SELECT id FROM Players WHERE name = ?", (name,))
+
+    def createPlayer(self, name):
+        with self.transaction():
+            return self._db.execute(
+                "INSERT INTO Players (name) VALUES (?)", (name,)).lastrowid
+
+    def isEnrolled(self, pid, tid):
+        return self._value("SELECT count(*) FROM PlayersTournaments " +
+                           "WHERE pid = ? AND tid = ?", (pid, tid)) > 0
+
+    def enroll(self, pid, tid):
+        with self.transaction():
+            self._checkPlayable(tid)
+            self._db.execute(
+                "INSERT INTO PlayersTournaments (pid, tid) VALUES (?, ?)",
+                (pid, tid))
+
+    def enrollMany(self, names, tid):
+        rows = []
+        with self.transaction():
+            self._checkPlayable(tid)
+            seen = set()
+            for name in names:
+                if name in seen:
+                    continue
+                seen.add(name)
+
+                self._db.execute(
+                    "INSERT OR IGNORE INTO Players (name) VALUES (?)",
+                    (name,))
+                pid = self.findPlayer(name)
+                cursor = self._db.execute(
+                    "INSERT OR IGNORE INTO PlayersTournaments (pid, tid) " +
+                    "VALUES (?, ?)", (pid, tid))
+                rows.append((name, pid, cursor.rowcount == 1))
+
+        return rows
+
+    def countPlayers(self, tid):
+        return self._value(
+            "SELECT count(*) FROM PlayersTournaments WHERE tid = ?", (tid,))
+
+    def deleteMatches(self, tid=None):
+        with self.transaction():
+            if tid is None:
+                self._db.execute("DELETE FROM Matches")
+                self._db.execute("DELETE FROM RoundStandings")
+                self._db.execute("DELETE FROM RoundPairings")
+                self._db.execute("UPDATE Tournaments SET round = 0")
+            else:
+                for table in ('Matches', 'RoundStandings', 'RoundPairings'):
+                    self._db.execute(
+                        "DELETE FROM {table} WHERE tid = ?".format(
+                            table=table), (tid,))
+                self._db.execute(
+                    "UPDATE Tournaments SET round = 0 WHERE id = ?", (tid,))
+
+    def deletePlayers(self, tid=None):
+        with self.transaction():
+            if tid is None:
+                self._db.execute("DELETE FROM PlayersTournaments")
+                self._db.execute("DELETE FROM ArchivedStandings")
+                self._db.execute("DELETE FROM Players")
+            else:
+                self._db.execute(
+                    "DELETE FROM PlayersTournaments WHERE tid = ?", (tid,))
+
+    def standings(self, tid):
+        query = "SELECT p.id, p.name, " +\
+                "(SELECT count(*) FROM Matches AS m " +\
+                "WHERE m.tid = pt.tid AND m.winner = p.id) AS wins, " +\
+                "(SELECT count(*) FROM Matches AS m " +\
+                "WHERE m.tid = pt.tid AND m.loser = p.id " +\
+                "AND m.winner <> m.loser) AS losses " +\
+                "FROM PlayersTournaments AS pt " +\
+                "JOIN Players AS p ON p.id = pt.pid " +\
+                "WHERE pt.tid = ? ORDER BY wins DESC, p.id ASC"
+        with self.transaction():
+            return [tuple(row) for row in self._db.execute(query, (tid,))]
+
+    def results(self, tid):
+        query = "SELECT winner, loser FROM Matches WHERE tid = ? ORDER BY id"
+        with self.transaction():
+            return [tuple(row) for row in self._db.execute(query, (tid,))]
+
+    def matchExists(self, winner, loser, tid):
+        query = "SELECT count(*) FROM Matches WHERE tid = ? " +\
+                "AND min(winner, loser) = min(?, ?) " +\
+                "AND max(winner, loser) = max(?, ?)"
+        return self._value(query, (tid, winner, loser, winner, loser)) > 0
+
+    def recordMatch(self, winner, loser, tid):
+        # matches_tid_pair_key makes rematches no-ops.
+        with self.transaction():
+            self._checkPlayable(tid)
+            cursor = self._db.execute(
+                "INSERT OR IGNORE INTO Matches (winner, loser, tid, round) " +
+                "SELECT ?, ?, id, round FROM Tournaments WHERE id = ?",
+                (winner, loser, tid))
+
+            return cursor.rowcount == 1
+
+    def recordMatches(self, results, tid):
+        with self.transaction():
+            return [self.recordMatch(winner, loser, tid)
+                    for winner, loser in results]
+
+    def playedPairs(self, tid):
+        query = "SELECT min(winner, loser), max(winner, loser) " +\
+                "FROM Matches WHERE tid = ? AND winner <> loser"
+        with self.transaction():
+            return set(tuple(row) for row in self._db.execute(query, (tid,)))
+
+    def nextByePlayer(self, tid):
+        query = "SELECT pid FROM PlayersTournaments AS pt WHERE tid = ? " +\
+                "AND NOT EXISTS (SELECT 1 FROM Matches AS m " +\
+                "WHERE m.tid = pt.tid AND m.winner = pt.pid " +\
+                "AND m.loser = pt.pid) ORDER BY pid LIMIT 1"
+        return self._value(query, (tid,))
+
+    def currentRound(self, tid):
+        return self._value("SELECT round FROM Tournaments WHERE id = ?",
+                           (tid,))
+
+    def startRound(self, tid):
+        with self.transaction():
+            self._db.execute(
+                "UPDATE Tournaments SET round = round + 1 WHERE id = ?",
+                (tid,))
+            return self.currentRound(tid)
+
+    def saveStandings(self, tid, round):
+        with self.transaction():
+            self._db.execute(
+                "INSERT OR IGNORE INTO RoundStandings " +
+                "(tid, round, pid, wins, losses) " +
+                "SELECT tid, ?, id, wins, losses FROM (" +
+                "SELECT pt.tid, p.id, " +
+                "(SELECT count(*) FROM Matches AS m " +
+                "WHERE m.tid = pt.tid AND m.winner = p.id) AS wins, " +
+                "(SELECT count(*) FROM Matches AS m " +
+                "WHERE m.tid = pt.tid AND m.loser = p.id " +
+                "AND m.winner <> m.loser) AS losses " +
+                "FROM PlayersTournaments AS pt " +
+                "JOIN Players AS p ON p.id = pt.pid WHERE pt.tid = ?)",
+                (round, tid))
+
+    def savePairings(self, tid, round, pairs):
+        with self.transaction():
+            self._db.executemany(
+                "INSERT INTO RoundPairings (tid, round, board, pid1, pid2) " +
+                "VALUES (?, ?, ?, ?, ?)",
+                [(tid, round, board, id1, id2)
+                 for board, (id1, id2) in enumerate(pairs, 1)])
+
+    def archiveTournament(self, tid):
+        with self.transaction():
+            cursor = self._db.execute(
+                "UPDATE Tournaments SET archived_at = datetime('now') " +
+                "WHERE id = ? AND archived_at IS NULL", (tid,))
+            if cursor.rowcount == 0:
+                return False
+
+            self._db.executemany(
+                "INSERT INTO ArchivedStandings (tid, pid, wins, losses) " +
+                "VALUES (?, ?, ?, ?)",
+                [(tid, row[0], row[2], row[3]) for row in self.standings(tid)])
+            for table in ('RoundStandings', 'RoundPairings', 'Matches',
+                          'PlayersTournaments'):
+                self._db.execute(
+                    "DELETE FROM {table} WHERE tid = ?".format(table=table),
+                    (tid,))
+            return True
+
+    def archivedStandings(self, tid):
+        query = "SELECT p.id, p.name, s.wins, s.losses " +\
+                "FROM ArchivedStandings AS s " +\
+                "JOIN Players AS p ON p.id = s.pid " +\
+                "WHERE s.tid = ? ORDER BY s.wins DESC, s.pid ASC"
+        with self.transaction():
+            return [tuple(row) for row in self._db.execute(query, (tid,))]
+
+    def roundStandings(self, tid, round):
+        query = "SELECT p.id, p.name, s.wins, s.losses " +\
+                "FROM RoundStandings AS s " +\
+                "JOIN Players AS p ON p.id = s.pid " +\
+                "WHERE s.tid = ? AND s.round = ? " +\
+                "ORDER BY s.wins DESC, s.pid ASC"
+        with self.transaction():
+            return [tuple(row)
+                    for row in self._db.execute(query, (tid, round))]
+
+    def roundPairings(self, tid, round):
+        query = "SELECT r.pid1, p1.name, r.pid2, p2.name " +\
+                "FROM RoundPairings AS r " +\
+                "JOIN Players AS p1 ON p1.id = r.pid1 " +\
+                "JOIN Players AS p2 ON p2.id = r.pid2 " +\
+                "WHERE r.tid = ? AND r.round = ? ORDER BY r.board"
+        with self.transaction():
+            return [tuple(row)
+                    for row in self._db.execute(query, (tid, round))]
@@ -0,0 +1,253 @@
+#!/usr/bin/env python
+#
+# instrumentation.py -- opt-in per-call metrics for tournament.py
+#
+# Every public tournament.py function is wrapped with instrumented(). While
+# at least one sink is registered with addMetricsSink(), each top-level call
+# produces an OperationMetrics record with its wall time, the SQL statements
+# it ran, the rows it fetched, the connections it opened and the
+# transactions it committed or rolled back. Calls made from inside another
+# instrumented call are counted in the outer call's record.
+#
+
+import functools
+import threading
+import time
+
+import psycopg2.extensions
+
+# Upper bounds, in milliseconds, of the latency histogram buckets kept by
+# MetricsAggregator. Slower calls fall in a final overflow bucket.
+HISTOGRAM_BUCKETS_MS = (0.5, 1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 5000)
+
+_sinks = []
+_sinks_lock = threading.Lock()
+_local = threading.local()
+
+
+class OperationMetrics(object):
+    """What one call to a public tournament function cost."""
+
+    __slots__ = ('name', 'wall_time', 'statements', 'rows', 'connections',
+                 'checkouts', 'transactions', 'error')
+
+    def __init__(self, name):
+        self.name = name
+        self.wall_time = 0.0
+        self.statements = 0
+        self.rows = 0
+        self.connections = 0
+        self.checkouts = 0
+        self.transactions = 0
+        self.error = None
+
+    @property
+    def round_trips(self):
+        """Statements plus commits and rollbacks sent to the server."""
+        return self.statements + self.transactions
+
+    def asDict(self):
+        """Returns the record as a plain dict."""
+        values = dict((name, getattr(self, name)) for name in self.__slots__)
+        values['round_trips'] = self.round_trips
+        return values
+
+
+def addMetricsSink(sink):
+    """Registers a callable receiving an OperationMetrics per call.
+
+    Sinks run synchronously in the calling thread after the call returns
+    (or raises), so they should be quick and must not raise.
+    """
+    with _sinks_lock:
+        _sinks.append(sink)
+
+
+def removeMetricsSink(sink):
+    """Unregisters a sink added with addMetricsSink()."""
+    with _sinks_lock:
+        _sinks.remove(sink)
+
+
+def current():
+    """Returns the record of the call in progress on this thread, if any."""
+    return getattr(_local, 'metrics', None)
+
+
+def countStatement(rows=0):
+    """Adds a statement (and the rows it fetched) to the current record."""
+    metrics = current()
+    if metrics is not None:
+        metrics.statements += 1
+        metrics.rows += rows
+
+
+def countRows(rows):
+    """Adds fetched rows to the current record."""
+    metrics = current()
+    if metrics is not None:
+        metrics.rows += rows
+
+
+def countConnection():
+    """Adds a newly opened database connection to the current record."""
+    metrics = current()
+    if metrics is not None:
+        metrics.connections += 1
+
+
+def countCheckout():
+    """Adds a pool checkout to the current record."""
+    metrics = current()
+    if metrics is not None:
+        metrics.checkouts += 1
+
+
+def countTransaction():
+    """Adds a commit or rollback to the current record."""
+    metrics = current()
+    if metrics is not None:
+        metrics.transactions += 1
+
+
+def instrumented(function):
+    """Decorates a public function so its calls are measured.
+
+    Costs one list check per call while no sink is registered.
+    """
+    name = function.__name__
+
+    @functools.wraps(function)
+    def wrapper(*args, **kwargs):
+        if not _sinks or current() is not None:
+            return function(*args, **kwargs)
+
+        metrics = OperationMetrics(name)
+        _local.metrics = metrics
+        start = time.time()
+        try:
+            return function(*args, **kwargs)
+        except Exception as error:
+            metrics.error = type(error).__name__
+            raise
+        finally:
+            metrics.wall_time = time.time() - start
+            _local.metrics = None
+            for sink in list(_sinks):
+                sink(metrics)
+
+    return wrapper
+
+
+class InstrumentedCursor(psycopg2.extensions.cursor):
+    """A cursor reporting statements and fetched rows to the current record."""
+
+    def execute(self, query, vars=None):
+        countStatement()
+        return super(InstrumentedCursor, self).execute(query, vars)
+
+    def executemany(self, query, vars_list):
+        countStatement()
+        return super(InstrumentedCursor, self).executemany(query, vars_list)
+
+    def copy_expert(self, sql, file, size=8192):
+        countStatement()
+        return super(InstrumentedCursor, self).copy_expert(sql, file, size)
+
+    def fetchone(self):
+        row = super(InstrumentedCursor, self).fetchone()
+        if row is not None:
+            countRows(1)
+        return row
+
+    def fetchmany(self, size=None):
+        if size is None:
+            rows = super(InstrumentedCursor, self).fetchmany()
+        else:
+            rows = super(InstrumentedCursor, self).fetchmany(size)
+        countRows(len(rows))
+        return rows
+
+    def fetchall(self):
+        rows = super(InstrumentedCursor, self).fetchall()
+        countRows(len(rows))
+        return rows
+
+
+class MetricsAggregator(object):
+    """An in-memory sink keeping totals and latency histograms per function.
+
+    Register it with addMetricsSink(aggregator).
+    """
+
+    def __init__(self, buckets_ms=HISTOGRAM_BUCKETS_MS):
+        self.buckets_ms = tuple(buckets_ms)
+        self._lock = threading.Lock()
+        self._operations = {}
+
+    def __call__(self, metrics):
+        with self._lock:
+            totals = self._operations.get(metrics.name)
+            if totals is None:
+                totals = {
+                    'calls': 0,
+                    'errors': 0,
+                    'wall_time': 0.0,
+                    'max_wall_time': 0.0,
+                    'statements': 0,
+                    'rows': 0,
+                    'connections': 0,
+                    'checkouts': 0,
+                    'transactions': 0,
+                    'histogram': [0] * (len(self.buckets_ms) + 1),
+                }
+                self._operations[metrics.name] = totals
+
+            totals['calls'] += 1
+            if metrics.error is not None:
+                totals['errors'] += 1
+            totals['wall_time'] += metrics.wall_time
+            totals['max_wall_time'] = max(totals['max_wall_time'],
+                                          metrics.wall_time)
+            for field in ('statements', 'rows', 'connections', 'checkouts',
+                          'transactions'):
+                totals[field] += getattr(metrics, field)
+
+            elapsed_ms = metrics.wall_time * 1000
+            bucket = 0
+            while bucket < len(self.buckets_ms) and \
+                    elapsed_ms > self.buckets_ms[bucket]:
+                bucket += 1
+            totals['histogram'][bucket] += 1
+
+    def reset(self):
+        """Forgets everything recorded so far."""
+        with self._lock:
+            self._operations.clear()
+
+    def dump(self):
+        """Returns the aggregated metrics.
+
+        Returns:
+          A dict keyed by function name. Each value holds the totals (calls,
+          errors, wall_time, max_wall_time, statements, rows, connections,
+          checkouts, transactions), their per-call means and a histogram
+          list of {'le_ms': upper bound or None, 'count': calls} buckets.
+        """
+        report = {}
+        with self._lock:
+            for name, totals in self._operations.items():
+                entry = dict((key, value) for key, value in totals.items()
+                             if key != 'histogram')
+                calls = float(totals['calls'])
+                entry['mean_wall_time'] = totals['wall_time'] / calls
+                entry['statements_per_call'] = totals['statements'] / calls
+                entry['round_trips_per_call'] = \
+                    (totals['statements'] + totals['transactions']) / calls
+                bounds = list(self.buckets_ms) + [None]
+                entry['histogram'] = [
+                    {'le_ms': bound, 'count': count}
+                    for bound, count in zip(bounds, totals['histogram'])]
+                report[name] = entry
+
+        return report
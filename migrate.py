@@ -0,0 +1,108 @@
+#!/usr/bin/env python
+#
+# migrate.py -- applies the schema migrations to a live tournament database
+#
+# Usage:
+#   python migrate.py [database name]
+#
+
+import os
+import re
+import sys
+
+import psycopg2
+
+from tournament import DATABASE_NAME
+
+MIGRATIONS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                              'migrations')
+
+# Arbitrary key for the advisory lock held while migrating, so that two
+# runners do not apply the same migration concurrently.
+MIGRATION_LOCK_KEY = 7305
+
+
+def listMigrations(directory=MIGRATIONS_DIR):
+    """Lists the migration scripts found in a directory.
+
+    Args:
+      directory: folder holding files named NNN_description.sql
+
+    Returns:
+      A list of (version, path) tuples sorted by version.
+    """
+    migrations = []
+    for filename in os.listdir(directory):
+        match = re.match(r'^(\d+)_.*\.sql$', filename)
+        if match:
+            migrations.append((int(match.group(1)),
+                               os.path.join(directory, filename)))
+
+    migrations.sort()
+
+    return migrations
+
+
+def schemaVersion(cursor):
+    """Returns the highest applied migration version, 0 if there is none."""
+    cursor.execute("SELECT to_regclass('schemaversion') IS NOT NULL")
+    if not cursor.fetchone()[0]:
+        return 0
+
+    cursor.execute("SELECT COALESCE(max(version), 0) FROM SchemaVersion")
+
+    return cursor.fetchone()[0]
+
+
+def migrate(database_name=DATABASE_NAME, directory=MIGRATIONS_DIR):
+    """Applies every pending migration, each in its own transaction.
+
+    Args:
+      database_name: name of the database to upgrade.
+      directory: folder holding the migration scripts.
+
+    Returns:
+      The list of versions that were applied.
+    """
+    db = psycopg2.connect("dbname={}".format(database_name))
+    cursor = db.cursor()
+    applied = []
+
+    try:
+        for version, path in listMigrations(directory):
+            cursor.execute("SELECT pg_advisory_xact_lock(%s)",
+                           (MIGRATION_LOCK_KEY,))
+            if version <= schemaVersion(cursor):
+                db.rollback()
+                continue
+
+            with open(path) as script:
+                cursor.execute(script.read())
+
+            if schemaVersion(cursor) != version:
+                raise ValueError(
+                    "Migration {path} did not record version {version}."
+                    .format(path=path, version=version))
+
+            db.commit()
+            applied.append(version)
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
+    return applied
+
+
+if __name__ == '__main__':
+    if len(sys.argv) > 1:
+        versions = migrate(sys.argv[1])
+    else:
+        versions = migrate()
+
+    if versions:
+        print("Applied migrations: {}".format(
+            ", ".join(str(version) for version in versions)))
+    else:
+        print("Database is up to date.")
@@ -0,0 +1,69 @@
+-- Migration 001: initial schema.
+--
+-- The tables, views and function of the original tournament.sql. Every
+-- statement is idempotent so the migration can be recorded against a
+-- database that was created by the original script.
+
+CREATE TABLE IF NOT EXISTS SchemaVersion(
+	version INT primary key,
+	description TEXT not null,
+	applied_at TIMESTAMPTZ not null default now());
+
+-- Create "Players" table
+CREATE TABLE IF NOT EXISTS Players(
+	id SERIAL primary key,
+	name TEXT not null);
+
+-- Create "Tournaments" table
+CREATE TABLE IF NOT EXISTS Tournaments(
+	id SERIAL primary key,
+	name TEXT not null);
+
+-- Insert "Main" Tournament
+INSERT INTO Tournaments (name)
+	SELECT 'MAIN_TOURNAMENT'
+	WHERE NOT EXISTS (SELECT 1 FROM Tournaments WHERE name = 'MAIN_TOURNAMENT');
+
+-- Create "Matches" table
+CREATE TABLE IF NOT EXISTS Matches(
+	id SERIAL primary key,
+	winner INT references players(id),
+	loser INT references players(id),
+	tid INT references tournaments(id));
+
+-- Create "PlayersTournaments" table
+CREATE TABLE IF NOT EXISTS PlayersTournaments(
+	id SERIAL primary key,
+	pid INT references players(id),
+	tid INT references tournaments(id));
+
+-- Create Views
+CREATE OR REPLACE VIEW PlayersWithoutBye as select pid, tid from PlayersTournaments except select winner, tid from Matches where loser = winner order by pid asc;
+
+CREATE OR REPLACE VIEW PlayerWins as select winner as pid, count(winner) as wins, tid from Matches group by winner, tid;
+CREATE OR REPLACE VIEW PlayerLosses as select loser as pid, count(loser) as losses, tid from Matches where loser != winner group by loser, tid;
+
+-- Create Function
+CREATE OR REPLACE FUNCTION PlayerStandings (tournament_id INT) 
+	RETURNS TABLE (
+ 		id INT,
+ 		name TEXT,
+ 		wins BIGINT,
+ 		losses BIGINT
+	) AS $$
+	BEGIN
+ 		RETURN QUERY 
+ 			SELECT 
+	 			p.id, p.name, COALESCE(pwins.wins,0) AS wins, COALESCE(plosses.losses, 0) AS losses 
+	 			FROM Players AS p
+	            RIGHT JOIN (SELECT pid, tid FROM PlayersTournaments WHERE tid = tournament_id) AS pt ON p.id = pt.pid
+	            LEFT JOIN (SELECT * FROM PlayerWins WHERE tid = tournament_id) AS pwins ON p.id = pwins.pid
+	            LEFT JOIN (SELECT * FROM PlayerLosses WHERE tid = tournament_id) AS plosses ON p.id = plosses.pid
+	            ORDER BY wins DESC, id ASC;
+	END;
+	$$ 
+	LANGUAGE 'plpgsql';
+
+INSERT INTO SchemaVersion (version, description)
+	VALUES (1, 'initial schema')
+	ON CONFLICT (version) DO NOTHING;
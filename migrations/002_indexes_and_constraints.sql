@@ -0,0 +1,58 @@
+-- Migration 002: indexes and uniqueness constraints.
+--
+-- Player and tournament names become unique (the application already
+-- treats them as keys), a player can be enrolled in a tournament only
+-- once, and the Matches lookups made by matchExists, reportMatches and the
+-- PlayerWins / PlayerLosses / PlayersWithoutBye views get indexes.
+
+-- Fold duplicate players into the lowest id before making names unique.
+UPDATE Matches AS m SET winner = d.keep
+	FROM (SELECT id, min(id) OVER (PARTITION BY name) AS keep FROM Players) AS d
+	WHERE m.winner = d.id AND d.id <> d.keep;
+UPDATE Matches AS m SET loser = d.keep
+	FROM (SELECT id, min(id) OVER (PARTITION BY name) AS keep FROM Players) AS d
+	WHERE m.loser = d.id AND d.id <> d.keep;
+UPDATE PlayersTournaments AS pt SET pid = d.keep
+	FROM (SELECT id, min(id) OVER (PARTITION BY name) AS keep FROM Players) AS d
+	WHERE pt.pid = d.id AND d.id <> d.keep;
+DELETE FROM Players AS p
+	USING (SELECT id, min(id) OVER (PARTITION BY name) AS keep FROM Players) AS d
+	WHERE p.id = d.id AND d.id <> d.keep;
+
+-- Same for tournaments.
+UPDATE Matches AS m SET tid = d.keep
+	FROM (SELECT id, min(id) OVER (PARTITION BY name) AS keep FROM Tournaments) AS d
+	WHERE m.tid = d.id AND d.id <> d.keep;
+UPDATE PlayersTournaments AS pt SET tid = d.keep
+	FROM (SELECT id, min(id) OVER (PARTITION BY name) AS keep FROM Tournaments) AS d
+	WHERE pt.tid = d.id AND d.id <> d.keep;
+DELETE FROM Tournaments AS t
+	USING (SELECT id, min(id) OVER (PARTITION BY name) AS keep FROM Tournaments) AS d
+	WHERE t.id = d.id AND d.id <> d.keep;
+
+-- Drop repeated enrollments, keeping the first one.
+DELETE FROM PlayersTournaments AS pt
+	USING PlayersTournaments AS first
+	WHERE pt.tid = first.tid AND pt.pid = first.pid AND pt.id > first.id;
+
+ALTER TABLE Players ADD CONSTRAINT players_name_key UNIQUE (name);
+ALTER TABLE Tournaments ADD CONSTRAINT tournaments_name_key UNIQUE (name);
+ALTER TABLE PlayersTournaments ADD CONSTRAINT playerstournaments_tid_pid_key UNIQUE (tid, pid);
+
+-- Deleting players checks the foreign keys by pid.
+CREATE INDEX playerstournaments_pid_idx ON PlayersTournaments (pid);
+
+-- matchExists and the PlayerWins group-by.
+CREATE INDEX matches_tid_winner_loser_idx ON Matches (tid, winner, loser);
+-- The PlayerLosses group-by and foreign key checks on loser.
+CREATE INDEX matches_tid_loser_idx ON Matches (tid, loser);
+-- Order-independent pair lookups made by reportMatches.
+CREATE INDEX matches_tid_pair_idx ON Matches (tid, least(winner, loser), greatest(winner, loser));
+-- Byes, as read by PlayersWithoutBye.
+CREATE INDEX matches_tid_bye_idx ON Matches (tid, winner) WHERE winner = loser;
+-- Foreign key checks when deleting players.
+CREATE INDEX matches_winner_idx ON Matches (winner);
+CREATE INDEX matches_loser_idx ON Matches (loser);
+
+INSERT INTO SchemaVersion (version, description)
+	VALUES (2, 'indexes and uniqueness constraints');
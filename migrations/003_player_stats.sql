@@ -0,0 +1,166 @@
+-- Migration 003: incrementally maintained standings.
+--
+-- PlayerStats holds one row per enrolled player and tournament with the
+-- player's wins, losses and whether the player had a bye. Triggers on
+-- Matches and PlayersTournaments keep it current, so PlayerStandings and
+-- PlayersWithoutBye read the rows of one tournament instead of grouping
+-- every match ever played.
+
+CREATE TABLE PlayerStats(
+	tid INT not null,
+	pid INT not null,
+	wins INT not null default 0,
+	losses INT not null default 0,
+	has_had_bye BOOLEAN not null default false,
+	primary key (tid, pid),
+	foreign key (tid, pid) references PlayersTournaments (tid, pid)
+		on delete cascade on update cascade);
+
+-- Standings order within a tournament.
+CREATE INDEX playerstats_tid_wins_idx ON PlayerStats (tid, wins DESC, pid);
+-- Bye candidates.
+CREATE INDEX playerstats_tid_without_bye_idx ON PlayerStats (tid, pid) WHERE NOT has_had_bye;
+
+-- Recomputes the stats of the given (tid, pid) pairs from Matches.
+CREATE OR REPLACE FUNCTION RefreshPlayerStats (tids INT[], pids INT[])
+	RETURNS VOID AS $$
+	BEGIN
+		UPDATE PlayerStats AS s SET
+			wins = (SELECT count(*) FROM Matches AS m
+				WHERE m.tid = s.tid AND m.winner = s.pid),
+			losses = (SELECT count(*) FROM Matches AS m
+				WHERE m.tid = s.tid AND m.loser = s.pid AND m.winner <> m.loser),
+			has_had_bye = EXISTS (SELECT 1 FROM Matches AS m
+				WHERE m.tid = s.tid AND m.winner = s.pid AND m.loser = s.pid)
+			FROM (SELECT DISTINCT tid, pid FROM unnest(tids, pids) AS a(tid, pid)) AS a
+			WHERE s.tid = a.tid AND s.pid = a.pid;
+	END;
+	$$
+	LANGUAGE 'plpgsql';
+
+-- New matches: add each result to the winner's and loser's counters.
+CREATE OR REPLACE FUNCTION PlayerStatsMatchesInserted ()
+	RETURNS TRIGGER AS $$
+	BEGIN
+		UPDATE PlayerStats AS s SET
+			wins = s.wins + d.wins,
+			losses = s.losses + d.losses,
+			has_had_bye = s.has_had_bye OR d.bye
+			FROM (SELECT tid, pid, sum(w) AS wins, sum(l) AS losses, bool_or(b) AS bye
+				FROM (SELECT tid, winner AS pid, 1 AS w, 0 AS l, winner = loser AS b
+						FROM new_matches
+					UNION ALL
+					SELECT tid, loser, 0, 1, false
+						FROM new_matches WHERE winner <> loser) AS r
+				GROUP BY tid, pid) AS d
+			WHERE s.tid = d.tid AND s.pid = d.pid;
+		RETURN NULL;
+	END;
+	$$
+	LANGUAGE 'plpgsql';
+
+-- Deleted matches: recompute the players involved.
+CREATE OR REPLACE FUNCTION PlayerStatsMatchesDeleted ()
+	RETURNS TRIGGER AS $$
+	BEGIN
+		PERFORM RefreshPlayerStats(
+			array(SELECT tid FROM old_matches UNION ALL SELECT tid FROM old_matches),
+			array(SELECT winner FROM old_matches UNION ALL SELECT loser FROM old_matches));
+		RETURN NULL;
+	END;
+	$$
+	LANGUAGE 'plpgsql';
+
+-- Updated matches: recompute the players before and after the change.
+CREATE OR REPLACE FUNCTION PlayerStatsMatchesUpdated ()
+	RETURNS TRIGGER AS $$
+	BEGIN
+		PERFORM RefreshPlayerStats(
+			array(SELECT tid FROM old_matches UNION ALL SELECT tid FROM old_matches
+				UNION ALL SELECT tid FROM new_matches UNION ALL SELECT tid FROM new_matches),
+			array(SELECT winner FROM old_matches UNION ALL SELECT loser FROM old_matches
+				UNION ALL SELECT winner FROM new_matches UNION ALL SELECT loser FROM new_matches));
+		RETURN NULL;
+	END;
+	$$
+	LANGUAGE 'plpgsql';
+
+-- New enrollments: start from the matches already played, if any.
+CREATE OR REPLACE FUNCTION PlayerStatsPlayersInserted ()
+	RETURNS TRIGGER AS $$
+	BEGIN
+		INSERT INTO PlayerStats (tid, pid)
+			SELECT tid, pid FROM new_players;
+		PERFORM RefreshPlayerStats(
+			array(SELECT n.tid FROM new_players AS n
+				WHERE EXISTS (SELECT 1 FROM Matches AS m WHERE m.tid = n.tid)),
+			array(SELECT n.pid FROM new_players AS n
+				WHERE EXISTS (SELECT 1 FROM Matches AS m WHERE m.tid = n.tid)));
+		RETURN NULL;
+	END;
+	$$
+	LANGUAGE 'plpgsql';
+
+-- Updated enrollments: the foreign key moved the rows, recompute them.
+CREATE OR REPLACE FUNCTION PlayerStatsPlayersUpdated ()
+	RETURNS TRIGGER AS $$
+	BEGIN
+		PERFORM RefreshPlayerStats(
+			array(SELECT tid FROM new_players),
+			array(SELECT pid FROM new_players));
+		RETURN NULL;
+	END;
+	$$
+	LANGUAGE 'plpgsql';
+
+CREATE TRIGGER matches_player_stats_insert AFTER INSERT ON Matches
+	REFERENCING NEW TABLE AS new_matches
+	FOR EACH STATEMENT EXECUTE FUNCTION PlayerStatsMatchesInserted();
+CREATE TRIGGER matches_player_stats_delete AFTER DELETE ON Matches
+	REFERENCING OLD TABLE AS old_matches
+	FOR EACH STATEMENT EXECUTE FUNCTION PlayerStatsMatchesDeleted();
+CREATE TRIGGER matches_player_stats_update AFTER UPDATE ON Matches
+	REFERENCING OLD TABLE AS old_matches NEW TABLE AS new_matches
+	FOR EACH STATEMENT EXECUTE FUNCTION PlayerStatsMatchesUpdated();
+CREATE TRIGGER playerstournaments_player_stats_insert AFTER INSERT ON PlayersTournaments
+	REFERENCING NEW TABLE AS new_players
+	FOR EACH STATEMENT EXECUTE FUNCTION PlayerStatsPlayersInserted();
+CREATE TRIGGER playerstournaments_player_stats_update AFTER UPDATE ON PlayersTournaments
+	REFERENCING NEW TABLE AS new_players
+	FOR EACH STATEMENT EXECUTE FUNCTION PlayerStatsPlayersUpdated();
+
+-- Backfill from the existing enrollments and matches.
+INSERT INTO PlayerStats (tid, pid, wins, losses, has_had_bye)
+	SELECT pt.tid, pt.pid,
+		(SELECT count(*) FROM Matches AS m
+			WHERE m.tid = pt.tid AND m.winner = pt.pid),
+		(SELECT count(*) FROM Matches AS m
+			WHERE m.tid = pt.tid AND m.loser = pt.pid AND m.winner <> m.loser),
+		EXISTS (SELECT 1 FROM Matches AS m
+			WHERE m.tid = pt.tid AND m.winner = pt.pid AND m.loser = pt.pid)
+	FROM PlayersTournaments AS pt;
+
+-- Read standings and bye candidates from PlayerStats.
+CREATE OR REPLACE VIEW PlayersWithoutBye as select pid, tid from PlayerStats where not has_had_bye order by pid asc;
+
+CREATE OR REPLACE FUNCTION PlayerStandings (tournament_id INT) 
+	RETURNS TABLE (
+ 		id INT,
+ 		name TEXT,
+ 		wins BIGINT,
+ 		losses BIGINT
+	) AS $$
+	BEGIN
+ 		RETURN QUERY 
+ 			SELECT 
+	 			p.id, p.name, s.wins::BIGINT AS wins, s.losses::BIGINT AS losses 
+	 			FROM PlayerStats AS s
+	            JOIN Players AS p ON p.id = s.pid
+	            WHERE s.tid = tournament_id
+	            ORDER BY s.wins DESC, s.pid ASC;
+	END;
+	$$ 
+	LANGUAGE 'plpgsql';
+
+INSERT INTO SchemaVersion (version, description)
+	VALUES (3, 'incrementally maintained player stats');
@@ -0,0 +1,53 @@
+-- Migration 004: tiebreaks.
+--
+-- PlayerTiebreaks returns the standings of a tournament together with the
+-- common opponent-strength tiebreakers, computed for every player in one
+-- pass over the tournament's matches:
+--   buchholz          sum of the wins of every opponent faced
+--   sonneborn_berger  sum of the wins of every opponent beaten
+--   opponent_win_pct  mean win ratio of the opponents faced, each floored
+--                     at 1/3
+-- Byes have no opponent and count for none of them. The caller orders the
+-- rows.
+
+CREATE OR REPLACE FUNCTION PlayerTiebreaks (tournament_id INT)
+	RETURNS TABLE (
+		id INT,
+		name TEXT,
+		wins BIGINT,
+		losses BIGINT,
+		buchholz BIGINT,
+		sonneborn_berger BIGINT,
+		opponent_win_pct DOUBLE PRECISION
+	) AS $$
+		WITH stats AS (
+			SELECT s.pid, s.wins, s.losses FROM PlayerStats AS s
+			WHERE s.tid = tournament_id),
+		games AS (
+			SELECT m.winner AS pid, m.loser AS opponent, 1 AS won
+				FROM Matches AS m
+				WHERE m.tid = tournament_id AND m.winner <> m.loser
+			UNION ALL
+			SELECT m.loser, m.winner, 0
+				FROM Matches AS m
+				WHERE m.tid = tournament_id AND m.winner <> m.loser),
+		opponents AS (
+			SELECT g.pid,
+				sum(o.wins) AS buchholz,
+				sum(o.wins * g.won) AS sonneborn_berger,
+				avg(greatest(o.wins::DOUBLE PRECISION /
+					nullif(o.wins + o.losses, 0), 1.0 / 3)) AS opponent_win_pct
+			FROM games AS g JOIN stats AS o ON o.pid = g.opponent
+			GROUP BY g.pid)
+		SELECT p.id, p.name, s.wins::BIGINT, s.losses::BIGINT,
+			COALESCE(o.buchholz, 0)::BIGINT,
+			COALESCE(o.sonneborn_berger, 0)::BIGINT,
+			COALESCE(o.opponent_win_pct, 0)::DOUBLE PRECISION
+		FROM stats AS s
+		JOIN Players AS p ON p.id = s.pid
+		LEFT JOIN opponents AS o ON o.pid = s.pid;
+	$$
+	LANGUAGE sql STABLE;
+
+INSERT INTO SchemaVersion (version, description)
+	VALUES (4, 'tiebreaks');
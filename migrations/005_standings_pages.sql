@@ -0,0 +1,46 @@
+-- Migration 005: paginated standings.
+--
+-- PlayerStandingsPage returns the standings rows that come after a
+-- (wins, id) key, in standings order, at most page_size of them. NULL
+-- arguments mean from the first row and with no limit. It is a plain SQL
+-- function so the planner inlines it into the calling query: the key
+-- becomes a single row comparison on playerstats_tid_rank_idx, and the scan
+-- starts at the key and stops after page_size rows instead of building the
+-- whole standings first.
+
+CREATE INDEX playerstats_tid_rank_idx ON PlayerStats (tid, (-wins), pid);
+DROP INDEX playerstats_tid_wins_idx;
+
+CREATE OR REPLACE FUNCTION PlayerStandingsPage (tournament_id INT,
+		after_wins INT, after_id INT, page_size INT)
+	RETURNS TABLE (
+		id INT,
+		name TEXT,
+		wins BIGINT,
+		losses BIGINT
+	) AS $$
+		SELECT p.id, p.name, s.wins::BIGINT, s.losses::BIGINT
+		FROM PlayerStats AS s
+		JOIN Players AS p ON p.id = s.pid
+		WHERE s.tid = tournament_id
+			AND (after_wins IS NULL
+				OR (-s.wins, s.pid) > (-after_wins, after_id))
+		ORDER BY -s.wins, s.pid
+		LIMIT page_size;
+	$$
+	LANGUAGE sql STABLE;
+
+-- The whole standings are the page with no key and no limit.
+CREATE OR REPLACE FUNCTION PlayerStandings (tournament_id INT)
+	RETURNS TABLE (
+		id INT,
+		name TEXT,
+		wins BIGINT,
+		losses BIGINT
+	) AS $$
+		SELECT * FROM PlayerStandingsPage(tournament_id, NULL, NULL, NULL);
+	$$
+	LANGUAGE sql STABLE;
+
+INSERT INTO SchemaVersion (version, description)
+	VALUES (5, 'paginated standings');
@@ -0,0 +1,83 @@
+-- Migration 006: rounds and per-round snapshots.
+--
+-- Tournaments.round is the number of the round last paired (0 before the
+-- first pairing) and every match records the round it was reported in.
+-- RoundStandings keeps the standings of each completed round and
+-- RoundPairings the pairings of each round, so historical standings and
+-- pairings are read from a few rows instead of being recomputed from the
+-- match history. Both are only ever appended to.
+
+ALTER TABLE Tournaments ADD COLUMN round INT not null default 0;
+ALTER TABLE Matches ADD COLUMN round INT not null default 0;
+
+-- Backfill. Every player plays once per round (a bye counts as a match),
+-- so a player's nth match is in round n, and a match is in the round
+-- numbered by the most matches either of its players had by then.
+UPDATE Matches AS m SET round = numbered.round
+	FROM (SELECT id, max(n) AS round
+		FROM (SELECT id, row_number() OVER (PARTITION BY tid, pid ORDER BY id) AS n
+			FROM (SELECT id, tid, winner AS pid FROM Matches
+				UNION ALL
+				SELECT id, tid, loser FROM Matches WHERE winner <> loser) AS appearances
+			) AS counted
+		GROUP BY id) AS numbered
+	WHERE m.id = numbered.id;
+
+UPDATE Tournaments AS t SET round = last.round
+	FROM (SELECT tid, max(round) AS round FROM Matches GROUP BY tid) AS last
+	WHERE t.id = last.tid;
+
+CREATE TABLE RoundStandings(
+	tid INT not null,
+	round INT not null,
+	pid INT not null,
+	wins INT not null,
+	losses INT not null,
+	primary key (tid, round, pid),
+	foreign key (tid, pid) references PlayersTournaments (tid, pid)
+		on delete cascade on update cascade);
+
+CREATE TABLE RoundPairings(
+	tid INT not null,
+	round INT not null,
+	board INT not null,
+	pid1 INT not null,
+	pid2 INT not null,
+	primary key (tid, round, board),
+	foreign key (tid, pid1) references PlayersTournaments (tid, pid)
+		on delete cascade on update cascade,
+	foreign key (tid, pid2) references PlayersTournaments (tid, pid)
+		on delete cascade on update cascade);
+
+-- For the cascades when players are unregistered.
+CREATE INDEX roundpairings_tid_pid1_idx ON RoundPairings (tid, pid1);
+CREATE INDEX roundpairings_tid_pid2_idx ON RoundPairings (tid, pid2);
+
+-- Snapshots of the rounds already played. The last round of each
+-- tournament may still be in progress and is left to be completed.
+INSERT INTO RoundStandings (tid, round, pid, wins, losses)
+	SELECT pt.tid, r.round, pt.pid,
+		count(a.pid) FILTER (WHERE a.won),
+		count(a.pid) FILTER (WHERE NOT a.won)
+	FROM PlayersTournaments AS pt
+	JOIN Tournaments AS t ON t.id = pt.tid
+	CROSS JOIN LATERAL generate_series(1, t.round - 1) AS r(round)
+	LEFT JOIN (SELECT tid, round, winner AS pid, true AS won FROM Matches
+		UNION ALL
+		SELECT tid, round, loser, false FROM Matches WHERE winner <> loser) AS a
+		ON a.tid = pt.tid AND a.pid = pt.pid AND a.round <= r.round
+	GROUP BY pt.tid, r.round, pt.pid;
+
+INSERT INTO RoundPairings (tid, round, board, pid1, pid2)
+	SELECT tid, round,
+		row_number() OVER (PARTITION BY tid, round ORDER BY id),
+		least(winner, loser), greatest(winner, loser)
+	FROM Matches AS m
+	WHERE winner <> loser AND round > 0
+		AND EXISTS (SELECT 1 FROM PlayersTournaments AS pt
+			WHERE pt.tid = m.tid AND pt.pid = m.winner)
+		AND EXISTS (SELECT 1 FROM PlayersTournaments AS pt
+			WHERE pt.tid = m.tid AND pt.pid = m.loser);
+
+INSERT INTO SchemaVersion (version, description)
+	VALUES (6, 'rounds and per-round snapshots');
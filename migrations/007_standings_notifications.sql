@@ -0,0 +1,31 @@
+-- Migration 007: standings change notifications.
+--
+-- Every statement that changes PlayerStats (reported matches and byes,
+-- registrations, deletions) sends a notification on the standings_changed
+-- channel with the id of each tournament it touched. PostgreSQL delivers
+-- them when the transaction commits and folds duplicates within one
+-- transaction, so a whole round reported at once is a single
+-- notification. See notifications.py.
+
+CREATE OR REPLACE FUNCTION NotifyStandingsChanged ()
+	RETURNS TRIGGER AS $$
+	BEGIN
+		PERFORM pg_notify('standings_changed', tid::TEXT)
+			FROM (SELECT DISTINCT tid FROM changed) AS tournaments;
+		RETURN NULL;
+	END;
+	$$
+	LANGUAGE 'plpgsql';
+
+CREATE TRIGGER playerstats_notify_insert AFTER INSERT ON PlayerStats
+	REFERENCING NEW TABLE AS changed
+	FOR EACH STATEMENT EXECUTE FUNCTION NotifyStandingsChanged();
+CREATE TRIGGER playerstats_notify_update AFTER UPDATE ON PlayerStats
+	REFERENCING NEW TABLE AS changed
+	FOR EACH STATEMENT EXECUTE FUNCTION NotifyStandingsChanged();
+CREATE TRIGGER playerstats_notify_delete AFTER DELETE ON PlayerStats
+	REFERENCING OLD TABLE AS changed
+	FOR EACH STATEMENT EXECUTE FUNCTION NotifyStandingsChanged();
+
+INSERT INTO SchemaVersion (version, description)
+	VALUES (7, 'standings change notifications');
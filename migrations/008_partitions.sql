@@ -0,0 +1,211 @@
+-- Migration 008: one partition per tournament.
+--
+-- Matches and PlayersTournaments become list-partitioned by tid, with a
+-- matches_<tid> and a playerstournaments_<tid> partition per tournament.
+-- Queries of one tournament only touch its partitions, and the matches of
+-- a tournament are deleted by truncating its partition instead of row by
+-- row. Partitions are created and dropped along with the Tournaments
+-- rows. Finished tournaments can be archived: their final standings are
+-- kept in ArchivedStandings and their partitions dropped.
+
+-- Partitions of a tournament. They are created apart and then attached,
+-- which does not block reads and writes of the other tournaments' rows.
+-- It is not free, though: until the creating transaction commits, it
+-- holds a SHARE UPDATE EXCLUSIVE lock on Matches and PlayersTournaments,
+-- which blocks the creation of other tournaments, and, for the foreign
+-- keys of the new partitions, a SHARE ROW EXCLUSIVE lock on Players,
+-- which blocks every insert into Players, i.e. the registration of new
+-- players anywhere. Create tournaments in short transactions of their
+-- own, as tournament.py and transfer.py do.
+CREATE OR REPLACE FUNCTION CreateTournamentPartitions (tournament_id INT)
+	RETURNS VOID AS $$
+	BEGIN
+		EXECUTE format('CREATE TABLE %I (LIKE Matches INCLUDING DEFAULTS)',
+			'matches_' || tournament_id);
+		EXECUTE format('ALTER TABLE Matches ATTACH PARTITION %I FOR VALUES IN (%s)',
+			'matches_' || tournament_id, tournament_id);
+		EXECUTE format('CREATE TABLE %I (LIKE PlayersTournaments INCLUDING DEFAULTS)',
+			'playerstournaments_' || tournament_id);
+		EXECUTE format('ALTER TABLE PlayersTournaments ATTACH PARTITION %I FOR VALUES IN (%s)',
+			'playerstournaments_' || tournament_id, tournament_id);
+	END;
+	$$
+	LANGUAGE 'plpgsql';
+
+-- They are detached before being dropped: foreign keys referencing
+-- PlayersTournaments depend on its attached partitions.
+CREATE OR REPLACE FUNCTION DropTournamentPartitions (tournament_id INT)
+	RETURNS VOID AS $$
+	DECLARE
+		parent TEXT;
+		partition TEXT;
+	BEGIN
+		FOREACH parent IN ARRAY ARRAY['matches', 'playerstournaments'] LOOP
+			partition := parent || '_' || tournament_id;
+			IF to_regclass(partition) IS NOT NULL THEN
+				EXECUTE format('ALTER TABLE %I DETACH PARTITION %I',
+					parent, partition);
+				EXECUTE format('DROP TABLE %I', partition);
+			END IF;
+		END LOOP;
+	END;
+	$$
+	LANGUAGE 'plpgsql';
+
+-- Recreate both tables partitioned, keeping their rows and id sequences.
+DROP VIEW PlayerWins;
+DROP VIEW PlayerLosses;
+ALTER TABLE PlayerStats DROP CONSTRAINT playerstats_tid_pid_fkey;
+ALTER TABLE RoundStandings DROP CONSTRAINT roundstandings_tid_pid_fkey;
+ALTER TABLE RoundPairings DROP CONSTRAINT roundpairings_tid_pid1_fkey;
+ALTER TABLE RoundPairings DROP CONSTRAINT roundpairings_tid_pid2_fkey;
+
+ALTER TABLE Matches RENAME TO matches_unpartitioned;
+ALTER TABLE PlayersTournaments RENAME TO playerstournaments_unpartitioned;
+ALTER SEQUENCE matches_id_seq OWNED BY NONE;
+ALTER SEQUENCE playerstournaments_id_seq OWNED BY NONE;
+
+-- tid has no foreign key: rows can only go to the partition of an
+-- existing tournament anyway, and attaching a partition would otherwise
+-- lock Tournaments against the transactions creating other tournaments.
+CREATE TABLE Matches(
+	id INT not null default nextval('matches_id_seq'),
+	winner INT references Players(id),
+	loser INT references Players(id),
+	tid INT not null,
+	round INT not null default 0)
+	PARTITION BY LIST (tid);
+
+CREATE TABLE PlayersTournaments(
+	id INT not null default nextval('playerstournaments_id_seq'),
+	pid INT references Players(id),
+	tid INT not null)
+	PARTITION BY LIST (tid);
+
+SELECT CreateTournamentPartitions(id) FROM Tournaments;
+
+-- Rows without a tournament belong to no partition and are left out.
+INSERT INTO Matches (id, winner, loser, tid, round)
+	SELECT id, winner, loser, tid, round FROM matches_unpartitioned
+	WHERE tid IS NOT NULL;
+INSERT INTO PlayersTournaments (id, pid, tid)
+	SELECT id, pid, tid FROM playerstournaments_unpartitioned
+	WHERE tid IS NOT NULL;
+
+DROP TABLE matches_unpartitioned;
+DROP TABLE playerstournaments_unpartitioned;
+ALTER SEQUENCE matches_id_seq OWNED BY Matches.id;
+ALTER SEQUENCE playerstournaments_id_seq OWNED BY PlayersTournaments.id;
+
+-- The keys, indexes and foreign keys of migrations 002, 003 and 006.
+ALTER TABLE Matches ADD PRIMARY KEY (tid, id);
+ALTER TABLE PlayersTournaments ADD PRIMARY KEY (tid, id);
+ALTER TABLE PlayersTournaments ADD CONSTRAINT playerstournaments_tid_pid_key UNIQUE (tid, pid);
+
+CREATE INDEX playerstournaments_pid_idx ON PlayersTournaments (pid);
+CREATE INDEX matches_tid_winner_loser_idx ON Matches (tid, winner, loser);
+CREATE INDEX matches_tid_loser_idx ON Matches (tid, loser);
+CREATE INDEX matches_tid_pair_idx ON Matches (tid, least(winner, loser), greatest(winner, loser));
+CREATE INDEX matches_tid_bye_idx ON Matches (tid, winner) WHERE winner = loser;
+CREATE INDEX matches_winner_idx ON Matches (winner);
+CREATE INDEX matches_loser_idx ON Matches (loser);
+
+ALTER TABLE PlayerStats ADD CONSTRAINT playerstats_tid_pid_fkey
+	foreign key (tid, pid) references PlayersTournaments (tid, pid)
+	on delete cascade on update cascade;
+ALTER TABLE RoundStandings ADD CONSTRAINT roundstandings_tid_pid_fkey
+	foreign key (tid, pid) references PlayersTournaments (tid, pid)
+	on delete cascade on update cascade;
+ALTER TABLE RoundPairings ADD CONSTRAINT roundpairings_tid_pid1_fkey
+	foreign key (tid, pid1) references PlayersTournaments (tid, pid)
+	on delete cascade on update cascade;
+ALTER TABLE RoundPairings ADD CONSTRAINT roundpairings_tid_pid2_fkey
+	foreign key (tid, pid2) references PlayersTournaments (tid, pid)
+	on delete cascade on update cascade;
+
+CREATE TRIGGER matches_player_stats_insert AFTER INSERT ON Matches
+	REFERENCING NEW TABLE AS new_matches
+	FOR EACH STATEMENT EXECUTE FUNCTION PlayerStatsMatchesInserted();
+CREATE TRIGGER matches_player_stats_delete AFTER DELETE ON Matches
+	REFERENCING OLD TABLE AS old_matches
+	FOR EACH STATEMENT EXECUTE FUNCTION PlayerStatsMatchesDeleted();
+CREATE TRIGGER matches_player_stats_update AFTER UPDATE ON Matches
+	REFERENCING OLD TABLE AS old_matches NEW TABLE AS new_matches
+	FOR EACH STATEMENT EXECUTE FUNCTION PlayerStatsMatchesUpdated();
+CREATE TRIGGER playerstournaments_player_stats_insert AFTER INSERT ON PlayersTournaments
+	REFERENCING NEW TABLE AS new_players
+	FOR EACH STATEMENT EXECUTE FUNCTION PlayerStatsPlayersInserted();
+CREATE TRIGGER playerstournaments_player_stats_update AFTER UPDATE ON PlayersTournaments
+	REFERENCING NEW TABLE AS new_players
+	FOR EACH STATEMENT EXECUTE FUNCTION PlayerStatsPlayersUpdated();
+
+CREATE OR REPLACE VIEW PlayerWins as select winner as pid, count(winner) as wins, tid from Matches group by winner, tid;
+CREATE OR REPLACE VIEW PlayerLosses as select loser as pid, count(loser) as losses, tid from Matches where loser != winner group by loser, tid;
+
+-- New tournaments get their partitions, deleted ones lose them.
+CREATE OR REPLACE FUNCTION TournamentsChanged ()
+	RETURNS TRIGGER AS $$
+	BEGIN
+		IF TG_OP = 'INSERT' THEN
+			PERFORM CreateTournamentPartitions(NEW.id);
+		ELSE
+			PERFORM DropTournamentPartitions(OLD.id);
+		END IF;
+		RETURN NULL;
+	END;
+	$$
+	LANGUAGE 'plpgsql';
+
+CREATE TRIGGER tournaments_partitions_insert AFTER INSERT ON Tournaments
+	FOR EACH ROW EXECUTE FUNCTION TournamentsChanged();
+CREATE TRIGGER tournaments_partitions_delete AFTER DELETE ON Tournaments
+	FOR EACH ROW EXECUTE FUNCTION TournamentsChanged();
+
+-- Deletes every match of a tournament in constant time. TRUNCATE fires no
+-- DELETE triggers, so the player stats are reset here.
+CREATE OR REPLACE FUNCTION DeleteTournamentMatches (tournament_id INT)
+	RETURNS VOID AS $$
+	BEGIN
+		EXECUTE format('TRUNCATE %I', 'matches_' || tournament_id);
+		UPDATE PlayerStats SET wins = 0, losses = 0, has_had_bye = false
+			WHERE tid = tournament_id
+				AND (wins <> 0 OR losses <> 0 OR has_had_bye);
+	END;
+	$$
+	LANGUAGE 'plpgsql';
+
+-- Archived tournaments: final standings only.
+ALTER TABLE Tournaments ADD COLUMN archived_at TIMESTAMPTZ;
+
+CREATE TABLE ArchivedStandings(
+	tid INT not null references Tournaments(id) on delete cascade,
+	pid INT not null references Players(id),
+	wins INT not null,
+	losses INT not null,
+	primary key (tid, pid));
+
+-- Keeps the final standings of a tournament and drops everything else
+-- about it. Returns false if it was already archived.
+CREATE OR REPLACE FUNCTION ArchiveTournament (tournament_id INT)
+	RETURNS BOOLEAN AS $$
+	BEGIN
+		UPDATE Tournaments SET archived_at = now()
+			WHERE id = tournament_id AND archived_at IS NULL;
+		IF NOT FOUND THEN
+			RETURN false;
+		END IF;
+
+		INSERT INTO ArchivedStandings (tid, pid, wins, losses)
+			SELECT tid, pid, wins, losses FROM PlayerStats
+			WHERE tid = tournament_id;
+		DELETE FROM RoundStandings WHERE tid = tournament_id;
+		DELETE FROM RoundPairings WHERE tid = tournament_id;
+		DELETE FROM PlayerStats WHERE tid = tournament_id;
+		PERFORM DropTournamentPartitions(tournament_id);
+		RETURN true;
+	END;
+	$$
+	LANGUAGE 'plpgsql';
+
+INSERT INTO SchemaVersion (version, description)
+	VALUES (8, 'tournament partitions and archives');
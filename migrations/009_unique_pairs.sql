@@ -0,0 +1,45 @@
+-- Migration 009: at most one match per pair of players and tournament.
+--
+-- reportMatch checked for a rematch and then inserted, so two reporters
+-- submitting the same pair at once could both record it. Matches now keeps
+-- the unordered pair in the generated columns p1 <= p2, unique per
+-- tournament, and results are recorded by a single
+-- INSERT ... ON CONFLICT DO NOTHING. Expressions cannot be used in the
+-- unique keys of a partitioned table, hence the stored columns. A bye is
+-- the pair (p, p), so a player still gets at most one.
+
+-- Keep the first of the pairs recorded more than once. The PlayerStats
+-- triggers take the deleted matches off the records.
+DELETE FROM Matches AS m
+	USING Matches AS first
+	WHERE first.tid = m.tid
+		AND least(first.winner, first.loser) = least(m.winner, m.loser)
+		AND greatest(first.winner, first.loser) = greatest(m.winner, m.loser)
+		AND first.id < m.id;
+
+ALTER TABLE Matches
+	ADD COLUMN p1 INT GENERATED ALWAYS AS (least(winner, loser)) STORED,
+	ADD COLUMN p2 INT GENERATED ALWAYS AS (greatest(winner, loser)) STORED;
+ALTER TABLE Matches ADD CONSTRAINT matches_tid_pair_key UNIQUE (tid, p1, p2);
+
+-- Replaced by the unique key.
+DROP INDEX matches_tid_pair_idx;
+
+-- Partitions attached to Matches must have the generated columns too.
+CREATE OR REPLACE FUNCTION CreateTournamentPartitions (tournament_id INT)
+	RETURNS VOID AS $$
+	BEGIN
+		EXECUTE format('CREATE TABLE %I (LIKE Matches INCLUDING DEFAULTS INCLUDING GENERATED)',
+			'matches_' || tournament_id);
+		EXECUTE format('ALTER TABLE Matches ATTACH PARTITION %I FOR VALUES IN (%s)',
+			'matches_' || tournament_id, tournament_id);
+		EXECUTE format('CREATE TABLE %I (LIKE PlayersTournaments INCLUDING DEFAULTS)',
+			'playerstournaments_' || tournament_id);
+		EXECUTE format('ALTER TABLE PlayersTournaments ATTACH PARTITION %I FOR VALUES IN (%s)',
+			'playerstournaments_' || tournament_id, tournament_id);
+	END;
+	$$
+	LANGUAGE 'plpgsql';
+
+INSERT INTO SchemaVersion (version, description)
+	VALUES (9, 'unique match pairs');
@@ -0,0 +1,56 @@
+-- Migration 010: player stats triggers that scale with the number of
+-- tournaments.
+--
+-- RefreshPlayerStats and PlayerStatsPlayersInserted joined Matches on a tid
+-- read from their arguments or transition tables, which cannot be pruned
+-- when the statement is planned: every plan covered every partition, and
+-- since creating a tournament adds partitions, the plans were made again
+-- each time. With thousands of tournaments, registering a player took
+-- seconds. Both now run one statement per tournament with custom plans, so
+-- each is planned against the partition of that tournament only.
+
+CREATE OR REPLACE FUNCTION RefreshPlayerStats (tids INT[], pids INT[])
+	RETURNS VOID AS $$
+	DECLARE
+		tournament_id INT;
+	BEGIN
+		FOR tournament_id IN SELECT DISTINCT unnest(tids) LOOP
+			UPDATE PlayerStats AS s SET
+				wins = (SELECT count(*) FROM Matches AS m
+					WHERE m.tid = tournament_id AND m.winner = s.pid),
+				losses = (SELECT count(*) FROM Matches AS m
+					WHERE m.tid = tournament_id AND m.loser = s.pid AND m.winner <> m.loser),
+				has_had_bye = EXISTS (SELECT 1 FROM Matches AS m
+					WHERE m.tid = tournament_id AND m.winner = s.pid AND m.loser = s.pid)
+				FROM (SELECT DISTINCT pid FROM unnest(tids, pids) AS a(tid, pid)
+					WHERE a.tid = tournament_id) AS a
+				WHERE s.tid = tournament_id AND s.pid = a.pid;
+		END LOOP;
+	END;
+	$$
+	LANGUAGE 'plpgsql'
+	SET plan_cache_mode = force_custom_plan;
+
+-- New enrollments: start from the matches already played, if any.
+CREATE OR REPLACE FUNCTION PlayerStatsPlayersInserted ()
+	RETURNS TRIGGER AS $$
+	DECLARE
+		tournament_id INT;
+	BEGIN
+		INSERT INTO PlayerStats (tid, pid)
+			SELECT tid, pid FROM new_players;
+		FOR tournament_id IN SELECT DISTINCT tid FROM new_players LOOP
+			IF EXISTS (SELECT 1 FROM Matches WHERE tid = tournament_id) THEN
+				PERFORM RefreshPlayerStats(
+					array(SELECT tid FROM new_players WHERE tid = tournament_id),
+					array(SELECT pid FROM new_players WHERE tid = tournament_id));
+			END IF;
+		END LOOP;
+		RETURN NULL;
+	END;
+	$$
+	LANGUAGE 'plpgsql'
+	SET plan_cache_mode = force_custom_plan;
+
+INSERT INTO SchemaVersion (version, description)
+	VALUES (10, 'per tournament stats refresh');
@@ -0,0 +1,92 @@
+-- Migration 011: a change counter per tournament.
+--
+-- Tournaments.version goes up with every statement that writes the
+-- matches or the registrations of a tournament, in the transaction of the
+-- write. A result computed from the tournament (standings, counts,
+-- pairings) stays valid for as long as the version it was computed at,
+-- which a primary key lookup checks. See tournament.py's result cache.
+
+ALTER TABLE Tournaments ADD COLUMN version BIGINT NOT NULL DEFAULT 0;
+
+CREATE OR REPLACE FUNCTION BumpTournamentVersions ()
+	RETURNS TRIGGER AS $$
+	BEGIN
+		UPDATE Tournaments SET version = version + 1
+			WHERE id IN (SELECT DISTINCT tid FROM changed);
+		RETURN NULL;
+	END;
+	$$
+	LANGUAGE 'plpgsql';
+
+CREATE TRIGGER matches_version_insert AFTER INSERT ON Matches
+	REFERENCING NEW TABLE AS changed
+	FOR EACH STATEMENT EXECUTE FUNCTION BumpTournamentVersions();
+CREATE TRIGGER matches_version_update AFTER UPDATE ON Matches
+	REFERENCING NEW TABLE AS changed
+	FOR EACH STATEMENT EXECUTE FUNCTION BumpTournamentVersions();
+CREATE TRIGGER matches_version_delete AFTER DELETE ON Matches
+	REFERENCING OLD TABLE AS changed
+	FOR EACH STATEMENT EXECUTE FUNCTION BumpTournamentVersions();
+CREATE TRIGGER playerstournaments_version_insert AFTER INSERT ON PlayersTournaments
+	REFERENCING NEW TABLE AS changed
+	FOR EACH STATEMENT EXECUTE FUNCTION BumpTournamentVersions();
+CREATE TRIGGER playerstournaments_version_update AFTER UPDATE ON PlayersTournaments
+	REFERENCING NEW TABLE AS changed
+	FOR EACH STATEMENT EXECUTE FUNCTION BumpTournamentVersions();
+CREATE TRIGGER playerstournaments_version_delete AFTER DELETE ON PlayersTournaments
+	REFERENCING OLD TABLE AS changed
+	FOR EACH STATEMENT EXECUTE FUNCTION BumpTournamentVersions();
+
+-- TRUNCATE fires no row triggers and has no transition tables: truncating
+-- Matches changes every tournament.
+CREATE OR REPLACE FUNCTION BumpAllTournamentVersions ()
+	RETURNS TRIGGER AS $$
+	BEGIN
+		UPDATE Tournaments SET version = version + 1;
+		RETURN NULL;
+	END;
+	$$
+	LANGUAGE 'plpgsql';
+
+CREATE TRIGGER matches_version_truncate AFTER TRUNCATE ON Matches
+	FOR EACH STATEMENT EXECUTE FUNCTION BumpAllTournamentVersions();
+
+-- Truncating the partition of one tournament does not fire the trigger of
+-- Matches.
+CREATE OR REPLACE FUNCTION DeleteTournamentMatches (tournament_id INT)
+	RETURNS VOID AS $$
+	BEGIN
+		EXECUTE format('TRUNCATE %I', 'matches_' || tournament_id);
+		UPDATE PlayerStats SET wins = 0, losses = 0, has_had_bye = false
+			WHERE tid = tournament_id
+				AND (wins <> 0 OR losses <> 0 OR has_had_bye);
+		UPDATE Tournaments SET version = version + 1
+			WHERE id = tournament_id;
+	END;
+	$$
+	LANGUAGE 'plpgsql';
+
+-- Nor does dropping the partitions of an archived tournament.
+CREATE OR REPLACE FUNCTION ArchiveTournament (tournament_id INT)
+	RETURNS BOOLEAN AS $$
+	BEGIN
+		UPDATE Tournaments SET archived_at = now(), version = version + 1
+			WHERE id = tournament_id AND archived_at IS NULL;
+		IF NOT FOUND THEN
+			RETURN false;
+		END IF;
+
+		INSERT INTO ArchivedStandings (tid, pid, wins, losses)
+			SELECT tid, pid, wins, losses FROM PlayerStats
+			WHERE tid = tournament_id;
+		DELETE FROM RoundStandings WHERE tid = tournament_id;
+		DELETE FROM RoundPairings WHERE tid = tournament_id;
+		DELETE FROM PlayerStats WHERE tid = tournament_id;
+		PERFORM DropTournamentPartitions(tournament_id);
+		RETURN true;
+	END;
+	$$
+	LANGUAGE 'plpgsql';
+
+INSERT INTO SchemaVersion (version, description)
+	VALUES (11, 'tournament versions');
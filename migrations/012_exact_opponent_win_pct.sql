@@ -0,0 +1,65 @@
+-- Migration 012: opponent win percentage in exact arithmetic.
+--
+-- opponent_win_pct was the average of DOUBLE PRECISION ratios, whose last
+-- bits depend on the order the rows are summed in: players with the same
+-- percentage were ordered by rounding noise rather than by id, and
+-- differently than by backends.computeTiebreaks. Each ratio is now scaled
+-- to an integer over a denominator common to the whole tournament, g!
+-- where g is the most games any player has played, and the mean is
+-- rounded half up to 12 decimal places with integer division. Python
+-- computes the same value with fractions.
+--
+-- The return type changes, so the function is dropped first.
+
+DROP FUNCTION PlayerTiebreaks (INT);
+
+CREATE FUNCTION PlayerTiebreaks (tournament_id INT)
+	RETURNS TABLE (
+		id INT,
+		name TEXT,
+		wins BIGINT,
+		losses BIGINT,
+		buchholz BIGINT,
+		sonneborn_berger BIGINT,
+		opponent_win_pct NUMERIC
+	) AS $$
+		WITH stats AS (
+			SELECT s.pid, s.wins, s.losses FROM PlayerStats AS s
+			WHERE s.tid = tournament_id),
+		scale AS (
+			SELECT factorial(COALESCE(max(s.wins + s.losses), 0)) AS f
+			FROM stats AS s),
+		games AS (
+			SELECT m.winner AS pid, m.loser AS opponent, 1 AS won
+				FROM Matches AS m
+				WHERE m.tid = tournament_id AND m.winner <> m.loser
+			UNION ALL
+			SELECT m.loser, m.winner, 0
+				FROM Matches AS m
+				WHERE m.tid = tournament_id AND m.winner <> m.loser),
+		opponents AS (
+			-- ratios is the sum of the floored win ratios times 3 f.
+			SELECT g.pid,
+				sum(o.wins) AS buchholz,
+				sum(o.wins * g.won) AS sonneborn_berger,
+				sum(CASE WHEN o.wins + o.losses = 0 THEN c.f
+					ELSE greatest(3 * o.wins, o.wins + o.losses) *
+						div(c.f, o.wins + o.losses) END) AS ratios,
+				count(*) AS faced,
+				c.f
+			FROM games AS g JOIN stats AS o ON o.pid = g.opponent
+				CROSS JOIN scale AS c
+			GROUP BY g.pid, c.f)
+		SELECT p.id, p.name, s.wins::BIGINT, s.losses::BIGINT,
+			COALESCE(o.buchholz, 0)::BIGINT,
+			COALESCE(o.sonneborn_berger, 0)::BIGINT,
+			COALESCE(div(2 * o.ratios * 1000000000000 + 3 * o.f * o.faced,
+				6 * o.f * o.faced) * 0.000000000001, 0.000000000000)
+		FROM stats AS s
+		JOIN Players AS p ON p.id = s.pid
+		LEFT JOIN opponents AS o ON o.pid = s.pid;
+	$$
+	LANGUAGE sql STABLE;
+
+INSERT INTO SchemaVersion (version, description)
+	VALUES (12, 'exact opponent win pct');
@@ -0,0 +1,104 @@
+-- Migration 013: tournament versions without a hot row.
+--
+-- Every write to a tournament updated its Tournaments row to bump the
+-- version, and held the row lock until commit: concurrent reporters of the
+-- same tournament queued behind each other although their inserts do not
+-- conflict (see migration 009). The version is now split in slots, and a
+-- write bumps the slot of its server process only, so writers on different
+-- connections do not wait for each other. The version of a tournament is
+-- the sum of its slots. It still changes with every committed write and
+-- only then, as each write adds to it and a snapshot sees every write
+-- committed before it.
+
+-- Slots per tournament. Connections whose server processes share a slot
+-- wait for each other, as every write did before.
+CREATE OR REPLACE FUNCTION TournamentVersionSlot ()
+	RETURNS INT AS $$
+		SELECT pg_backend_pid() % 64;
+	$$
+	LANGUAGE sql STABLE;
+
+CREATE TABLE TournamentVersions(
+	tid INT not null references Tournaments(id) on delete cascade,
+	slot INT not null,
+	version BIGINT not null,
+	primary key (tid, slot));
+
+INSERT INTO TournamentVersions (tid, slot, version)
+	SELECT id, 0, version FROM Tournaments WHERE version <> 0;
+ALTER TABLE Tournaments DROP COLUMN version;
+
+CREATE OR REPLACE FUNCTION TournamentVersion (tournament_id INT)
+	RETURNS BIGINT AS $$
+		SELECT coalesce(sum(version), 0)::BIGINT FROM TournamentVersions
+			WHERE tid = tournament_id;
+	$$
+	LANGUAGE sql STABLE;
+
+-- Rows of tournaments being deleted have no version left to bump.
+CREATE OR REPLACE FUNCTION BumpTournamentVersion (tournament_ids INT[])
+	RETURNS VOID AS $$
+	BEGIN
+		INSERT INTO TournamentVersions (tid, slot, version)
+			SELECT id, TournamentVersionSlot(), 1 FROM Tournaments
+			WHERE id = ANY(tournament_ids)
+			ON CONFLICT (tid, slot)
+				DO UPDATE SET version = TournamentVersions.version + 1;
+	END;
+	$$
+	LANGUAGE 'plpgsql';
+
+CREATE OR REPLACE FUNCTION BumpTournamentVersions ()
+	RETURNS TRIGGER AS $$
+	BEGIN
+		PERFORM BumpTournamentVersion(ARRAY(SELECT DISTINCT tid FROM changed));
+		RETURN NULL;
+	END;
+	$$
+	LANGUAGE 'plpgsql';
+
+CREATE OR REPLACE FUNCTION BumpAllTournamentVersions ()
+	RETURNS TRIGGER AS $$
+	BEGIN
+		PERFORM BumpTournamentVersion(ARRAY(SELECT id FROM Tournaments));
+		RETURN NULL;
+	END;
+	$$
+	LANGUAGE 'plpgsql';
+
+CREATE OR REPLACE FUNCTION DeleteTournamentMatches (tournament_id INT)
+	RETURNS VOID AS $$
+	BEGIN
+		EXECUTE format('TRUNCATE %I', 'matches_' || tournament_id);
+		UPDATE PlayerStats SET wins = 0, losses = 0, has_had_bye = false
+			WHERE tid = tournament_id
+				AND (wins <> 0 OR losses <> 0 OR has_had_bye);
+		PERFORM BumpTournamentVersion(ARRAY[tournament_id]);
+	END;
+	$$
+	LANGUAGE 'plpgsql';
+
+CREATE OR REPLACE FUNCTION ArchiveTournament (tournament_id INT)
+	RETURNS BOOLEAN AS $$
+	BEGIN
+		UPDATE Tournaments SET archived_at = now()
+			WHERE id = tournament_id AND archived_at IS NULL;
+		IF NOT FOUND THEN
+			RETURN false;
+		END IF;
+		PERFORM BumpTournamentVersion(ARRAY[tournament_id]);
+
+		INSERT INTO ArchivedStandings (tid, pid, wins, losses)
+			SELECT tid, pid, wins, losses FROM PlayerStats
+			WHERE tid = tournament_id;
+		DELETE FROM RoundStandings WHERE tid = tournament_id;
+		DELETE FROM RoundPairings WHERE tid = tournament_id;
+		DELETE FROM PlayerStats WHERE tid = tournament_id;
+		PERFORM DropTournamentPartitions(tournament_id);
+		RETURN true;
+	END;
+	$$
+	LANGUAGE 'plpgsql';
+
+INSERT INTO SchemaVersion (version, description)
+	VALUES (13, 'tournament versions in slots');
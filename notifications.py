@@ -0,0 +1,195 @@
+#!/usr/bin/env python
+#
+# notifications.py -- push standings updates to subscribers
+#
+# migrations/007_standings_notifications.sql makes every change to the
+# standings of a tournament send a notification on STANDINGS_CHANNEL once
+# its transaction commits. StandingsListener keeps a connection listening
+# on that channel and, for each tournament that changed, reads the
+# standings once and hands them to the callbacks subscribed to it, so
+# clients no longer need to poll playerStandings().
+#
+# Usage:
+#   listener = StandingsListener()
+#   listener.subscribe(callback, 'T1')
+#   listener.start()
+#
+
+import select
+import sys
+import threading
+import traceback
+
+import psycopg2
+import psycopg2.extensions
+
+import tournament
+
+STANDINGS_CHANNEL = 'standings_changed'
+
+# Seconds a listener waits for notifications before checking whether it was
+# stopped, and before reconnecting after losing its connection.
+POLL_INTERVAL = 1.0
+
+
+def standingsChanges(previous, standings):
+    """Returns the rows of standings that differ from previous.
+
+    Args:
+      previous: the standings delivered before, or None.
+      standings: the current standings.
+
+    Returns:
+      The (id, name, wins, matches) rows that are new or whose record
+      changed, in standings order.
+    """
+    if previous is None:
+        return list(standings)
+
+    before = dict((row[0], row) for row in previous)
+    return [row for row in standings if before.get(row[0]) != row]
+
+
+class StandingsListener(object):
+    """Delivers the standings of tournaments to callbacks as they change.
+
+    Callbacks are called from the listener thread as
+    callback(standings, changed), where standings is the playerStandings()
+    of the tournament and changed the rows that differ from the previous
+    delivery (see standingsChanges). When the listener (re)connects, every
+    subscriber receives the current standings. Changes committed close
+    together are delivered once. Callbacks should be quick. An exception
+    raised by a callback, or while reading the standings of a tournament
+    (e.g. one deleted since its notification), is printed and skips that
+    delivery only: the listener keeps going.
+
+    Args:
+      dsn: libpq connection string of the database to listen to, defaults
+        to the database of the tournament connection pool.
+      poll_interval: see POLL_INTERVAL.
+    """
+
+    def __init__(self, dsn=None, poll_interval=POLL_INTERVAL):
+        self.dsn = dsn
+        self.poll_interval = poll_interval
+        self._lock = threading.Lock()
+        self._subscribers = {}
+        self._names = {}
+        self._last = {}
+        self._stopping = threading.Event()
+        self._thread = None
+
+    def subscribe(self, callback,
+                  tournament_name=tournament.MAIN_TOURNAMENT):
+        """Calls callback with the standings of a tournament when they change.
+
+        Raises:
+          ValueError: if the tournament does not exist.
+        """
+        tid = tournament.getTournamentId(tournament_name)
+        with self._lock:
+            self._subscribers.setdefault(tid, []).append(callback)
+            self._names[tid] = tournament_name
+
+    def unsubscribe(self, callback,
+                    tournament_name=tournament.MAIN_TOURNAMENT):
+        """Stops calling a callback passed to subscribe()."""
+        tid = tournament.getTournamentId(tournament_name)
+        with self._lock:
+            callbacks = self._subscribers.get(tid, [])
+            if callback in callbacks:
+                callbacks.remove(callback)
+            if not callbacks:
+                self._subscribers.pop(tid, None)
+                self._last.pop(tid, None)
+
+    def start(self):
+        """Starts listening in a background thread."""
+        if self._thread is not None:
+            raise RuntimeError("StandingsListener already started.")
+
+        self._stopping.clear()
+        self._thread = threading.Thread(target=self._run,
+                                        name='StandingsListener')
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self):
+        """Stops the listener thread and waits for it to finish."""
+        self._stopping.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _connect(self):
+        if self.dsn is not None:
+            db = psycopg2.connect(self.dsn)
+        else:
+            pool = tournament.getPool()
+            db = psycopg2.connect(pool.dsn, **pool.connect_kwargs)
+        db.set_isolation_level(
+            psycopg2.extensions.ISOLATION_LEVEL_AUTOCOMMIT)
+        cursor = db.cursor()
+        cursor.execute("LISTEN " + STANDINGS_CHANNEL)
+        cursor.close()
+
+        return db
+
+    def _run(self):
+        db = None
+        while not self._stopping.is_set():
+            try:
+                if db is None:
+                    db = self._connect()
+                    # Changes made while not listening were missed.
+                    with self._lock:
+                        subscribed = set(self._subscribers)
+                    self._deliver(subscribed)
+
+                if select.select([db], [], [], self.poll_interval)[0]:
+                    db.poll()
+                    changed = set(int(notify.payload)
+                                  for notify in db.notifies)
+                    del db.notifies[:]
+                    self._deliver(changed)
+            except psycopg2.Error:
+                if db is not None:
+                    db.close()
+                    db = None
+                self._stopping.wait(self.poll_interval)
+            except Exception:
+                # E.g. a malformed payload sent by hand.
+                traceback.print_exc(file=sys.stderr)
+
+        if db is not None:
+            db.close()
+
+    def _deliver(self, tids):
+        for tid in tids:
+            with self._lock:
+                callbacks = list(self._subscribers.get(tid, ()))
+                name = self._names.get(tid)
+            if not callbacks:
+                continue
+
+            try:
+                # A read-write transaction runs on the primary: the change
+                # notified was committed there, and a replica may not have
+                # replayed it yet.
+                with tournament.transaction():
+                    standings = tournament.playerStandings(name)
+            except Exception:
+                # The other tournaments are still delivered; this one is
+                # read again on its next notification.
+                traceback.print_exc(file=sys.stderr)
+                continue
+            changed = standingsChanges(self._last.get(tid), standings)
+            self._last[tid] = standings
+            if not changed:
+                continue
+
+            for callback in callbacks:
+                try:
+                    callback(standings, changed)
+                except Exception:
+                    traceback.print_exc(file=sys.stderr)
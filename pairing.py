@@ -0,0 +1,190 @@
+#!/usr/bin/env python
+#
+# pairing.py -- rematch-free Swiss pairing by minimum-weight matching
+#
+
+# Window sizes tried, in order, by pairPlayers(): the first over the whole
+# field, the others around its rematches. See pairPlayers().
+WINDOWS = (4, 8, 12)
+
+
+def pairCost(score1, score2):
+    """Returns the cost of pairing two players with the given scores."""
+    return (score1 - score2) ** 2
+
+
+def pairKey(player1, player2):
+    """Returns the order-independent key of a pair of player ids."""
+    if player1 < player2:
+        return (player1, player2)
+    return (player2, player1)
+
+
+def _matchWithinWindow(ids, scores, played, window, rematch_cost):
+    """Finds a minimum-weight perfect matching where partners are at most
+    window positions apart in ids.
+
+    Players are visited in order. The state after visiting a player is the
+    bitmask of which of the next window players are already taken, so the
+    search is exact within the band at a cost of O(n * 2^window * window)
+    in the worst case, and far less in practice since few masks are
+    reachable.
+
+    Args:
+      ids: player ids, in standings order.
+      scores: the player scores, parallel to ids.
+      played: a set of pairKey()s of players who already met.
+      window: how far ahead in ids a player may look for a partner.
+      rematch_cost: cost added to every pair that already met.
+
+    Returns:
+      A tuple (cost, rematches, pairs) where pairs is a list of (i, j)
+      index pairs into ids.
+    """
+    n = len(ids)
+    # best[mask] = (cost, rematches); steps[i][mask] = (previous mask, j)
+    best = {0: (0, 0)}
+    steps = []
+
+    for i in range(n):
+        following = {}
+        step = {}
+        for mask, (cost, rematches) in best.items():
+            if mask & 1:
+                state = mask >> 1
+                if state not in following or \
+                        following[state] > (cost, rematches):
+                    following[state] = (cost, rematches)
+                    step[state] = (mask, None)
+                continue
+
+            for k in range(1, window + 1):
+                j = i + k
+                if j >= n:
+                    break
+                if mask & (1 << k):
+                    continue
+
+                rematch = pairKey(ids[i], ids[j]) in played
+                candidate = (cost + pairCost(scores[i], scores[j]) +
+                             (rematch_cost if rematch else 0),
+                             rematches + rematch)
+                state = (mask | (1 << k)) >> 1
+                if state not in following or following[state] > candidate:
+                    following[state] = candidate
+                    step[state] = (mask, j)
+
+        best = following
+        steps.append(step)
+
+    cost, rematches = best[0]
+
+    pairs = []
+    mask = 0
+    for i in range(n - 1, -1, -1):
+        mask, j = steps[i][mask]
+        if j is not None:
+            pairs.append((i, j))
+    pairs.reverse()
+
+    return cost, rematches, pairs
+
+
+def _rematchBlocks(ids, partner, played, margin):
+    """Returns the ranges of standings positions to pair again around the
+    rematches of a pairing.
+
+    Each range spans margin positions on both sides of its rematches and is
+    widened until no pair crosses its ends, so it can be paired again on its
+    own. Overlapping ranges are merged.
+
+    Args:
+      ids: player ids, in standings order.
+      partner: partner[i] is the position of the partner of position i.
+      played: a set of pairKey()s of players who already met.
+      margin: how many positions to take in on each side of a rematch.
+
+    Returns:
+      A list of (start, stop) position ranges, in standings order.
+    """
+    n = len(ids)
+    blocks = []
+    for i in range(n):
+        j = partner[i]
+        if i > j or pairKey(ids[i], ids[j]) not in played:
+            continue
+        start, stop = max(0, i - margin), min(n, j + margin + 1)
+        while True:
+            inside = [partner[k] for k in range(start, stop)]
+            low, high = min(inside + [start]), max(inside + [stop - 1]) + 1
+            if (low, high) == (start, stop):
+                break
+            start, stop = low, high
+        blocks.append((start, stop))
+
+    blocks.sort()
+    merged = []
+    for start, stop in blocks:
+        if merged and start < merged[-1][1]:
+            merged[-1] = (merged[-1][0], max(stop, merged[-1][1]))
+        else:
+            merged.append((start, stop))
+    return merged
+
+
+def pairPlayers(players, played, windows=WINDOWS):
+    """Pairs players so that no two meet again and scores are close.
+
+    Computes a minimum-weight perfect matching where a pair costs the square
+    of its score difference and a rematch costs more than any rematch-free
+    pairing could. Partners are searched within a window of nearby standings
+    positions, which is where optimal Swiss pairings lie. The whole field is
+    paired with the first window. While rematches remain, only the players
+    around them are paired again, with the next, wider window: the cost of
+    a window grows exponentially with its size, so it is never paid for the
+    whole field. If the widest window cannot avoid them, the pairing with
+    the fewest rematches is returned.
+
+    Args:
+      players: a list of (id, score) tuples, best score first. Its length
+        must be even.
+      played: a set of pairKey()s of players who already met.
+      windows: the window sizes to try, smallest first.
+
+    Returns:
+      A tuple (pairs, rematches): pairs is a list of (id1, id2) tuples in
+      standings order, rematches the number of pairs that already met.
+    """
+    if len(players) % 2:
+        raise ValueError(
+            "Cannot pair an odd number of players ({n})."
+            .format(n=len(players)))
+    if not players:
+        return [], 0
+
+    ids = [pid for pid, score in players]
+    scores = [score for pid, score in players]
+
+    # More than any rematch-free pairing of these players can cost.
+    spread = max(scores) - min(scores)
+    rematch_cost = pairCost(spread, 0) * (len(players) // 2) + 1
+
+    partner = [None] * len(players)
+    for index, window in enumerate(windows):
+        if index == 0:
+            blocks = [(0, len(players))]
+        else:
+            blocks = _rematchBlocks(ids, partner, played, 2 * window)
+            if not blocks:
+                break
+        for start, stop in blocks:
+            cost, rematches, pairs = _matchWithinWindow(
+                ids[start:stop], scores[start:stop], played,
+                min(window, stop - start - 1), rematch_cost)
+            for i, j in pairs:
+                partner[start + i] = start + j
+                partner[start + j] = start + i
+
+    pairs = [(ids[i], ids[j]) for i, j in enumerate(partner) if i < j]
+    rematches = sum(1 for pair in pairs if pairKey(*pair) in played)
+    return pairs, rematches
@@ -0,0 +1,294 @@
+#!/usr/bin/env python
+#
+# server.py -- tournament.py over HTTP, as JSON
+#
+# Serves registration, reporting, standings and pairings to clients that
+# would otherwise each import tournament.py with their own connections.
+# Standings and pairings are cached per tournament under its stamp, the
+# version and round of tournamentStamp(), which is also their ETag. Each
+# request reads the stamp, a primary key lookup: repeated polls are
+# answered from the cache, or with 304 Not Modified when the client sends
+# If-None-Match, and every change to the tournament, whichever process
+# makes it, is seen by the next request.
+#
+# Routes (tournament names are URL-encoded):
+#   GET  /tournaments/NAME/standings
+#   GET  /tournaments/NAME/pairings    pairings of the current round
+#   POST /tournaments/NAME/players     {"names": ["Ann", "Bob"]}
+#   POST /tournaments/NAME/matches     {"winner": 1, "loser": 2}
+#   POST /tournaments/NAME/pairings    pairs the next round,
+#                                      {"strategy": "matching"} optional
+#
+# Usage:
+#   python server.py --port 8000
+#
+
+import argparse
+import json
+import sys
+import threading
+import traceback
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import unquote
+
+import psycopg2
+
+import tournament
+
+DEFAULT_HOST = '127.0.0.1'
+DEFAULT_PORT = 8000
+
+
+class ResponseCache(object):
+    """The JSON bodies served for each tournament, by tournament stamp.
+
+    Only the body of the latest stamp seen is kept per resource.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._bodies = {}
+
+    def get(self, name, resource, stamp):
+        """Returns the body cached for a resource at stamp, or None."""
+        with self._lock:
+            entry = self._bodies.get((name, resource))
+        if entry is not None and entry[0] == stamp:
+            return entry[1]
+        return None
+
+    def put(self, name, resource, stamp, body):
+        """Caches the body of a resource at stamp."""
+        with self._lock:
+            self._bodies[(name, resource)] = (stamp, body)
+
+    def clear(self):
+        """Drops every cached body."""
+        with self._lock:
+            self._bodies.clear()
+
+
+def standingsResource(name):
+    return [{'id': pid, 'name': pname, 'wins': wins, 'matches': matches}
+            for pid, pname, wins, matches in tournament.playerStandings(name)]
+
+
+def pairingsResource(name):
+    round = tournament.currentRound(name)
+    pairings = tournament.roundPairings(round, name) if round else []
+    return _pairingsBody(round, pairings)
+
+
+def _pairingsBody(round, pairings):
+    return {
+        'round': round,
+        'pairings': [{'id1': id1, 'name1': name1, 'id2': id2, 'name2': name2}
+                     for id1, name1, id2, name2 in pairings],
+    }
+
+
+RESOURCES = {
+    'standings': standingsResource,
+    'pairings': pairingsResource,
+}
+
+
+class TournamentHandler(BaseHTTPRequestHandler):
+    """Handles the routes of a TournamentServer."""
+
+    def _route(self):
+        parts = self.path.split('?', 1)[0].strip('/').split('/')
+        if len(parts) != 3 or parts[0] != 'tournaments' or not parts[1]:
+            return None, None
+        return unquote(parts[1]), parts[2]
+
+    def _send(self, status, body=None, etag=None):
+        self.send_response(status)
+        if etag is not None:
+            self.send_header('ETag', etag)
+            self.send_header('Cache-Control', 'no-cache')
+        if body is not None:
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        if body is not None:
+            self.wfile.write(body)
+
+    def _sendJson(self, status, value):
+        self._send(status, _encode(value))
+
+    def _sendError(self, status, message):
+        self._sendJson(status, {'error': message})
+
+    def _readJson(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        if not length:
+            return {}
+        value = json.loads(self.rfile.read(length).decode('utf-8'))
+        if not isinstance(value, dict):
+            raise ValueError("Expected a JSON object.")
+        return value
+
+    def do_GET(self):
+        name, resource = self._route()
+        if resource not in RESOURCES:
+            self._sendError(404, "Not found.")
+            return
+
+        cache = self.server.cache
+        try:
+            # The body is read after the stamp in the same transaction, so
+            # it is never older than the stamp it is cached under.
+            with tournament.getBackend().transaction(readonly=True):
+                stamp = tournament.tournamentStamp(name)
+                etag = _etag(stamp)
+                if etag is not None and etag in _tags(
+                        self.headers.get('If-None-Match')):
+                    body = None
+                else:
+                    body = cache.get(name, resource, stamp)
+                    if body is None:
+                        body = _encode(RESOURCES[resource](name))
+                        if etag is not None:
+                            cache.put(name, resource, stamp, body)
+        except ValueError as error:
+            # Raised for unknown tournaments.
+            self._sendError(404, str(error))
+            return
+        except Exception:
+            self._sendInternalError()
+            return
+
+        if body is None:
+            self._send(304, etag=etag)
+        else:
+            self._send(200, body, etag)
+
+    def do_POST(self):
+        name, resource = self._route()
+        actions = {
+            'players': self._registerPlayers,
+            'matches': self._reportMatch,
+            'pairings': self._pairRound,
+        }
+        if resource not in actions:
+            self._sendError(404, "Not found.")
+            return
+
+        try:
+            # Registering players creates the tournament, nothing else does.
+            if resource != 'players' and not tournament.tournamentExists(name):
+                self._sendError(
+                    404, "Tournament {name} does NOT exist.".format(
+                        name=name))
+                return
+            request = self._readJson()
+            status, value = actions[resource](name, request)
+        except ValueError as error:
+            # Also raised for malformed JSON.
+            self._sendError(400, str(error))
+            return
+        except KeyError as error:
+            self._sendError(
+                400, "Missing field {field}.".format(field=error.args[0]))
+            return
+        except psycopg2.IntegrityError as error:
+            # Unknown or unregistered players, or a write the schema refuses.
+            self._sendError(409, error.diag.message_primary or str(error))
+            return
+        except Exception:
+            self._sendInternalError()
+            return
+
+        self._sendJson(status, value)
+
+    def _sendInternalError(self):
+        traceback.print_exc(file=sys.stderr)
+        self._sendError(500, "Internal server error.")
+
+    def _registerPlayers(self, name, request):
+        names = request['names']
+        if not isinstance(names, list):
+            raise ValueError("names should be a list of player names.")
+        already_registered = tournament.registerPlayers(names, name)
+        return 201, {'already_registered': already_registered}
+
+    def _reportMatch(self, name, request):
+        winner = _playerId(request, 'winner')
+        loser = _playerId(request, 'loser')
+        if not tournament.reportMatch(winner, loser, name):
+            return 409, {'error': "These players already met."}
+        return 201, {'recorded': True}
+
+    def _pairRound(self, name, request):
+        pairings = tournament.swissPairings(
+            name, request.get('strategy', 'adjacent'))
+        return 201, _pairingsBody(tournament.currentRound(name), pairings)
+
+    def log_message(self, format, *args):
+        if not self.server.quiet:
+            BaseHTTPRequestHandler.log_message(self, format, *args)
+
+
+class TournamentServer(ThreadingHTTPServer):
+    """An HTTP server for tournament.py, one thread per request.
+
+    Args:
+      address: the (host, port) to listen on; port 0 picks a free one.
+      quiet: do not log requests.
+    """
+
+    daemon_threads = True
+
+    def __init__(self, address, quiet=False):
+        ThreadingHTTPServer.__init__(self, address, TournamentHandler)
+        self.cache = ResponseCache()
+        self.quiet = quiet
+
+
+def _encode(value):
+    return json.dumps(value, sort_keys=True).encode('utf-8')
+
+
+def _etag(stamp):
+    version, round = stamp
+    if version is None:
+        return None
+    return '"{version}-{round}"'.format(version=version, round=round or 0)
+
+
+def _playerId(request, field):
+    value = request[field]
+    # JSON true and false are ints to Python.
+    if not isinstance(value, int) or isinstance(value, bool):
+        raise ValueError("{field} should be a player id.".format(field=field))
+    return value
+
+
+def _tags(header):
+    if not header:
+        return ()
+    return [tag.strip() for tag in header.split(',')]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Serve tournaments over HTTP as JSON.")
+    parser.add_argument('--host', default=DEFAULT_HOST)
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT)
+    parser.add_argument('--database', default=tournament.DATABASE_NAME)
+    args = parser.parse_args(argv)
+
+    tournament.configurePool(args.database)
+    server = TournamentServer((args.host, args.port))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,171 @@
+#!/usr/bin/env python3
+#
+# Test cases for server.py, which needs Python 3 (http.server).
+# Run them on the test database, as tournament_test.py:
+#   python3 server_test.py
+#
+
+from tournament import *
+from server import TournamentServer
+import http.client
+import json
+import threading
+
+def testHttpServer():
+    """
+    Test that the HTTP server answers repeated polls from its cache.
+    """
+    server = TournamentServer(('127.0.0.1', 0), quiet=True)
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+    def request(method, path, body=None, headers={}):
+        connection = http.client.HTTPConnection(*server.server_address)
+        try:
+            connection.request(method, path, body and json.dumps(body),
+                               headers)
+            response = connection.getresponse()
+            data = response.read()
+            return (response.status, response.getheader('ETag'),
+                    json.loads(data.decode('utf-8')) if data else None)
+        finally:
+            connection.close()
+    try:
+        status, etag, body = request('POST', '/tournaments/HTTP%20Cup/players',
+                                     {'names': ["Http A", "Http B"]})
+        if status != 201 or body != {'already_registered': []}:
+            raise ValueError("Players should be registered over HTTP.")
+        status, etag, body = request('POST', '/tournaments/HTTP%20Cup/pairings')
+        [pairing] = body['pairings']
+        if status != 201 or body['round'] != 1:
+            raise ValueError("The first round should be paired over HTTP.")
+        status, etag, standings = request('GET', '/tournaments/HTTP%20Cup/standings')
+        if status != 200 or etag is None or len(standings) != 2:
+            raise ValueError("Standings should be served with an ETag.")
+        aggregator = MetricsAggregator()
+        addMetricsSink(aggregator)
+        try:
+            status, etag2, body = request('GET', '/tournaments/HTTP%20Cup/standings',
+                                          headers={'If-None-Match': etag})
+            if status != 304 or etag2 != etag:
+                raise ValueError("Unchanged standings should not be sent again.")
+            if request('GET', '/tournaments/HTTP%20Cup/standings')[2] != standings:
+                raise ValueError("Cached standings should be served.")
+        finally:
+            removeMetricsSink(aggregator)
+        report = aggregator.dump()
+        if set(report) != set(['tournamentStamp']) or \
+                report['tournamentStamp']['statements_per_call'] != 1:
+            raise ValueError("Cached responses should only read the stamp.")
+        match = {'winner': pairing['id1'], 'loser': pairing['id2']}
+        if request('POST', '/tournaments/HTTP%20Cup/matches', match)[0] != 201 or \
+                request('POST', '/tournaments/HTTP%20Cup/matches', match)[0] != 409:
+            raise ValueError("A pair should be reported once.")
+        status, etag2, body = request('GET', '/tournaments/HTTP%20Cup/standings',
+                                      headers={'If-None-Match': etag})
+        if status != 200 or etag2 == etag or body[0]['wins'] != 1:
+            raise ValueError("Reporting a match should change the standings.")
+        if request('GET', '/tournaments/Nowhere/standings')[0] != 404:
+            raise ValueError("Unknown tournaments should not be found.")
+    finally:
+        server.shutdown()
+        server.server_close()
+    print("1. Standings are served over HTTP with conditional GETs.")
+
+
+def testHttpServerFreshness():
+    """
+    Test that cached responses follow changes made by other writers.
+    """
+    server = TournamentServer(('127.0.0.1', 0), quiet=True)
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+    def get(path, etag=None):
+        connection = http.client.HTTPConnection(*server.server_address)
+        try:
+            connection.request('GET', path, headers=etag and
+                               {'If-None-Match': etag} or {})
+            response = connection.getresponse()
+            data = response.read()
+            return (response.status, response.getheader('ETag'),
+                    json.loads(data.decode('utf-8')) if data else None)
+        finally:
+            connection.close()
+    try:
+        registerPlayers(["Fresh A", "Fresh B", "Fresh C", "Fresh D"],
+                        "HTTP Open")
+        status, etag, standings = get('/tournaments/HTTP%20Open/standings')
+        status, pairings_etag, pairings = get(
+            '/tournaments/HTTP%20Open/pairings')
+        if status != 200 or pairings != {'round': 0, 'pairings': []}:
+            raise ValueError("No round should be paired yet.")
+        # Written here, not through the server. Pairing four players
+        # changes the round but none of the players or matches.
+        [(id1, name1, id2, name2), _] = swissPairings("HTTP Open")
+        status, etag2, pairings = get('/tournaments/HTTP%20Open/pairings',
+                                      pairings_etag)
+        if status != 200 or pairings['round'] != 1 or \
+                len(pairings['pairings']) != 2:
+            raise ValueError("Pairing a round should change the pairings.")
+        reportMatch(id1, id2, "HTTP Open")
+        status, etag2, body = get('/tournaments/HTTP%20Open/standings', etag)
+        if status != 200 or body[0]['id'] != id1 or body[0]['wins'] != 1:
+            raise ValueError("Other writers should change the standings.")
+    finally:
+        server.shutdown()
+        server.server_close()
+    print("2. Cached responses see the changes of other writers.")
+
+
+def testHttpServerErrors():
+    """
+    Test that bad requests get a JSON error and keep the connection.
+    """
+    server = TournamentServer(('127.0.0.1', 0), quiet=True)
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+    def post(path, body):
+        connection = http.client.HTTPConnection(*server.server_address)
+        try:
+            connection.request('POST', path, json.dumps(body))
+            response = connection.getresponse()
+            return response.status, json.loads(
+                response.read().decode('utf-8'))
+        finally:
+            connection.close()
+    try:
+        post('/tournaments/HTTP%20Errors/players',
+             {'names': ["Error A", "Error B"]})
+        [(id1, _, _, _), (id2, _, _, _)] = playerStandings("HTTP Errors")
+        for match in ({'winner': "1 OR 1=1", 'loser': id2},
+                      {'winner': id1, 'loser': 2.5},
+                      {'winner': True, 'loser': id2},
+                      {'winner': id1}):
+            status, body = post('/tournaments/HTTP%20Errors/matches', match)
+            if status != 400 or 'error' not in body:
+                raise ValueError("Malformed ids should be refused.")
+        status, body = post('/tournaments/HTTP%20Errors/matches',
+                            {'winner': id1, 'loser': 2 ** 31 - 1})
+        if status != 409 or 'error' not in body:
+            raise ValueError("Unknown players should be a conflict.")
+        for resource in ('matches', 'pairings'):
+            status, body = post('/tournaments/Nowhere/' + resource,
+                                {'winner': id1, 'loser': id2})
+            if status != 404 or 'error' not in body:
+                raise ValueError("Unknown tournaments should not be found.")
+        if tournamentExists("Nowhere"):
+            raise ValueError("Unknown tournaments should not be created.")
+    finally:
+        server.shutdown()
+        server.server_close()
+    print("3. Bad requests get a JSON error.")
+
+
+if __name__ == '__main__':
+    testHttpServer()
+    testHttpServerFreshness()
+    testHttpServerErrors()
+
+    print("Success!  All tests pass!")
@@ -0,0 +1,281 @@
+#!/usr/bin/env python
+#
+# simulator.py -- Monte Carlo simulation of Swiss tournaments
+#
+# Plays many complete tournaments with the rules of tournament.py
+# (swissPairings, reportMatches and one bye per player, as givePlayerBye)
+# on the in-memory backend, spread over a pool of worker processes, and
+# streams the aggregated statistics back as chunks of simulations finish.
+# No database is touched.
+#
+# Usage:
+#   python simulator.py --players 64 --rounds 6 --simulations 10000 --top 8
+#
+
+import argparse
+import json
+import multiprocessing
+import random
+import sys
+
+import tournament
+from backends import MemoryBackend
+
+# Number of simulations a worker runs before reporting back.
+CHUNK_SIZE = 100
+
+
+class CoinFlip(object):
+    """Every match is a coin flip."""
+
+    def __call__(self, seed1, seed2):
+        return 0.5
+
+
+class StrongerWins(object):
+    """The better seed (lower number) always wins."""
+
+    def __call__(self, seed1, seed2):
+        return 1.0 if seed1 < seed2 else 0.0
+
+
+class Elo(object):
+    """Players are rated by seed and win by the Elo expected score.
+
+    Args:
+      top: rating of seed 1.
+      step: rating points between consecutive seeds.
+    """
+
+    def __init__(self, top=2000, step=10):
+        self.top = top
+        self.step = step
+
+    def __call__(self, seed1, seed2):
+        difference = (seed1 - seed2) * self.step
+        return 1.0 / (1.0 + 10 ** (difference / 400.0))
+
+
+# Outcome models selectable by name. A model is a picklable callable taking
+# the seeds of two players and returning the probability that the first
+# one wins.
+MODELS = {
+    'coin': CoinFlip,
+    'stronger': StrongerWins,
+    'elo': Elo,
+}
+
+
+def maxRounds(players):
+    """Returns the most rounds a field can play.
+
+    Each player gets at most one bye, so with an odd number of players the
+    round after every player has had one cannot be paired. That is a round
+    robin; an even field is held to a round robin too.
+    """
+    return players if players % 2 else players - 1
+
+
+def checkRounds(players, rounds):
+    """Raises ValueError unless players can play rounds rounds."""
+    if rounds > maxRounds(players):
+        raise ValueError(
+            "{players} players can play at most {limit} rounds. Got {rounds}."
+            .format(players=players, limit=maxRounds(players),
+                    rounds=rounds))
+
+
+def simulateTournament(players, rounds, model, rng, strategy='adjacent'):
+    """Plays one tournament on a fresh in-memory backend.
+
+    Args:
+      players: number of players, registered as seeds 1..players.
+      rounds: number of rounds played.
+      model: callable giving the probability the first seed beats the
+        second.
+      rng: a random.Random drawing the match outcomes.
+      strategy: the swissPairings strategy.
+
+    Returns:
+      A tuple (ranking, leader_round): ranking lists the seeds from first
+      to last place (ties on wins broken at random), leader_round is the
+      first round after which a single player led, or None.
+
+    Raises:
+      ValueError: if there are more rounds than maxRounds(players).
+    """
+    checkRounds(players, rounds)
+    tournament.setBackend(MemoryBackend(tournament.MAIN_TOURNAMENT))
+    tournament.registerPlayers(["seed-{}".format(seed)
+                                for seed in range(1, players + 1)])
+    seeds = dict((row[0], int(row[1].split('-')[1]))
+                 for row in tournament.playerStandings())
+
+    leader_round = None
+    for round in range(1, rounds + 1):
+        results = []
+        for (id1, name1, id2, name2) in tournament.swissPairings(
+                strategy=strategy):
+            if rng.random() < model(seeds[id1], seeds[id2]):
+                results.append((id1, id2))
+            else:
+                results.append((id2, id1))
+        tournament.reportMatches(results)
+
+        standings = tournament.playerStandings()
+        if leader_round is None and \
+                (len(standings) == 1 or standings[0][2] > standings[1][2]):
+            leader_round = round
+
+    standings = tournament.playerStandings()
+    standings.sort(key=lambda row: (-row[2], rng.random()))
+
+    return [seeds[row[0]] for row in standings], leader_round
+
+
+def emptyStats(players, top):
+    """Returns the aggregate of zero simulations."""
+    return {
+        'players': players,
+        'top': top,
+        'simulations': 0,
+        # Per seed (index 0 is seed 1): top-N finishes, wins of the event,
+        # sum of final places.
+        'top_finishes': [0] * players,
+        'firsts': [0] * players,
+        'place_sum': [0] * players,
+        # Round after which a single player led, as a string key
+        # ('none' when it never happened), to number of simulations.
+        'leader_rounds': {},
+    }
+
+
+def mergeStats(total, part):
+    """Adds the aggregate part into total and returns total."""
+    total['simulations'] += part['simulations']
+    for key in ('top_finishes', 'firsts', 'place_sum'):
+        total[key] = [a + b for a, b in zip(total[key], part[key])]
+    for round, count in part['leader_rounds'].items():
+        total['leader_rounds'][round] = \
+            total['leader_rounds'].get(round, 0) + count
+
+    return total
+
+
+def summarize(stats):
+    """Adds per-seed rates to an aggregate.
+
+    Returns:
+      A copy of stats with top_rate, first_rate and mean_place lists.
+    """
+    summary = dict(stats)
+    count = float(stats['simulations']) or 1.0
+    summary['top_rate'] = [n / count for n in stats['top_finishes']]
+    summary['first_rate'] = [n / count for n in stats['firsts']]
+    summary['mean_place'] = [n / count for n in stats['place_sum']]
+
+    return summary
+
+
+def _simulateChunk(job):
+    """Runs a chunk of simulations in a worker and returns their aggregate."""
+    players, rounds, top, model, strategy, seed, count = job
+    rng = random.Random(seed)
+    stats = emptyStats(players, top)
+
+    for i in range(count):
+        ranking, leader_round = simulateTournament(
+            players, rounds, model, rng, strategy)
+
+        stats['simulations'] += 1
+        stats['firsts'][ranking[0] - 1] += 1
+        for place, player in enumerate(ranking, 1):
+            stats['place_sum'][player - 1] += place
+            if place <= top:
+                stats['top_finishes'][player - 1] += 1
+        key = 'none' if leader_round is None else str(leader_round)
+        stats['leader_rounds'][key] = stats['leader_rounds'].get(key, 0) + 1
+
+    return stats
+
+
+def simulate(players, rounds, simulations, model=None, top=8,
+             strategy='adjacent', processes=None, seed=0,
+             chunk_size=CHUNK_SIZE):
+    """Runs simulations in a process pool, yielding running aggregates.
+
+    Args:
+      players: number of players per tournament.
+      rounds: number of rounds per tournament.
+      simulations: number of tournaments to play.
+      model: outcome model, see MODELS. Defaults to Elo().
+      top: the N of the top-N finish counted per seed.
+      strategy: the swissPairings strategy.
+      processes: worker processes, defaults to the number of CPUs.
+      seed: seed of the random outcomes; equal seeds give equal results.
+      chunk_size: simulations per worker task.
+
+    Yields:
+      The aggregate of all the simulations finished so far (see emptyStats),
+      once per finished chunk.
+
+    Raises:
+      ValueError: if there are more rounds than maxRounds(players), before
+        any simulation starts.
+    """
+    checkRounds(players, rounds)
+    if model is None:
+        model = Elo()
+
+    jobs = []
+    remaining = simulations
+    while remaining > 0:
+        count = min(chunk_size, remaining)
+        jobs.append((players, rounds, top, model, strategy,
+                     seed * 1000003 + len(jobs), count))
+        remaining -= count
+
+    total = emptyStats(players, top)
+    pool = multiprocessing.Pool(processes)
+    try:
+        for part in pool.imap_unordered(_simulateChunk, jobs):
+            yield mergeStats(total, part)
+    finally:
+        pool.terminate()
+        pool.join()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Simulate many Swiss tournaments.")
+    parser.add_argument('--players', type=int, default=64)
+    parser.add_argument('--rounds', type=int, default=6)
+    parser.add_argument('--simulations', type=int, default=1000)
+    parser.add_argument('--top', type=int, default=8,
+                        help="count top-N finishes per seed")
+    parser.add_argument('--model', default='elo', choices=sorted(MODELS))
+    parser.add_argument('--strategy', default='adjacent',
+                        choices=sorted(tournament.PAIRING_STRATEGIES))
+    parser.add_argument('--processes', type=int)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args(argv)
+
+    if args.rounds > maxRounds(args.players):
+        parser.error("{players} players can play at most {limit} rounds"
+                     .format(players=args.players,
+                             limit=maxRounds(args.players)))
+
+    stats = emptyStats(args.players, args.top)
+    for stats in simulate(args.players, args.rounds, args.simulations,
+                          MODELS[args.model](), args.top, args.strategy,
+                          args.processes, args.seed):
+        sys.stderr.write("{done}/{total} simulations\r".format(
+            done=stats['simulations'], total=args.simulations))
+    sys.stderr.write("\n")
+
+    json.dump(summarize(stats), sys.stdout, indent=2, sort_keys=True)
+    sys.stdout.write("\n")
+
+
+if __name__ == '__main__':
+    main()
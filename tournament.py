@@ -3,13 +3,93 @@
 # tournament.py -- implementation of a Swiss-system tournament
 #
 
+import itertools
+import multiprocessing
+import re
+import threading
+import time
+import weakref
+from collections import OrderedDict
+from contextlib import contextmanager
+
 import psycopg2
+import psycopg2.errorcodes
 from operator import itemgetter
 
-MAIN_TOURNAMENT = 'MAIN_TOURNAMENT'
-
+from backends import TIEBREAKS, Backend, MemoryBackend, SQLiteBackend, \
+    TournamentState, refuseArchived
+from instrumentation import InstrumentedCursor, MetricsAggregator, \
+    addMetricsSink, countCheckout, countConnection, countTransaction, \
+    instrumented, removeMetricsSink
+from pairing import pairPlayers
 
-def connect(database_name="tournament"):
+MAIN_TOURNAMENT = 'MAIN_TOURNAMENT'
+DATABASE_NAME = 'tournament'
+
+# Default connection pool sizing. See configurePool().
+POOL_MIN_SIZE = 1
+POOL_MAX_SIZE = 10
+
+# Seconds during which the reads of a thread that committed a write go to
+# the primary rather than to a replica. See configurePool().
+READ_YOUR_WRITES = 1.0
+
+# Default sizing of the name-to-id caches. See configureCaches().
+CACHE_MAX_SIZE = 4096
+CACHE_TTL = None
+
+# Default number of tournaments whose TournamentState is kept between
+# swissPairings calls. See configureCaches().
+STATE_CACHE_SIZE = 64
+
+# Default number of results (standings, counts, pairing previews) kept
+# along with the tournament version they were computed at. See
+# configureCaches().
+RESULT_CACHE_SIZE = 256
+
+# Default batch size of iterPlayerStandings() and page size of
+# playerStandingsPage().
+STANDINGS_BATCH_SIZE = 1000
+STANDINGS_PAGE_SIZE = 100
+
+# Tournaments paired per task sent to the worker processes of
+# pairNextRounds().
+PAIRING_CHUNK_SIZE = 100
+
+# Queries run often enough to be prepared once per pooled connection and
+# then executed by name, as (parameter types, query). See
+# configureStatements().
+PREPARED_STATEMENTS = {
+    'find_tournament': (
+        "text",
+        "SELECT id FROM Tournaments WHERE name = $1"),
+    'find_player': (
+        "text",
+        "SELECT id FROM Players WHERE name = $1"),
+    # (p1, p2) is the unordered pair of players, (p, p) for a bye.
+    'match_exists': (
+        "int, int, int",
+        "SELECT count(*) FROM Matches WHERE tid = $1 AND " +
+        "p1 = least($2, $3) AND p2 = greatest($2, $3)"),
+    'record_match': (
+        "int, int, int",
+        "INSERT INTO Matches (winner, loser, tid, round) " +
+        "SELECT $1, $2, id, round FROM Tournaments WHERE id = $3 " +
+        "ON CONFLICT (tid, p1, p2) DO NOTHING RETURNING id"),
+    'standings': (
+        "int",
+        "SELECT * FROM PlayerStandings($1)"),
+    'tournament_version': (
+        "int",
+        "SELECT TournamentVersion(id) FROM Tournaments WHERE id = $1"),
+    'tournament_stamp': (
+        "int",
+        "SELECT TournamentVersion(id), round FROM Tournaments " +
+        "WHERE id = $1"),
+}
+
+
+def connect(database_name=DATABASE_NAME):
     """Connect to the PostgreSQL database.  Returns a database connection."""
     try:
         db = psycopg2.connect("dbname={}".format(database_name))
@@ -19,92 +99,1198 @@ def connect(database_name="tournament"):
         print("<error message>")
 
 
-def deleteAllMatches():
-    """Remove all the match records from the database."""
-    db, cursor = connect()
+# Timeouts are measured on a clock that does not jump with the time of day
+# where there is one (Python 3).
+_clock = getattr(time, 'monotonic', time.time)
 
-    # Remove all rows in the Matches table.
-    query = "DELETE FROM Matches"
-    cursor.execute(query)
 
-    db.commit()
-    db.close()
+class PoolTimeout(Exception):
+    """Raised when no pooled connection became available in time."""
 
 
-def deleteMatches(tournament=MAIN_TOURNAMENT):
-    """Remove all the match records from the database."""
-    db, cursor = connect()
+class ConnectionPool(object):
+    """A bounded, thread-safe pool of PostgreSQL connections.
 
-    if tournamentExists(tournament):
-        tid = getTournamentId(tournament)
+    minconn connections are opened by prefill(); more are created lazily
+    up to maxconn. When every connection is checked out, callers block
+    until one is returned (or the optional timeout expires). Returned
+    connections are kept open, idle, so the pool does not shrink below
+    the most connections that were in use at once.
+    """
 
-        query = "DELETE FROM Matches where tid=%s"
-        parameter = (tid,)
-        cursor.execute(query, parameter)
+    def __init__(self, database_name=DATABASE_NAME, minconn=POOL_MIN_SIZE,
+                 maxconn=POOL_MAX_SIZE, dsn=None, **connect_kwargs):
+        if minconn < 0 or maxconn < 1 or minconn > maxconn:
+            raise ValueError(
+                "Invalid pool size: min={min}, max={max}."
+                .format(min=minconn, max=maxconn))
+
+        self.dsn = dsn or "dbname={}".format(database_name)
+        self.connect_kwargs = connect_kwargs
+        self.minconn = minconn
+        self.maxconn = maxconn
+
+        self._idle = []
+        self._in_use = 0
+        self._waiting = 0
+        self._created = 0
+        self._discarded = 0
+        self._closed = False
+        self._cond = threading.Condition(threading.Lock())
+
+    def _newConnection(self):
+        db = psycopg2.connect(self.dsn, **self.connect_kwargs)
+        with self._cond:
+            self._created += 1
+        countConnection()
+        return db
+
+    def getconn(self, timeout=None):
+        """Checks a connection out of the pool.
+
+        Args:
+          timeout: seconds to wait for a free connection, None to wait forever.
+            Wakeups that find no free connection do not extend it.
+
+        Returns:
+          A psycopg2 connection.
+        """
+        countCheckout()
+        deadline = None if timeout is None else _clock() + timeout
+        with self._cond:
+            self._waiting += 1
+            try:
+                while True:
+                    if self._closed:
+                        raise psycopg2.InterfaceError("Pool is closed.")
+                    while self._idle:
+                        db = self._idle.pop()
+                        if db.closed:
+                            self._discarded += 1
+                            continue
+                        self._in_use += 1
+                        return db
+                    if self._in_use < self.maxconn:
+                        # Reserve the slot, connect outside of the lock.
+                        self._in_use += 1
+                        break
+                    if deadline is None:
+                        self._cond.wait()
+                        continue
+                    remaining = deadline - _clock()
+                    if remaining <= 0:
+                        raise PoolTimeout(
+                            "No connection available after {t}s."
+                            .format(t=timeout))
+                    self._cond.wait(remaining)
+            finally:
+                self._waiting -= 1
+
+        try:
+            return self._newConnection()
+        except Exception:
+            with self._cond:
+                self._in_use -= 1
+                self._cond.notify()
+            raise
+
+    def putconn(self, db, close=False):
+        """Returns a connection to the pool.
+
+        Args:
+          db: a connection obtained from getconn().
+          close: discard the connection instead of keeping it idle.
+        """
+        with self._cond:
+            self._in_use -= 1
+            if close or db.closed or self._closed or \
+                    len(self._idle) >= self.maxconn:
+                self._discarded += 1
+                discard = True
+            else:
+                self._idle.append(db)
+                discard = False
+            self._cond.notify()
+
+        if discard and not db.closed:
+            db.close()
+
+    def closeall(self):
+        """Closes every idle connection and refuses further checkouts."""
+        with self._cond:
+            self._closed = True
+            idle, self._idle = self._idle, []
+            self._cond.notify_all()
+
+        for db in idle:
+            if not db.closed:
+                db.close()
+
+    def prefill(self):
+        """Opens connections until minconn are idle."""
+        while True:
+            with self._cond:
+                if self._closed or \
+                        len(self._idle) + self._in_use >= self.minconn:
+                    return
+            db = self._newConnection()
+            with self._cond:
+                self._idle.append(db)
+                self._cond.notify()
+
+    def stats(self):
+        """Returns a snapshot of the pool counters.
+
+        Returns:
+          A dict with the keys in_use, idle, waiting, created, discarded,
+          min_size and max_size.
+        """
+        with self._cond:
+            return {
+                'in_use': self._in_use,
+                'idle': len(self._idle),
+                'waiting': self._waiting,
+                'created': self._created,
+                'discarded': self._discarded,
+                'min_size': self.minconn,
+                'max_size': self.maxconn,
+            }
+
+
+_pool = None
+_pool_lock = threading.Lock()
+_local = threading.local()
+
+# Pools of the read replicas, used in turn for read-only transactions.
+_replicas = []
+_replica_turns = itertools.count()
+_read_your_writes = READ_YOUR_WRITES
+
+
+def configurePool(database_name=DATABASE_NAME, minconn=POOL_MIN_SIZE,
+                  maxconn=POOL_MAX_SIZE, dsn=None, replicas=(),
+                  read_your_writes=READ_YOUR_WRITES, **connect_kwargs):
+    """(Re)creates the module connection pool.
+
+    Any previous pool is closed; connections still checked out from it are
+    discarded when they are returned.
 
-        db.commit()
-        db.close()
-    else:
-        raise ValueError(
-            "Tournament {name} does NOT exist.".format(name=tournament))
+    Args:
+      database_name: name of the database to connect to.
+      minconn: number of connections opened up front.
+      maxconn: maximum number of simultaneous connections, which are all
+        kept open once opened.
+      dsn: full libpq connection string, overrides database_name.
+      replicas: libpq connection strings of read replicas of that
+        database. Read-only transactions are spread over them, each
+        replica having a pool of the same size.
+      read_your_writes: seconds during which a thread that committed a
+        write keeps reading from the primary, so that it sees its writes
+        while the replicas catch up. 0 sends every read to the replicas.
+      connect_kwargs: extra arguments for psycopg2.connect(), such as
+        connection_factory.
 
+    Returns:
+      The new ConnectionPool.
+    """
+    global _pool, _replicas, _read_your_writes
 
-def deleteAllPlayers():
-    """Remove all the player records from the database."""
-    db, cursor = connect()
+    pool = ConnectionPool(database_name, minconn, maxconn, dsn,
+                          **connect_kwargs)
+    replica_pools = [ConnectionPool(minconn=minconn, maxconn=maxconn,
+                                    dsn=replica, **connect_kwargs)
+                     for replica in replicas]
+    with _pool_lock:
+        old, _pool = _pool, pool
+        old_replicas, _replicas = _replicas, replica_pools
+        _read_your_writes = read_your_writes
+    for old_pool in [old] + old_replicas:
+        if old_pool is not None:
+            old_pool.closeall()
+    for new_pool in [pool] + replica_pools:
+        new_pool.prefill()
 
-    # Remove all the rows in PlayersTournaments table.
-    query = "DELETE FROM PlayersTournaments"
-    cursor.execute(query)
+    return pool
 
-    db.commit()
 
-    # Remove all entries in the Players table.
-    query = "DELETE FROM Players"
-    cursor.execute(query)
+def getPool():
+    """Returns the module connection pool, creating it on first use."""
+    global _pool
 
-    db.commit()
-    db.close()
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ConnectionPool()
 
+    return _pool
 
-def deletePlayers(tournament=MAIN_TOURNAMENT):
-    """Remove all the player records from the database."""
-    db, cursor = connect()
 
-    if tournamentExists(tournament):
-        tid = getTournamentId(tournament)
+def poolStats():
+    """Returns the module connection pool counters. See ConnectionPool.stats."""
+    return getPool().stats()
 
-        query = "DELETE FROM PlayersTournaments where tid=%s"
-        parameter = (tid,)
-        cursor.execute(query, parameter)
 
-        db.commit()
-        db.close()
-    else:
-        raise ValueError(
-            "Tournament {name} does NOT exist.".format(name=tournament))
+def replicaStats():
+    """Returns the counters of each replica pool, in configuration order."""
+    return [pool.stats() for pool in _replicas]
 
 
-def countPlayers(tournament=MAIN_TOURNAMENT):
-    """Returns the number of players currently registered."""
-    db, cursor = connect()
+def _readPool():
+    """Returns the pool a read-only transaction of this thread runs on."""
+    replicas = _replicas
+    last_write = getattr(_local, 'last_write', None)
+    if not replicas or (last_write is not None and
+                        time.time() - last_write < _read_your_writes):
+        return getPool()
 
-    if tournamentExists(tournament):
-        tid = getTournamentId(tournament)
+    return replicas[next(_replica_turns) % len(replicas)]
+
+
+@contextmanager
+def transaction(readonly=False):
+    """Checks out a pooled connection and yields a cursor on it.
+
+    The block runs in a single transaction which is committed on success and
+    rolled back on error. Nested calls on the same thread share the outer
+    connection and transaction, so helpers called from a public function do
+    not check out connections of their own.
+
+    Args:
+      readonly: the block does not write. It then runs on a replica, if
+        any, unless this thread is within the read_your_writes window of
+        its last write (see configurePool). Ignored by nested calls.
+    """
+    current = getattr(_local, 'cursor', None)
+    if current is not None:
+        yield current
+        return
+
+    pool = _readPool() if readonly else getPool()
+    db = pool.getconn()
+    broken = False
+    try:
+        cursor = db.cursor(cursor_factory=InstrumentedCursor)
+        _local.cursor = cursor
+        _local.on_rollback = []
+        _local.on_commit = []
+        try:
+            yield cursor
+            db.commit()
+            countTransaction()
+            if not readonly:
+                _local.last_write = time.time()
+        except Exception:
+            if not db.closed:
+                db.rollback()
+                countTransaction()
+            for callback in _local.on_rollback:
+                callback()
+            raise
+        else:
+            for callback in _local.on_commit:
+                callback()
+        finally:
+            _local.cursor = None
+            _local.on_rollback = []
+            _local.on_commit = []
+            cursor.close()
+    except (psycopg2.OperationalError, psycopg2.InterfaceError):
+        broken = True
+        raise
+    finally:
+        pool.putconn(db, close=broken)
+
+
+def onRollback(callback):
+    """Registers callback to run if the current transaction rolls back.
+
+    Used to undo in-process state (such as cached ids) that describes rows
+    written by a transaction which is then abandoned.
+    """
+    if getattr(_local, 'cursor', None) is None:
+        raise RuntimeError("onRollback() called outside of transaction().")
+    _local.on_rollback.append(callback)
+
+
+def onCommit(callback):
+    """Registers callback to run once the current transaction commits.
+
+    Used to share in-process state (such as cached results) computed from
+    rows the transaction wrote, which other transactions must not see
+    before they are committed.
+    """
+    if getattr(_local, 'cursor', None) is None:
+        raise RuntimeError("onCommit() called outside of transaction().")
+    _local.on_commit.append(callback)
+
+
+class LRUCache(object):
+    """A bounded, thread-safe mapping with LRU eviction and optional TTL."""
+
+    def __init__(self, maxsize=CACHE_MAX_SIZE, ttl=CACHE_TTL):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        """Returns the cached value for key, or None if absent or expired."""
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None:
+                value, expires = entry
+                if expires is None or expires > time.time():
+                    # Mark as most recently used.
+                    del self._data[key]
+                    self._data[key] = entry
+                    self.hits += 1
+                    return value
+                del self._data[key]
+            self.misses += 1
+            return None
+
+    def put(self, key, value):
+        """Stores value under key, evicting the least recently used entry."""
+        expires = None if self.ttl is None else time.time() + self.ttl
+        with self._lock:
+            self._data.pop(key, None)
+            self._data[key] = (value, expires)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def invalidate(self, key):
+        """Removes key from the cache, if present."""
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        """Removes every entry from the cache."""
+        with self._lock:
+            self._data.clear()
+
+    def stats(self):
+        """Returns a dict with the keys size, max_size, hits and misses."""
+        with self._lock:
+            return {
+                'size': len(self._data),
+                'max_size': self.maxsize,
+                'hits': self.hits,
+                'misses': self.misses,
+            }
+
+
+class VersionedCache(LRUCache):
+    """An LRUCache of results valid for one version of their tournament.
+
+    An entry cached at another version counts as a miss, and as stale.
+    """
+
+    def __init__(self, maxsize=RESULT_CACHE_SIZE, ttl=CACHE_TTL):
+        super(VersionedCache, self).__init__(maxsize, ttl)
+        self.stale = 0
+
+    def get(self, key, version):
+        """Returns the value cached for key at version, or None."""
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None:
+                (cached_version, value), expires = entry
+                if cached_version == version and \
+                        (expires is None or expires > time.time()):
+                    del self._data[key]
+                    self._data[key] = entry
+                    self.hits += 1
+                    return value
+                del self._data[key]
+                if cached_version != version:
+                    self.stale += 1
+            self.misses += 1
+            return None
+
+    def put(self, key, version, value):
+        """Stores value as the result for key at version."""
+        super(VersionedCache, self).put(key, (version, value))
+
+    def stats(self):
+        """Returns the LRUCache stats plus the number of stale entries."""
+        stats = super(VersionedCache, self).stats()
+        with self._lock:
+            stats['stale'] = self.stale
+        return stats
+
+
+_tournament_ids = LRUCache()
+_player_ids = LRUCache()
+_states = LRUCache(STATE_CACHE_SIZE)
+_results = VersionedCache(RESULT_CACHE_SIZE)
+
+# The worker pools of pairNextRounds(), by number of processes. See
+# _pairingPool().
+_pairing_pools = {}
+_pairing_pools_lock = threading.Lock()
+
+
+def _cacheNewId(cache, name, id):
+    """Caches the id of a row inserted by the current transaction."""
+    cache.put(name, id)
+    getBackend().onRollback(lambda: cache.invalidate(name))
+
+
+def _cacheState(state):
+    """Keeps the state loaded by the current transaction for its round,
+    once the transaction commits."""
+    getBackend().onCommit(lambda: _states.put(state.tid, state))
+
+
+def _currentState(tid, version):
+    """Returns the cached state of a tournament if it is at version.
+
+    A state behind the tournament's version (changed by another process)
+    is dropped. States of backends keeping no versions are always current.
+    """
+    state = _states.get(tid)
+    if state is not None and state.version != version:
+        _states.invalidate(tid)
+        return None
+
+    return state
+
+
+def _recordInState(tid, results):
+    """Counts the (winner, loser) results in the cached state, if any.
+
+    Called after the statement recording them, which added one to the
+    tournament's version: the state is stamped one version later, and kept
+    away from other transactions until this one commits. Other writers
+    may commit meanwhile; the tournament's version is then past the
+    state's, and the next reader drops it.
+    """
+    state = _states.get(tid)
+    if state is None or not results:
+        return
+
+    _states.invalidate(tid)
+    for winner, loser in results:
+        state.recordMatch(winner, loser)
+    if state.version is not None:
+        state.version += 1
+    getBackend().onCommit(lambda: _states.put(tid, state))
+
+
+def _cachedResult(backend, tid, version, key, compute):
+    """Returns compute(), cached for the current version of a tournament.
+
+    The version must be read in the caller's transaction, so that the
+    result and the version it is cached at come from the same snapshot.
+    Backends without versions (see Backend.tournamentVersion) are not
+    cached.
+    """
+    if version is None:
+        return compute()
+
+    key = (tid,) + key
+    value = _results.get(key, version)
+    if value is None:
+        value = compute()
+        # Writes of this transaction may be counted in version, which
+        # another writer's commit can reach first.
+        backend.onCommit(lambda: _results.put(key, version, value))
+
+    return value
+
+
+def configureCaches(maxsize=CACHE_MAX_SIZE, ttl=CACHE_TTL,
+                    states=STATE_CACHE_SIZE, results=RESULT_CACHE_SIZE):
+    """Resizes the tournament and player name-to-id caches.
+
+    Args:
+      maxsize: maximum number of names kept per cache.
+      ttl: seconds an entry stays valid, None to keep it until evicted.
+      states: maximum number of tournament states kept.
+      results: maximum number of versioned results kept.
+    """
+    global _tournament_ids, _player_ids, _states, _results
+
+    _tournament_ids = LRUCache(maxsize, ttl)
+    _player_ids = LRUCache(maxsize, ttl)
+    _states = LRUCache(states, ttl)
+    _results = VersionedCache(results, ttl)
+
+
+def clearCaches():
+    """Empties the name-to-id caches, tournament states and results."""
+    _tournament_ids.clear()
+    _player_ids.clear()
+    _states.clear()
+    _results.clear()
+
+
+def cacheStats():
+    """Returns the counters of the name-to-id, state and result caches."""
+    return {
+        'tournaments': _tournament_ids.stats(),
+        'players': _player_ids.stats(),
+        'states': _states.stats(),
+        'results': _results.stats(),
+    }
+
+
+class Statement(object):
+    """The SQL sent to run one of the PREPARED_STATEMENTS."""
+
+    def __init__(self, name, types, query):
+        self.name = name
+        placeholders = ", ".join(["%s"] * len(types.split(",")))
+        self.prepare = "PREPARE {name} ({types}) AS {query}".format(
+            name=name, types=types, query=query)
+        self.execute = "EXECUTE {name} ({placeholders})".format(
+            name=name, placeholders=placeholders)
+        # The query sent as text when prepared statements are turned off.
+        self.text = re.sub(r"\$\d+", "%s", query)
+        self.order = [int(n) - 1 for n in re.findall(r"\$(\d+)", query)]
+
+
+_statements = dict((name, Statement(name, types, query))
+                   for name, (types, query) in PREPARED_STATEMENTS.items())
+_use_prepared = True
+# Names prepared on each connection. The entry of a connection goes away
+# with it, so the connections the pool opens to replace closed or broken
+# ones prepare the statements again on first use.
+_prepared = weakref.WeakKeyDictionary()
+_prepared_lock = threading.Lock()
+
+
+def configureStatements(prepared=True):
+    """Turns executing the PREPARED_STATEMENTS by name on or off.
+
+    Turn them off when connecting through a pooler which does not keep
+    sessions to one client, such as pgbouncer in transaction mode; the
+    queries are then sent as text and planned on every call.
+    """
+    global _use_prepared
+
+    _use_prepared = prepared
+
+
+def executeStatement(cursor, name, parameter):
+    """Runs one of the PREPARED_STATEMENTS on cursor.
+
+    The first use on a connection prepares the statement first. PREPARE is
+    not undone by a rollback, so the statement is recorded as prepared as
+    soon as that succeeds, even if running it then fails. If the server no
+    longer knows the statement (after a DISCARD ALL or DEALLOCATE), the
+    error is raised and every statement is prepared again on the
+    connection's next use.
+
+    Args:
+      cursor: a cursor from transaction().
+      name: a key of PREPARED_STATEMENTS.
+      parameter: the values of $1, $2, ... in order.
+    """
+    statement = _statements[name]
+    if not _use_prepared:
+        cursor.execute(statement.text,
+                       tuple(parameter[i] for i in statement.order))
+        return
+
+    db = cursor.connection
+    with _prepared_lock:
+        prepared = _prepared.setdefault(db, set())
+        is_prepared = name in prepared
+
+    if not is_prepared:
+        cursor.execute(statement.prepare)
+        with _prepared_lock:
+            prepared.add(name)
+
+    try:
+        cursor.execute(statement.execute, parameter)
+    except psycopg2.Error as e:
+        if e.pgcode == psycopg2.errorcodes.INVALID_SQL_STATEMENT_NAME:
+            with _prepared_lock:
+                _prepared.pop(db, None)
+        raise
+
+
+@contextmanager
+def _refusingArchived(tid):
+    """Turns writes to the dropped partitions of tid into a ValueError.
+
+    Partitions are only dropped by archiving (or deleting) their
+    tournament, and a row for a tournament without partitions fails to
+    route with a check violation.
+    """
+    try:
+        yield
+    except psycopg2.IntegrityError as e:
+        if e.pgcode != psycopg2.errorcodes.CHECK_VIOLATION:
+            raise
+        refuseArchived(tid)
+
+
+class PostgresBackend(Backend):
+    """Stores tournaments in PostgreSQL through the module connection pool.
+
+    Uses the schema built by tournament.sql and the migrations/ scripts.
+    """
+
+    def transaction(self, readonly=False):
+        return transaction(readonly)
+
+    def onRollback(self, callback):
+        onRollback(callback)
+
+    def onCommit(self, callback):
+        onCommit(callback)
+
+    def close(self):
+        getPool().closeall()
+        for pool in _replicas:
+            pool.closeall()
+
+    def _value(self, query, parameter, readonly=False):
+        with transaction(readonly) as cursor:
+            cursor.execute(query, parameter)
+            row = cursor.fetchone()
+
+        return row[0] if row is not None else None
+
+    def _preparedValue(self, name, parameter):
+        # Every prepared statement but record_match only reads.
+        with transaction(readonly=True) as cursor:
+            executeStatement(cursor, name, parameter)
+            row = cursor.fetchone()
+
+        return row[0] if row is not None else None
+
+    def findTournament(self, name):
+        return self._preparedValue('find_tournament', (name,))
+
+    def tournamentVersion(self, tid):
+        return self._preparedValue('tournament_version', (tid,))
+
+    def tournamentStamp(self, tid):
+        with transaction(readonly=True) as cursor:
+            executeStatement(cursor, 'tournament_stamp', (tid,))
+            return cursor.fetchone()
+
+    def tournamentVersions(self, tids):
+        with transaction(readonly=True) as cursor:
+            query = "SELECT id, TournamentVersion(id) FROM Tournaments " +\
+                    "WHERE id = ANY(%s)"
+            parameter = (list(tids),)
+            cursor.execute(query, parameter)
+
+            return dict(cursor.fetchall())
+
+    def findTournaments(self, names):
+        with transaction(readonly=True) as cursor:
+            query = "SELECT name, id FROM Tournaments WHERE name = ANY(%s)"
+            parameter = (list(names),)
+            cursor.execute(query, parameter)
+
+            return dict(cursor.fetchall())
+
+    def createTournament(self, name):
+        # Another process may create it first, outside our transaction.
+        query = "WITH created AS (" +\
+                "INSERT INTO Tournaments (name) VALUES (%s) " +\
+                "ON CONFLICT (name) DO NOTHING RETURNING id) " +\
+                "SELECT id FROM created " +\
+                "UNION ALL SELECT id FROM Tournaments WHERE name = %s"
+        parameter = (name, name)
+        return self._value(query, parameter)
+
+    def findPlayer(self, name):
+        return self._preparedValue('find_player', (name,))
 
+    def createPlayer(self, name):
+        query = "INSERT INTO Players (name) VALUES (%s) RETURNING id"
+        parameter = (name,)
+        return self._value(query, parameter)
+
+    def isEnrolled(self, pid, tid):
+        query = "SELECT count(*) FROM PlayersTournaments " +\
+                "WHERE pid = %s and tid = %s"
+        parameter = ((pid,), (tid,))
+        return self._value(query, parameter, readonly=True) > 0
+
+    def enroll(self, pid, tid):
+        with _refusingArchived(tid), transaction() as cursor:
+            query = "INSERT INTO PlayersTournaments (pid, tid) " +\
+                    "VALUES (%s, %s)"
+            parameter = ((pid,), (tid,))
+            cursor.execute(query, parameter)
+
+    def enrollMany(self, names, tid):
+        with _refusingArchived(tid), transaction() as cursor:
+            # Insert the players missing from the Players table, once each.
+            query = "INSERT INTO Players (name) " +\
+                    "SELECT DISTINCT r.name " +\
+                    "FROM unnest(%s::text[]) AS r(name) " +\
+                    "WHERE NOT EXISTS " +\
+                    "(SELECT 1 FROM Players AS p WHERE p.name = r.name)"
+            parameter = (names,)
+            cursor.execute(query, parameter)
+
+            # Enroll every roster player not yet in the tournament and
+            # report which ones were enrolled by this statement.
+            query = "WITH roster AS (" +\
+                    "SELECT DISTINCT ON (r.name) r.name, p.id " +\
+                    "FROM unnest(%s::text[]) AS r(name) " +\
+                    "JOIN Players AS p ON p.name = r.name " +\
+                    "ORDER BY r.name, p.id), " +\
+                    "enrolled AS (" +\
+                    "INSERT INTO PlayersTournaments (pid, tid) " +\
+                    "SELECT roster.id, %s FROM roster WHERE NOT EXISTS " +\
+                    "(SELECT 1 FROM PlayersTournaments AS pt " +\
+                    "WHERE pt.pid = roster.id AND pt.tid = %s) " +\
+                    "RETURNING pid) " +\
+                    "SELECT roster.name, roster.id, " +\
+                    "enrolled.pid IS NOT NULL " +\
+                    "FROM roster LEFT JOIN enrolled " +\
+                    "ON enrolled.pid = roster.id"
+            parameter = (names, tid, tid)
+            cursor.execute(query, parameter)
+
+            return cursor.fetchall()
+
+    def countPlayers(self, tid):
         query = "SELECT count(*) FROM PlayersTournaments where tid=%s"
         parameter = (tid,)
-        cursor.execute(query, parameter)
-        count = cursor.fetchone()[0]
+        return self._value(query, parameter, readonly=True)
+
+    def deleteMatches(self, tid=None):
+        with transaction() as cursor:
+            if tid is None:
+                # Remove all rows in the Matches table, and the rounds.
+                # TRUNCATE fires no triggers: reset the stats as well.
+                cursor.execute("TRUNCATE Matches")
+                cursor.execute("UPDATE PlayerStats SET wins = 0, " +
+                               "losses = 0, has_had_bye = false " +
+                               "WHERE wins <> 0 OR losses <> 0 " +
+                               "OR has_had_bye")
+                cursor.execute("DELETE FROM RoundStandings")
+                cursor.execute("DELETE FROM RoundPairings")
+                cursor.execute("UPDATE Tournaments SET round = 0 " +
+                               "WHERE round <> 0")
+            else:
+                # Truncates the tournament's partition.
+                parameter = (tid,)
+                cursor.execute("SELECT DeleteTournamentMatches(%s)",
+                               parameter)
+                cursor.execute("DELETE FROM RoundStandings where tid=%s",
+                               parameter)
+                cursor.execute("DELETE FROM RoundPairings where tid=%s",
+                               parameter)
+                cursor.execute("UPDATE Tournaments SET round = 0 " +
+                               "WHERE id=%s", parameter)
+
+    def deletePlayers(self, tid=None):
+        with transaction() as cursor:
+            if tid is None:
+                # Remove all the rows in PlayersTournaments table.
+                cursor.execute("DELETE FROM PlayersTournaments")
+                cursor.execute("DELETE FROM ArchivedStandings")
+
+                # Remove all entries in the Players table.
+                cursor.execute("DELETE FROM Players")
+            else:
+                query = "DELETE FROM PlayersTournaments where tid=%s"
+                parameter = (tid,)
+                cursor.execute(query, parameter)
+
+    def standings(self, tid):
+        with transaction(readonly=True) as cursor:
+            executeStatement(cursor, 'standings', (tid,))
+            return cursor.fetchall()
+
+    def standingsPage(self, tid, after, limit):
+        after_wins, after_id = after if after is not None else (None, None)
+
+        with transaction(readonly=True) as cursor:
+            query = "SELECT * FROM PlayerStandingsPage(%s, %s, %s, %s)"
+            parameter = (tid, after_wins, after_id, limit)
+            cursor.execute(query, parameter)
+
+            return cursor.fetchall()
+
+    def iterStandings(self, tid, batch_size):
+        # A server-side cursor on a connection of its own: rows are sent
+        # batch_size at a time, and the open transaction is not shared with
+        # whatever the caller does between batches.
+        pool = _readPool()
+        db = pool.getconn()
+        broken = False
+        try:
+            cursor = db.cursor('standings', cursor_factory=InstrumentedCursor)
+            query = "SELECT * FROM PlayerStandingsPage(%s, NULL, NULL, NULL)"
+            parameter = (tid,)
+            cursor.execute(query, parameter)
+
+            while True:
+                rows = cursor.fetchmany(batch_size)
+                if not rows:
+                    break
+                for row in rows:
+                    yield row
+        except (psycopg2.OperationalError, psycopg2.InterfaceError):
+            broken = True
+            raise
+        finally:
+            # Nothing was written: rolling back ends the transaction and
+            # drops the cursor, also when the caller stops iterating early.
+            if not broken and not db.closed:
+                db.rollback()
+            pool.putconn(db, close=broken)
+
+    def results(self, tid):
+        with transaction(readonly=True) as cursor:
+            query = "SELECT winner, loser FROM Matches WHERE tid = %s " +\
+                    "ORDER BY id"
+            parameter = (tid,)
+            cursor.execute(query, parameter)
+
+            return cursor.fetchall()
+
+    def loadState(self, tid):
+        return self.loadStates([tid])[tid]
+
+    def loadStates(self, tids):
+        parameter = (list(tids),)
+        with transaction(readonly=True) as cursor:
+            # Each query filters Matches and PlayerStats on the tids
+            # themselves, not on a join, so that only the partitions of
+            # these tournaments are planned and scanned.
+            query = "SELECT id, round, TournamentVersion(id) " +\
+                    "FROM Tournaments WHERE id = ANY(%s)"
+            cursor.execute(query, parameter)
+            rounds = cursor.fetchall()
+
+            query = "SELECT s.tid, array_agg(s.pid ORDER BY s.pid), " +\
+                    "array_agg(p.name ORDER BY s.pid), " +\
+                    "array_agg(s.wins ORDER BY s.pid), " +\
+                    "array_agg(s.losses ORDER BY s.pid) " +\
+                    "FROM PlayerStats AS s " +\
+                    "JOIN Players AS p ON p.id = s.pid " +\
+                    "WHERE s.tid = ANY(%s) GROUP BY s.tid"
+            cursor.execute(query, parameter)
+            players = dict((row[0], zip(*row[1:]))
+                           for row in cursor.fetchall())
+
+            query = "SELECT tid, array_agg(winner), array_agg(loser) " +\
+                    "FROM Matches WHERE tid = ANY(%s) GROUP BY tid"
+            cursor.execute(query, parameter)
+            results = dict((row[0], zip(*row[1:]))
+                           for row in cursor.fetchall())
+
+        return dict((tid, TournamentState(tid, round, players.get(tid, ()),
+                                          results.get(tid, ()), version))
+                    for tid, round, version in rounds)
+
+    def tiebreakStandings(self, tid, tiebreaks):
+        # Names are checked against TIEBREAKS, so they are safe to inline.
+        columns = "".join(", {name}".format(name=name)
+                          for name in tiebreaks)
+        order = "".join(" {name} DESC,".format(name=name)
+                        for name in tiebreaks)
+
+        with transaction(readonly=True) as cursor:
+            query = "SELECT id, name, wins, losses" + columns +\
+                    " FROM PlayerTiebreaks(%s) " +\
+                    "ORDER BY wins DESC," + order + " id ASC"
+            parameter = (tid,)
+            cursor.execute(query, parameter)
+
+            return cursor.fetchall()
+
+    def matchExists(self, winner, loser, tid):
+        parameter = (tid, winner, loser)
+        return self._preparedValue('match_exists', parameter) > 0
+
+    def recordMatch(self, winner, loser, tid):
+        with _refusingArchived(tid), transaction() as cursor:
+            # Insert winner/loser record, unless the pair already met.
+            executeStatement(cursor, 'record_match', (winner, loser, tid))
+
+            return cursor.fetchone() is not None
+
+    def recordMatches(self, results, tid):
+        winners = [winner for winner, loser in results]
+        losers = [loser for winner, loser in results]
+
+        with _refusingArchived(tid), transaction() as cursor:
+            # Insert the first occurrence of each unordered pair in the
+            # batch, skip the pairs already played and return the
+            # positions in the batch of the matches inserted.
+            query = "WITH batch AS (" +\
+                    "SELECT DISTINCT ON (p1, p2) " +\
+                    "ord, winner, loser, p1, p2 " +\
+                    "FROM unnest(%s::int[], %s::int[]) " +\
+                    "WITH ORDINALITY AS b(winner, loser, ord), " +\
+                    "LATERAL (SELECT least(winner, loser), " +\
+                    "greatest(winner, loser)) AS pair(p1, p2) " +\
+                    "ORDER BY p1, p2, ord), " +\
+                    "inserted AS (" +\
+                    "INSERT INTO Matches (winner, loser, tid, round) " +\
+                    "SELECT winner, loser, t.id, t.round " +\
+                    "FROM batch, Tournaments AS t WHERE t.id = %s " +\
+                    "ORDER BY ord " +\
+                    "ON CONFLICT (tid, p1, p2) DO NOTHING " +\
+                    "RETURNING p1, p2) " +\
+                    "SELECT ord FROM batch JOIN inserted USING (p1, p2)"
+            parameter = (winners, losers, tid)
+            cursor.execute(query, parameter)
+            recorded = set(row[0] for row in cursor.fetchall())
+
+        return [index + 1 in recorded for index in range(len(results))]
+
+    def playedPairs(self, tid):
+        with transaction(readonly=True) as cursor:
+            query = "SELECT least(winner, loser), " +\
+                    "greatest(winner, loser) " +\
+                    "FROM Matches WHERE tid = %s AND winner <> loser"
+            parameter = (tid,)
+            cursor.execute(query, parameter)
+
+            return set(cursor.fetchall())
+
+    def nextByePlayer(self, tid):
+        query = "SELECT pid FROM PlayersWithoutBye WHERE tid=%s LIMIT 1"
+        parameter = (tid,)
+        return self._value(query, parameter, readonly=True)
+
+    def currentRound(self, tid):
+        query = "SELECT round FROM Tournaments WHERE id = %s"
+        parameter = (tid,)
+        return self._value(query, parameter, readonly=True)
+
+    def startRound(self, tid):
+        query = "UPDATE Tournaments SET round = round + 1 WHERE id = %s " +\
+                "RETURNING round"
+        parameter = (tid,)
+        return self._value(query, parameter)
+
+    def startRounds(self, tids):
+        with transaction() as cursor:
+            query = "UPDATE Tournaments SET round = round + 1 " +\
+                    "WHERE id = ANY(%s) RETURNING id, round"
+            parameter = (list(tids),)
+            cursor.execute(query, parameter)
+
+            return dict(cursor.fetchall())
+
+    def saveStandings(self, tid, round):
+        with transaction() as cursor:
+            query = "INSERT INTO RoundStandings " +\
+                    "(tid, round, pid, wins, losses) " +\
+                    "SELECT tid, %s, pid, wins, losses FROM PlayerStats " +\
+                    "WHERE tid = %s ON CONFLICT DO NOTHING"
+            parameter = (round, tid)
+            cursor.execute(query, parameter)
+
+    def saveStandingsMany(self, rounds):
+        with transaction() as cursor:
+            query = "INSERT INTO RoundStandings " +\
+                    "(tid, round, pid, wins, losses) " +\
+                    "SELECT s.tid, r.round, s.pid, s.wins, s.losses " +\
+                    "FROM unnest(%s::int[], %s::int[]) AS r(tid, round) " +\
+                    "JOIN PlayerStats AS s ON s.tid = r.tid " +\
+                    "ON CONFLICT DO NOTHING"
+            parameter = (list(rounds), [rounds[tid] for tid in rounds])
+            cursor.execute(query, parameter)
+
+    def recordByes(self, byes):
+        with transaction() as cursor:
+            query = "INSERT INTO Matches (winner, loser, tid, round) " +\
+                    "SELECT b.pid, b.pid, t.id, t.round " +\
+                    "FROM unnest(%s::int[], %s::int[]) AS b(tid, pid) " +\
+                    "JOIN Tournaments AS t ON t.id = b.tid " +\
+                    "ON CONFLICT (tid, p1, p2) DO NOTHING"
+            parameter = (list(byes), [byes[tid] for tid in byes])
+            cursor.execute(query, parameter)
+
+    def savePairings(self, tid, round, pairs):
+        with transaction() as cursor:
+            query = "INSERT INTO RoundPairings " +\
+                    "(tid, round, board, pid1, pid2) " +\
+                    "SELECT %s, %s, board, pid1, pid2 " +\
+                    "FROM unnest(%s::int[], %s::int[]) " +\
+                    "WITH ORDINALITY AS p(pid1, pid2, board)"
+            parameter = (tid, round, [pair[0] for pair in pairs],
+                         [pair[1] for pair in pairs])
+            cursor.execute(query, parameter)
+
+    def savePairingsMany(self, pairings):
+        tids = []
+        rounds = []
+        boards = []
+        pids1 = []
+        pids2 = []
+        for tid, (round, pairs) in pairings.items():
+            for board, (pid1, pid2) in enumerate(pairs, 1):
+                tids.append(tid)
+                rounds.append(round)
+                boards.append(board)
+                pids1.append(pid1)
+                pids2.append(pid2)
+
+        with transaction() as cursor:
+            query = "INSERT INTO RoundPairings " +\
+                    "(tid, round, board, pid1, pid2) " +\
+                    "SELECT * FROM unnest(%s::int[], %s::int[], " +\
+                    "%s::int[], %s::int[], %s::int[])"
+            parameter = (tids, rounds, boards, pids1, pids2)
+            cursor.execute(query, parameter)
+
+    def archiveTournament(self, tid):
+        query = "SELECT ArchiveTournament(%s)"
+        parameter = (tid,)
+        return self._value(query, parameter)
 
-        db.close()
+    def archivedStandings(self, tid):
+        with transaction(readonly=True) as cursor:
+            query = "SELECT p.id, p.name, s.wins, s.losses " +\
+                    "FROM ArchivedStandings AS s " +\
+                    "JOIN Players AS p ON p.id = s.pid " +\
+                    "WHERE s.tid = %s ORDER BY s.wins DESC, s.pid ASC"
+            parameter = (tid,)
+            cursor.execute(query, parameter)
 
-        return count
-    else:
-        raise ValueError(
-            "Tournament {name} does NOT exist.".format(name=tournament))
+            return cursor.fetchall()
+
+    def roundStandings(self, tid, round):
+        with transaction(readonly=True) as cursor:
+            query = "SELECT p.id, p.name, s.wins, s.losses " +\
+                    "FROM RoundStandings AS s " +\
+                    "JOIN Players AS p ON p.id = s.pid " +\
+                    "WHERE s.tid = %s AND s.round = %s " +\
+                    "ORDER BY s.wins DESC, s.pid ASC"
+            parameter = (tid, round)
+            cursor.execute(query, parameter)
+
+            return cursor.fetchall()
+
+    def roundPairings(self, tid, round):
+        with transaction(readonly=True) as cursor:
+            query = "SELECT r.pid1, p1.name, r.pid2, p2.name " +\
+                    "FROM RoundPairings AS r " +\
+                    "JOIN Players AS p1 ON p1.id = r.pid1 " +\
+                    "JOIN Players AS p2 ON p2.id = r.pid2 " +\
+                    "WHERE r.tid = %s AND r.round = %s ORDER BY r.board"
+            parameter = (tid, round)
+            cursor.execute(query, parameter)
+
+            return cursor.fetchall()
+
+
+_backend = None
+
+
+def setBackend(backend):
+    """Selects the storage backend used by every public function.
+
+    The name-to-id caches are emptied since ids are backend specific.
+
+    Args:
+      backend: a backends.Backend, e.g. PostgresBackend(),
+        backends.MemoryBackend(MAIN_TOURNAMENT) or
+        backends.SQLiteBackend(main_tournament=MAIN_TOURNAMENT).
+
+    Returns:
+      The previous backend.
+    """
+    global _backend
+
+    previous, _backend = _backend, backend
+    clearCaches()
+
+    return previous
+
+
+def getBackend():
+    """Returns the storage backend, PostgresBackend unless set otherwise."""
+    global _backend
+
+    if _backend is None:
+        _backend = PostgresBackend()
+
+    return _backend
+
+
+@instrumented
+def deleteAllMatches():
+    """Remove all the match records from the database."""
+    getBackend().deleteMatches()
+
+    _states.clear()
+
+
+@instrumented
+def deleteMatches(tournament=MAIN_TOURNAMENT):
+    """Remove all the match records from the database."""
+    backend = getBackend()
+    with backend.transaction():
+        if tournamentExists(tournament):
+            tid = getTournamentId(tournament)
+
+            backend.deleteMatches(tid)
+
+            _tournament_ids.invalidate(tournament)
+            _states.invalidate(tid)
+        else:
+            raise ValueError(
+                "Tournament {name} does NOT exist.".format(name=tournament))
+
+
+@instrumented
+def deleteAllPlayers():
+    """Remove all the player records from the database."""
+    getBackend().deletePlayers()
+
+    _player_ids.clear()
+    _states.clear()
 
 
+@instrumented
+def deletePlayers(tournament=MAIN_TOURNAMENT):
+    """Remove all the player records from the database."""
+    backend = getBackend()
+    with backend.transaction():
+        if tournamentExists(tournament):
+            tid = getTournamentId(tournament)
+
+            backend.deletePlayers(tid)
+
+            _tournament_ids.invalidate(tournament)
+            _states.invalidate(tid)
+        else:
+            raise ValueError(
+                "Tournament {name} does NOT exist.".format(name=tournament))
+
+
+@instrumented
+def countPlayers(tournament=MAIN_TOURNAMENT):
+    """Returns the number of players currently registered."""
+    backend = getBackend()
+    with backend.transaction(readonly=True):
+        if tournamentExists(tournament):
+            tid = getTournamentId(tournament)
+
+            version = backend.tournamentVersion(tid)
+            state = _currentState(tid, version)
+            if state is not None:
+                return state.countPlayers()
+            return _cachedResult(backend, tid, version, ('count',),
+                                 lambda: backend.countPlayers(tid))
+        else:
+            raise ValueError(
+                "Tournament {name} does NOT exist.".format(name=tournament))
+
+
+@instrumented
 def playerExists(name):
     """Checks if a player exists or not already.
 
@@ -114,18 +1300,10 @@ def playerExists(name):
     Returns:
       True, if player exists already. Otherwise, false.
     """
-    db, cursor = connect()
-
-    query = "SELECT count(*) FROM Players WHERE name = %s"
-    parameter = (name,)
-    cursor.execute(query, parameter)
-    count = cursor.fetchone()[0]
-
-    db.close()
-
-    return count
+    return _lookupPlayerId(name) is not None
 
 
+@instrumented
 def playerExistsInTournament(pid, tid):
     """Checks if a player exists or not already.
 
@@ -135,19 +1313,21 @@ def playerExistsInTournament(pid, tid):
     Returns:
       True, if player exists already. Otherwise, false.
     """
-    db, cursor = connect()
+    return getBackend().isEnrolled(pid, tid)
 
-    query = "SELECT count(*) FROM PlayersTournaments " +\
-            "WHERE pid = %s and tid = %s"
-    parameter = ((pid,), (tid,))
-    cursor.execute(query, parameter)
-    count = cursor.fetchone()[0]
 
-    db.close()
+def _lookupPlayerId(name):
+    """Returns the id of the named player, or None if there is none."""
+    pid = _player_ids.get(name)
+    if pid is None:
+        pid = getBackend().findPlayer(name)
+        if pid is not None:
+            _player_ids.put(name, pid)
 
-    return count
+    return pid
 
 
+@instrumented
 def getPlayerId(name):
     """Gets player id.
 
@@ -157,18 +1337,26 @@ def getPlayerId(name):
     Returns:
       Player id
     """
-    db, cursor = connect()
+    pid = _lookupPlayerId(name)
+    if pid is None:
+        raise ValueError(
+            "Player {name} does NOT exist.".format(name=name))
 
-    query = "SELECT id FROM Players WHERE name = %s"
-    parameter = (name,)
-    cursor.execute(query, parameter)
-    pid = cursor.fetchone()[0]
+    return pid
 
-    db.close()
 
-    return pid
+def _lookupTournamentId(name):
+    """Returns the id of the named tournament, or None if there is none."""
+    tid = _tournament_ids.get(name)
+    if tid is None:
+        tid = getBackend().findTournament(name)
+        if tid is not None:
+            _tournament_ids.put(name, tid)
+
+    return tid
 
 
+@instrumented
 def tournamentExists(name):
     """Checks if a tournament exists or not already.
 
@@ -178,18 +1366,10 @@ def tournamentExists(name):
     Returns:
       True, if tournament exists already. Otherwise, false.
     """
-    db, cursor = connect()
-
-    query = "SELECT count(*) FROM Tournaments WHERE name = %s"
-    parameter = (name,)
-    cursor.execute(query, parameter)
-    count = cursor.fetchone()[0]
-
-    db.close()
-
-    return count
+    return _lookupTournamentId(name) is not None
 
 
+@instrumented
 def getTournamentId(name):
     """Gets the tournament id.
 
@@ -199,18 +1379,31 @@ def getTournamentId(name):
     Returns:
       Tournament id.
     """
-    db, cursor = connect()
+    tid = _lookupTournamentId(name)
+    if tid is None:
+        raise ValueError(
+            "Tournament {name} does NOT exist.".format(name=name))
 
-    query = "SELECT id FROM Tournaments WHERE name = %s"
-    parameter = (name,)
-    cursor.execute(query, parameter)
-    tid = cursor.fetchone()[0]
+    return tid
 
-    db.close()
 
-    return tid
+def _ensureTournament(name):
+    """Creates the named tournament unless it exists, and caches its id.
 
+    Called before the transaction of the caller is opened, so that the
+    tournament is created and committed in a short transaction of its own:
+    on PostgreSQL, creating the partitions of a tournament locks Players
+    and the partitioned tables (see migrations/008_partitions.sql) until
+    commit, which would hold up every registration until the caller's
+    transaction ended. Within an outer transaction, it shares that one.
+    """
+    if _lookupTournamentId(name) is None:
+        backend = getBackend()
+        with backend.transaction():
+            _cacheNewId(_tournament_ids, name, backend.createTournament(name))
 
+
+@instrumented
 def registerPlayer(name, tournament=MAIN_TOURNAMENT):
     """Adds a player to the tournament database.
 
@@ -221,47 +1414,72 @@ def registerPlayer(name, tournament=MAIN_TOURNAMENT):
       name: the player's full name (need not be unique).
       tournament: name of the tournament where the player is participating.
     """
-    db, cursor = connect()
+    backend = getBackend()
+    _ensureTournament(tournament)
+    with backend.transaction():
+        # Make sure the player doesn't exist in the Players table
+        if playerExists(name) == False:
+            _cacheNewId(_player_ids, name, backend.createPlayer(name))
 
-    # Create tournament if it doesn't exist
-    if tournamentExists(tournament) == False:
-        query = "INSERT INTO Tournaments (name) VALUES (%s)"
-        parameter = (tournament,)
-        cursor.execute(query, parameter)
+        # Get player id
+        pid = getPlayerId(name)
 
-        db.commit()
+        # Get tournament id
+        tid = getTournamentId(tournament)
 
-    # Make sure the player doesn't exist in the Players table
-    if playerExists(name) == False:
-        query = "INSERT INTO Players (name) VALUES (%s)"
-        parameter = (name,)
-        cursor.execute(query, parameter)
+        # Make sure the player does not exist yet in the tournament.
+        if playerExistsInTournament(pid, tid) == False:
+            backend.enroll(pid, tid)
+            _states.invalidate(tid)
+        else:
+            raise ValueError(
+                "Player {name} already exists in tournament. Please check."
+                .format(name=name))
 
-        db.commit()
 
-    # Get player id
-    pid = getPlayerId(name)
+@instrumented
+def registerPlayers(names, tournament=MAIN_TOURNAMENT):
+    """Adds many players to the tournament database in one transaction.
 
-    # Get tournament id
-    tid = getTournamentId(tournament)
+    Unlike registerPlayer, names already registered in the tournament are
+    skipped and reported instead of raising. Names repeated within names are
+    registered once.
 
-    # Make sure the player does not exist yet in the tournament.
-    if playerExistsInTournament(pid, tid) == False:
-        # Insert entry into PlayersTournaments table
-        query = "INSERT INTO PlayersTournaments (pid, tid) VALUES (%s, %s)"
-        parameter = ((pid,), (tid,))
-        cursor.execute(query, parameter)
+    Args:
+      names: an iterable of player full names.
+      tournament: name of the tournament where the players are participating.
 
-        db.commit()
-    else:
-        raise ValueError(
-            "Player {name} already exists in tournament. Please check."
-            .format(name=name))
+    Returns:
+      A list of the names that were already registered in the tournament,
+      in the order they first appear in names.
+    """
+    names = list(names)
+    if not names:
+        return []
+
+    backend = getBackend()
+    _ensureTournament(tournament)
+    with backend.transaction():
+        tid = getTournamentId(tournament)
 
-    db.close()
+        _states.invalidate(tid)
+        existing = set()
+        for name, pid, enrolled in backend.enrollMany(names, tid):
+            _cacheNewId(_player_ids, name, pid)
+            if not enrolled:
+                existing.add(name)
 
+    already_registered = []
+    for name in names:
+        if name in existing:
+            already_registered.append(name)
+            existing.discard(name)
 
-def playerStandings(tournament=MAIN_TOURNAMENT):
+    return already_registered
+
+
+@instrumented
+def playerStandings(tournament=MAIN_TOURNAMENT, tiebreaks=()):
     """Returns a list of the players and their win records, sorted by wins.
 
     The first entry in the list should be the player in first place, or
@@ -269,6 +1487,9 @@ def playerStandings(tournament=MAIN_TOURNAMENT):
 
     Args:
       tournament: name of the tournament where the player is participating.
+      tiebreaks: names from TIEBREAKS ('buchholz', 'sonneborn_berger',
+        'opponent_win_pct') breaking ties on wins, most significant first.
+        They are computed for the whole field in a single query.
 
     Returns:
       A list of tuples, each of which contains (id, name, wins, matches):
@@ -276,20 +1497,33 @@ def playerStandings(tournament=MAIN_TOURNAMENT):
         name: the player's full name (as registered)
         wins: the number of matches the player has won
         matches: the number of matches the player has played
+      followed by the value of each of the requested tiebreaks.
     """
-
-    # Grab all the players
-    db, cursor = connect()
+    for name in tiebreaks:
+        if name not in TIEBREAKS:
+            raise ValueError(
+                "Unknown tiebreak {name}.".format(name=name))
 
     standings = []
 
-    tid = getTournamentId(tournament)
+    backend = getBackend()
+    with backend.transaction(readonly=True):
+        tid = getTournamentId(tournament)
 
-    query = "SELECT * FROM PlayerStandings(%s)"
-    parameter = (tid,)
-    cursor.execute(query, parameter)
+        # Grab all the players, unless they are known at this version.
+        tiebreaks = tuple(tiebreaks)
+        version = backend.tournamentVersion(tid)
+        state = None if tiebreaks else _currentState(tid, version)
+        if state is not None:
+            rows = state.standings()
+        elif tiebreaks:
+            rows = _cachedResult(
+                backend, tid, version, ('standings',) + tiebreaks,
+                lambda: backend.tiebreakStandings(tid, tiebreaks))
+        else:
+            rows = _cachedResult(backend, tid, version, ('standings',),
+                                 lambda: backend.standings(tid))
 
-    rows = cursor.fetchall()
     for row in rows:
         pid = row[0]
         pname = row[1]
@@ -297,14 +1531,83 @@ def playerStandings(tournament=MAIN_TOURNAMENT):
         losses = row[3]
         matches = wins + losses
 
-        standings.append((pid, pname, wins, matches))
-
-    # Close connection
-    db.close()
+        standings.append((pid, pname, wins, matches) + tuple(row[4:]))
 
     return standings
 
 
+def iterPlayerStandings(tournament=MAIN_TOURNAMENT,
+                        batch_size=STANDINGS_BATCH_SIZE):
+    """Yields the standings of a tournament without loading them all.
+
+    On PostgreSQL the rows are read through a server-side cursor,
+    batch_size at a time, so memory use does not grow with the field.
+    Not instrumented: the work happens while the caller iterates.
+
+    Args:
+      tournament: name of the tournament where the player is participating.
+      batch_size: number of rows fetched from the database at once.
+
+    Yields:
+      (id, name, wins, matches) tuples in playerStandings() order.
+    """
+    if batch_size < 1:
+        raise ValueError(
+            "Batch size must be positive, got {size}.".format(
+                size=batch_size))
+
+    tid = getTournamentId(tournament)
+    return (row[:2] + (row[2], row[2] + row[3])
+            for row in getBackend().iterStandings(tid, batch_size))
+
+
+@instrumented
+def playerStandingsPage(tournament=MAIN_TOURNAMENT, after=None,
+                        limit=STANDINGS_PAGE_SIZE):
+    """Returns one page of the standings, using keyset pagination.
+
+    Pages are addressed by the last row already seen rather than an offset,
+    so every page costs the same and no row is skipped or repeated when
+    matches are reported between two requests.
+
+    Args:
+      tournament: name of the tournament where the player is participating.
+      after: the key returned with the previous page, None for the first.
+      limit: maximum number of rows in the page.
+
+    Returns:
+      A tuple (standings, next_key): standings is a list of
+      (id, name, wins, matches) tuples in playerStandings() order, next_key
+      the (wins, id) key of its last row to pass as after for the next
+      page, or None when there are no more rows.
+    """
+    if limit < 1:
+        raise ValueError(
+            "Page limit must be positive, got {limit}.".format(limit=limit))
+
+    backend = getBackend()
+    with backend.transaction(readonly=True):
+        tid = getTournamentId(tournament)
+        rows = backend.standingsPage(tid, after, limit)
+
+    standings = [(row[0], row[1], row[2], row[2] + row[3]) for row in rows]
+    next_key = None
+    if len(standings) == limit:
+        next_key = (standings[-1][2], standings[-1][0])
+
+    return standings, next_key
+
+
+@instrumented
+def topPlayers(limit, tournament=MAIN_TOURNAMENT):
+    """Returns the first limit rows of the standings.
+
+    Only those rows are read from the database.
+    """
+    return playerStandingsPage(tournament, limit=limit)[0]
+
+
+@instrumented
 def matchExists(winner, loser, tournament=MAIN_TOURNAMENT):
     """Checks if 2 players already played or not.
 
@@ -316,28 +1619,17 @@ def matchExists(winner, loser, tournament=MAIN_TOURNAMENT):
     Returns:
       True, if two players played already. False, otherwise.
     """
-    tid = getTournamentId(tournament)
-
-    db, cursor = connect()
-
-    # "Bye" situation: winner is same as loser
-    if (winner == loser):
-        query = "SELECT count(*) FROM Matches WHERE " +\
-                "tid = %s AND (winner=%s and loser=%s)"
-        parameter = ((tid,), (winner,), (loser,))
-    else:
-        query = "SELECT count(*) FROM Matches WHERE " +\
-                "tid = %s AND ((winner=%s and loser=%s) " +\
-                "OR (winner=%s and loser=%s))"
-        parameter = ((tid,), (winner,), (loser,), (loser,), (winner,))
-    cursor.execute(query, parameter)
-    count = cursor.fetchone()[0]
-
-    db.close()
+    backend = getBackend()
+    with backend.transaction(readonly=True):
+        tid = getTournamentId(tournament)
 
-    return count
+        state = _currentState(tid, backend.tournamentVersion(tid))
+        if state is not None:
+            return state.matchExists(winner, loser)
+        return backend.matchExists(winner, loser, tid)
 
 
+@instrumented
 def reportMatch(winner, loser, tournament=MAIN_TOURNAMENT):
     """Records the outcome of a single match between two players.
 
@@ -345,31 +1637,57 @@ def reportMatch(winner, loser, tournament=MAIN_TOURNAMENT):
       winner:  the id number of the player who won
       loser:  the id number of the player who lost
       tournament: name of the tournament where the player is participating.
+
+    Returns:
+      True if the match was recorded, False if the two players had already
+      played each other in the tournament.
     """
+    backend = getBackend()
+    with backend.transaction():
+        tid = getTournamentId(tournament)
 
-    result = True
+        # One statement checks and inserts, so concurrent reports of the
+        # same pair record it once.
+        result = backend.recordMatch(winner, loser, tid)
+        if result:
+            _recordInState(tid, [(winner, loser)])
 
-    # Make sure 2 players haven't played yet.
-    if (matchExists(winner, loser) == False):
-        tid = getTournamentId(tournament)
+    return result
 
-        db, cursor = connect()
 
-        # Insert winner/loser record
-        query = "INSERT INTO Matches (winner, loser, tid) " +\
-                "VALUES (%s, %s, %s)"
-        parameter = ((winner,), (loser,), (tid,))
-        cursor.execute(query, parameter)
+@instrumented
+def reportMatches(results, tournament=MAIN_TOURNAMENT):
+    """Records the outcomes of a whole round of matches at once.
 
-        db.commit()
-        db.close()
-    # 2 players have played already.
-    else:
-        result = False
+    The rematch check for the whole batch and the inserts run in one
+    transaction (a single statement on PostgreSQL). As with givePlayerBye, a pair whose winner
+    and loser are the same player records a bye for that player.
 
-    return result
+    Args:
+      results: a list of (winner, loser) player id pairs.
+      tournament: name of the tournament where the players are participating.
+
+    Returns:
+      A list of booleans, one per pair in results: True if the match was
+      recorded, False if the two players had already played (in an earlier
+      round or earlier in results), exactly as reportMatch would answer.
+    """
+    results = list(results)
+    if not results:
+        return []
+
+    backend = getBackend()
+    with backend.transaction():
+        tid = getTournamentId(tournament)
+
+        recorded = backend.recordMatches(results, tid)
+        _recordInState(tid, [result for result, fresh
+                             in zip(results, recorded) if fresh])
+
+    return recorded
 
 
+@instrumented
 def givePlayerBye(player, tournament=MAIN_TOURNAMENT):
     """Gives the player a bye. Automatic win!
 
@@ -380,7 +1698,80 @@ def givePlayerBye(player, tournament=MAIN_TOURNAMENT):
     reportMatch(player, player, tournament)
 
 
-def swissPairings(tournament=MAIN_TOURNAMENT):
+@instrumented
+def playedPairs(tournament=MAIN_TOURNAMENT):
+    """Returns the pairs of players who already met in a tournament.
+
+    Args:
+      tournament: name of the tournament where the players are participating.
+
+    Returns:
+      A set of (id1, id2) tuples with id1 < id2. Byes are not included.
+    """
+    backend = getBackend()
+    with backend.transaction(readonly=True):
+        tid = getTournamentId(tournament)
+
+        state = _currentState(tid, backend.tournamentVersion(tid))
+        if state is not None:
+            return state.playedPairs()
+        return backend.playedPairs(tid)
+
+
+def pairAdjacent(standings, played=None):
+    """Pairs each player with the player next to him or her in standings.
+
+    Args:
+      standings: rows as returned by playerStandings(), of even length.
+      played: unused, accepted so strategies share one signature.
+
+    Returns:
+      A list of (id1, name1, id2, name2) tuples.
+    """
+    pairings = []
+
+    index = 0
+    while index < len(standings):
+        pair1 = standings[index]
+        pair2 = standings[index+1]
+        pairing = (pair1[0], pair1[1], pair2[0], pair2[1])
+        pairings.append(pairing)
+        index += 2
+
+    return pairings
+
+
+def pairByMatching(standings, played):
+    """Pairs players avoiding rematches while keeping win records close.
+
+    See pairing.pairPlayers(). Rematches only occur when no rematch-free
+    pairing could be found.
+
+    Args:
+      standings: rows as returned by playerStandings(), of even length.
+      played: a set of (id1, id2) tuples, id1 < id2, as from playedPairs().
+
+    Returns:
+      A list of (id1, name1, id2, name2) tuples.
+    """
+    names = dict((row[0], row[1]) for row in standings)
+    players = [(row[0], row[2]) for row in standings]
+
+    pairs, rematches = pairPlayers(players, played)
+
+    return [(pid1, names[pid1], pid2, names[pid2]) for pid1, pid2 in pairs]
+
+
+# Pairing strategies accepted by swissPairings(), mapped to the function
+# computing the pairs and whether it needs the pairs already played.
+PAIRING_STRATEGIES = {
+    'adjacent': (pairAdjacent, False),
+    'matching': (pairByMatching, True),
+}
+
+
+@instrumented
+def swissPairings(tournament=MAIN_TOURNAMENT, strategy='adjacent'):
     """Returns a list of pairs of players for the next round of a match.
 
     Assuming that there are an even number of players registered, each player
@@ -388,8 +1779,15 @@ def swissPairings(tournament=MAIN_TOURNAMENT):
     player with an equal or nearly-equal win record, that is, a player adjacent
     to him or her in the standings.
 
+    Each call starts a new round (see currentRound) and completes the one
+    before it: the standings after that round and the pairings returned
+    are kept, see roundStandings and roundPairings.
+
     Args:
       tournament: name of the tournament where the player is participating.
+      strategy: how players are paired, one of PAIRING_STRATEGIES:
+        'adjacent' pairs neighbours in the standings, 'matching' also avoids
+        rematches (see pairByMatching).
 
     Returns:
       A list of tuples, each of which contains (id1, name1, id2, name2)
@@ -398,50 +1796,398 @@ def swissPairings(tournament=MAIN_TOURNAMENT):
         id2: the second player's unique id
         name2: the second player's name
     """
+    if strategy not in PAIRING_STRATEGIES:
+        raise ValueError(
+            "Unknown pairing strategy {name}.".format(name=strategy))
+    pair, needs_played = PAIRING_STRATEGIES[strategy]
 
-    count = countPlayers(tournament)
-    pairings = []
-    tid = getTournamentId(tournament)
+    backend = getBackend()
+    with backend.transaction():
+        tid = getTournamentId(tournament)
+
+        # Pairing the next round completes the one in progress: keep its
+        # standings before the new round's bye is counted.
+        round = backend.startRound(tid)
+        if round > 1:
+            backend.saveStandings(tid, round - 1)
+
+        # Everything this round needs, read at once and kept for the
+        # matches reported during the round.
+        state = backend.loadState(tid)
+        _cacheState(state)
+
+        # Odd number of players: the first player without a bye gets one,
+        # an automatic win.
+        player_id = _giveStateBye(state)
+        if player_id is not None:
+            backend.recordMatch(player_id, player_id, tid)
+            # Recording the bye added one to the version. Writers that
+            # committed since the state was loaded are not counted: the
+            # state falls behind and is dropped, as in _recordInState().
+            if state.version is not None:
+                state.version += 1
+
+        # Return the pairing without the player with bye.
+        standings, played = _pairingInput(state, player_id, needs_played)
+
+        pairings = pair(standings, played)
+        backend.savePairings(tid, round, [(pairing[0], pairing[2])
+                                          for pairing in pairings])
 
-    # Even number of players
-    if (count % 2 == 0):
-        index = 0
-        standings = playerStandings(tournament)
-        while index < count:
-            pair1 = standings[index]
-            pair2 = standings[index+1]
-            pairing = (pair1[0], pair1[1], pair2[0], pair2[1])
-            pairings.append(pairing)
-            index += 2
-    # Odd number of players
+    return pairings
+
+
+@instrumented
+def previewPairings(tournament=MAIN_TOURNAMENT, strategy='adjacent'):
+    """Returns the pairings swissPairings would make now, without saving.
+
+    No round is started and no bye recorded. The preview is cached until
+    the players or matches of the tournament change.
+
+    Args:
+      tournament: name of the tournament where the player is participating.
+      strategy: how players are paired, one of PAIRING_STRATEGIES.
+
+    Returns:
+      A list of (id1, name1, id2, name2) tuples, as swissPairings().
+    """
+    if strategy not in PAIRING_STRATEGIES:
+        raise ValueError(
+            "Unknown pairing strategy {name}.".format(name=strategy))
+    pair, needs_played = PAIRING_STRATEGIES[strategy]
+
+    def preview():
+        state = backend.loadState(tid)
+        bye = None
+        if state.countPlayers() % 2:
+            bye = state.nextByePlayer()
+        return pair(*_pairingInput(state, bye, needs_played))
+
+    backend = getBackend()
+    with backend.transaction(readonly=True):
+        tid = getTournamentId(tournament)
+        pairings = _cachedResult(backend, tid, backend.tournamentVersion(tid),
+                                 ('pairings', strategy), preview)
+
+    return list(pairings)
+
+
+def _giveStateBye(state):
+    """Counts a bye in a state with an odd number of players.
+
+    As the PlayersWithoutBye view, the bye goes to the lowest id player who
+    had none.
+
+    Returns:
+      The id of the player given the bye, or None.
+    """
+    if state.countPlayers() % 2 == 0:
+        return None
+
+    player_id = state.nextByePlayer()
+    if player_id is not None:
+        state.recordMatch(player_id, player_id)
+
+    return player_id
+
+
+def _pairingInput(state, bye, needs_played):
+    """Returns the standings and played pairs a strategy pairs from."""
+    standings = [(pid, name, wins, wins + losses)
+                 for pid, name, wins, losses in state.standings()
+                 if pid != bye]
+    played = state.playedPairs() if needs_played else None
+
+    return standings, played
+
+
+def _pairChunk(jobs):
+    """Pairs (strategy, standings, played) jobs, in a worker process."""
+    return [PAIRING_STRATEGIES[strategy][0](standings, played)
+            for strategy, standings, played in jobs]
+
+
+def _tournamentIds(names):
+    """Returns a dict of the ids of the named tournaments.
+
+    The names missing from the cache are looked up together.
+    """
+    tids = dict((name, _tournament_ids.get(name)) for name in names)
+    missing = [name for name in names if tids[name] is None]
+    if missing:
+        for name, tid in getBackend().findTournaments(missing).items():
+            _tournament_ids.put(name, tid)
+            tids[name] = tid
+
+    for name in names:
+        if tids[name] is None:
+            raise ValueError(
+                "Tournament {name} does NOT exist.".format(name=name))
+
+    return tids
+
+
+def _pairingPool(processes):
+    """Returns the worker pool of pairNextRounds, started on first use.
+
+    A pool is kept for the life of the process for each number of
+    processes asked for, so its workers are forked once, before the
+    transaction of the call that needs them is opened.
+    """
+    with _pairing_pools_lock:
+        pool = _pairing_pools.get(processes)
+        if pool is None:
+            pool = _pairing_pools[processes] = multiprocessing.Pool(processes)
+
+        return pool
+
+
+def _pairStates(states, strategy, pool=None):
+    """Gives the byes and pairs the next round of each tid: state item.
+
+    Args:
+      states: a dict mapping tournament ids to their TournamentState. The
+        byes are counted in the states.
+      strategy: one of PAIRING_STRATEGIES.
+      pool: the worker pool to pair in, or None to pair in this process.
+
+    Returns:
+      A tuple (byes, pairings) of dicts by tournament id: the player given
+      a bye, for the tournaments with one, and the pairings.
+    """
+    needs_played = PAIRING_STRATEGIES[strategy][1]
+    tids = list(states)
+    byes = {}
+    jobs = []
+    for tid in tids:
+        bye = _giveStateBye(states[tid])
+        if bye is not None:
+            byes[tid] = bye
+        jobs.append((strategy,) + _pairingInput(states[tid], bye,
+                                                needs_played))
+
+    chunks = [jobs[i:i + PAIRING_CHUNK_SIZE]
+              for i in range(0, len(jobs), PAIRING_CHUNK_SIZE)]
+    if pool is None:
+        parts = [_pairChunk(chunk) for chunk in chunks]
     else:
-        db, cursor = connect()
+        parts = pool.map(_pairChunk, chunks)
+    results = [pairings for part in parts for pairings in part]
 
-        # Step 1, go thru the select the player id in the standings without bye
-        query = "SELECT pid FROM PlayersWithoutBye WHERE tid=%s LIMIT 1"
-        parameter = (tid,)
-        cursor.execute(query, parameter)
-        player_id = cursor.fetchone()[0]
-
-        # Step 2, give the player a bye and an automatic win for the player.
-        givePlayerBye(player_id, tournament)
-
-        # Step 3, Return the pairing without the player with bye.
-        standings = playerStandings(tournament)
-        # Remove from the result the player id who was given a bye. See step 2.
-        standings = [(pid, name, wins, matches)
-                     for pid, name, wins, matches in standings
-                     if pid != player_id]
-        count = len(standings)
-
-        index = 0
-        while index < count:
-            pair1 = standings[index]
-            pair2 = standings[index+1]
-            pairing = (pair1[0], pair1[1], pair2[0], pair2[1])
-            pairings.append(pairing)
-            index += 2
-
-        db.close()
+    return byes, dict(zip(tids, results))
 
-    return pairings
+
+@instrumented
+def pairNextRounds(tournaments, strategy='adjacent', processes=None):
+    """Pairs the next round of many tournaments at once.
+
+    Does for every tournament what swissPairings does, with a few
+    set-based statements for all of them: their standings and played
+    pairs are read together, the pairings are computed in a pool of worker
+    processes, with no transaction open, and then, in one transaction,
+    their rounds are started and the previous ones kept, byes are recorded
+    together and the pairings are saved. Tournaments changed by another
+    writer in the meantime are read and paired again in that transaction.
+
+    Args:
+      tournaments: names of the tournaments whose round is finished.
+      strategy: how players are paired, one of PAIRING_STRATEGIES.
+      processes: worker processes, defaults to the number of CPUs; 0
+        pairs in the calling process. Fewer than PAIRING_CHUNK_SIZE
+        tournaments are always paired in the calling process.
+
+    Returns:
+      A dict mapping each tournament name to its pairings, lists of
+      (id1, name1, id2, name2) tuples as returned by swissPairings.
+    """
+    if strategy not in PAIRING_STRATEGIES:
+        raise ValueError(
+            "Unknown pairing strategy {name}.".format(name=strategy))
+
+    names = list(OrderedDict.fromkeys(tournaments))
+    if not names:
+        return {}
+
+    pool = None
+    if processes != 0 and len(names) > PAIRING_CHUNK_SIZE:
+        pool = _pairingPool(processes)
+
+    backend = getBackend()
+    with backend.transaction():
+        ids = _tournamentIds(names)
+        tids = [ids[name] for name in names]
+        states = backend.loadStates(tids)
+
+    byes, results = _pairStates(states, strategy, pool)
+
+    with backend.transaction():
+        # Starting the rounds locks the tournaments against other pairings
+        # until commit.
+        rounds = backend.startRounds(tids)
+        versions = backend.tournamentVersions(tids)
+        stale = [tid for tid in tids
+                 if rounds[tid] != states[tid].round + 1 or
+                 versions.get(tid) != states[tid].version]
+        if stale:
+            reloaded = backend.loadStates(stale)
+            states.update(reloaded)
+            stale_byes, stale_results = _pairStates(reloaded, strategy)
+            for tid in stale:
+                byes.pop(tid, None)
+            byes.update(stale_byes)
+            results.update(stale_results)
+
+        previous = dict((tid, round - 1) for tid, round in rounds.items()
+                        if round > 1)
+        if previous:
+            backend.saveStandingsMany(previous)
+
+        if byes:
+            backend.recordByes(byes)
+            # One more version each, as in swissPairings().
+            for tid in byes:
+                if states[tid].version is not None:
+                    states[tid].version += 1
+        for tid in tids:
+            states[tid].round = rounds[tid]
+            _cacheState(states[tid])
+
+        backend.savePairingsMany(dict(
+            (tid, (rounds[tid], [(pairing[0], pairing[2])
+                                 for pairing in results[tid]]))
+            for tid in tids))
+
+    return dict((name, results[ids[name]]) for name in names)
+
+
+@instrumented
+def tournamentStamp(tournament=MAIN_TOURNAMENT):
+    """Returns what identifies the standings and pairings of a tournament.
+
+    The version changes with every write to the players or matches of the
+    tournament and the round when the next one is paired, so results can
+    be cached under the stamp, e.g. as HTTP ETags.
+
+    Returns:
+      A (version, round) tuple; version is None on backends keeping none.
+    """
+    backend = getBackend()
+    with backend.transaction(readonly=True):
+        return tuple(backend.tournamentStamp(getTournamentId(tournament)))
+
+
+@instrumented
+def currentRound(tournament=MAIN_TOURNAMENT):
+    """Returns the number of the round last paired by swissPairings.
+
+    Matches reported are recorded in that round; it is 0 until the first
+    pairing.
+    """
+    backend = getBackend()
+    with backend.transaction(readonly=True):
+        return backend.currentRound(getTournamentId(tournament))
+
+
+@instrumented
+def completeRound(tournament=MAIN_TOURNAMENT):
+    """Keeps the standings of the round in progress as its final standings.
+
+    swissPairings does this for the previous round when it pairs the next
+    one; call it after the last round of a tournament. Once kept, the
+    standings of a round do not change.
+
+    Returns:
+      The number of the completed round.
+    """
+    backend = getBackend()
+    with backend.transaction():
+        tid = getTournamentId(tournament)
+        round = backend.currentRound(tid)
+        if round == 0:
+            raise ValueError(
+                "Tournament {name} has no round to complete.".format(
+                    name=tournament))
+
+        backend.saveStandings(tid, round)
+
+    return round
+
+
+@instrumented
+def archiveTournament(tournament):
+    """Moves a finished tournament to compact archive storage.
+
+    Its final standings are kept (see archivedStandings); its matches,
+    registrations and round snapshots are dropped, which takes constant
+    time on PostgreSQL since each tournament has partitions of its own.
+    An archived tournament cannot be played any more: registering players
+    or reporting matches in it raises ValueError.
+
+    Returns:
+      True if the tournament was archived, False if it already was.
+    """
+    backend = getBackend()
+    with backend.transaction():
+        tid = getTournamentId(tournament)
+        _states.invalidate(tid)
+
+        return backend.archiveTournament(tid)
+
+
+@instrumented
+def archivedStandings(tournament):
+    """Returns the final standings of an archived tournament.
+
+    Returns:
+      A list of (id, name, wins, matches) tuples, as playerStandings().
+    """
+    backend = getBackend()
+    with backend.transaction(readonly=True):
+        rows = backend.archivedStandings(getTournamentId(tournament))
+
+    return [(row[0], row[1], row[2], row[2] + row[3]) for row in rows]
+
+
+@instrumented
+def roundStandings(round, tournament=MAIN_TOURNAMENT):
+    """Returns the standings of a tournament as they were after a round.
+
+    Args:
+      round: number of a completed round, starting at 1.
+      tournament: name of the tournament where the player is participating.
+
+    Returns:
+      A list of (id, name, wins, matches) tuples, as playerStandings().
+    """
+    backend = getBackend()
+    with backend.transaction(readonly=True):
+        rows = backend.roundStandings(getTournamentId(tournament), round)
+
+    if not rows:
+        raise ValueError(
+            "Round {round} of tournament {name} is not complete.".format(
+                round=round, name=tournament))
+
+    return [(row[0], row[1], row[2], row[2] + row[3]) for row in rows]
+
+
+@instrumented
+def roundPairings(round, tournament=MAIN_TOURNAMENT):
+    """Returns the pairings swissPairings made for a round.
+
+    Args:
+      round: number of a round already paired, starting at 1.
+      tournament: name of the tournament where the player is participating.
+
+    Returns:
+      A list of (id1, name1, id2, name2) tuples, as swissPairings().
+    """
+    backend = getBackend()
+    with backend.transaction(readonly=True):
+        tid = getTournamentId(tournament)
+        if not 1 <= round <= backend.currentRound(tid):
+            raise ValueError(
+                "Round {round} of tournament {name} was not paired.".format(
+                    round=round, name=tournament))
+
+        return backend.roundPairings(tid, round)
@@ -8,68 +8,28 @@ CREATE DATABASE tournament;
 
 -- Table definitions for the tournament project.
 --
--- Put your SQL 'create table' statements in this file; also 'create view'
--- statements if you choose to use it.
-
--- Create "Players" table
-CREATE TABLE Players(
-	id SERIAL primary key, 
-	name TEXT not null);
+-- The schema is built by applying the scripts in migrations/ in order.
+-- Each script records itself in the SchemaVersion table. To upgrade an
+-- existing database without wiping it, run "python migrate.py" instead
+-- of this file.
+
+\set ON_ERROR_STOP on
+
+\ir migrations/001_initial_schema.sql
+\ir migrations/002_indexes_and_constraints.sql
+\ir migrations/003_player_stats.sql
+\ir migrations/004_tiebreaks.sql
+\ir migrations/005_standings_pages.sql
+\ir migrations/006_rounds.sql
+\ir migrations/007_standings_notifications.sql
+\ir migrations/008_partitions.sql
+\ir migrations/009_unique_pairs.sql
+\ir migrations/010_per_tournament_stats_refresh.sql
+\ir migrations/011_tournament_versions.sql
+\ir migrations/012_exact_opponent_win_pct.sql
+\ir migrations/013_sharded_tournament_versions.sql
 
 \d Players;
-
--- Create "Tournaments" table
-CREATE TABLE Tournaments(
-	id SERIAL primary key, 
-	name TEXT not null);
-
--- Insert "Main" Tournament
-INSERT INTO Tournaments (name) VALUES('MAIN_TOURNAMENT');
-
 \d Tournaments;
-
--- Create "Matches" table
-CREATE TABLE Matches(
-	id SERIAL primary key, 
-	winner INT references players(id),
-	loser INT references players(id),
-	tid INT references tournaments(id));
-
 \d Matches;
-
--- Create "PlayersTournaments" table
-CREATE TABLE PlayersTournaments(
-	id SERIAL primary key,
-	pid INT references players(id), 
-	tid INT references tournaments(id));
-
 \d PlayersTournaments;
-
-
--- Create Views 
-CREATE VIEW PlayersWithoutBye as select pid, tid from PlayersTournaments except select winner, tid from Matches where loser = winner order by pid asc;
-
-CREATE VIEW PlayerWins as select winner as pid, count(winner) as wins, tid from Matches group by winner, tid;
-CREATE VIEW PlayerLosses as select loser as pid, count(loser) as losses, tid from Matches where loser != winner group by loser, tid;
-
--- Create Function
-CREATE OR REPLACE FUNCTION PlayerStandings (tournament_id INT) 
-	RETURNS TABLE (
- 		id INT,
- 		name TEXT,
- 		wins BIGINT,
- 		losses BIGINT
-	) AS $$
-	BEGIN
- 		RETURN QUERY 
- 			SELECT 
-	 			p.id, p.name, COALESCE(pwins.wins,0) AS wins, COALESCE(plosses.losses, 0) AS losses 
-	 			FROM Players AS p
-	            RIGHT JOIN (SELECT pid, tid FROM PlayersTournaments WHERE tid = tournament_id) AS pt ON p.id = pt.pid
-	            LEFT JOIN (SELECT * FROM PlayerWins WHERE tid = tournament_id) AS pwins ON p.id = pwins.pid
-	            LEFT JOIN (SELECT * FROM PlayerLosses WHERE tid = tournament_id) AS plosses ON p.id = plosses.pid
-	            ORDER BY wins DESC, id ASC;
-	END;
-	$$ 
-	LANGUAGE 'plpgsql';
-
@@ -0,0 +1,462 @@
+#!/usr/bin/env python
+#
+# tournament_async.py -- asyncio implementation of a Swiss-system tournament
+#
+# Same functions and semantics as tournament.py, backed by asyncpg and an
+# asyncpg connection pool, for use from an asyncio event loop. Requires
+# Python 3.7+ and the asyncpg package.
+#
+
+import asyncio
+import contextvars
+from contextlib import asynccontextmanager, contextmanager
+
+import asyncpg
+
+from backends import refuseArchived
+from notifications import STANDINGS_CHANNEL, standingsChanges
+from tournament import DATABASE_NAME, LRUCache, MAIN_TOURNAMENT, \
+    PAIRING_STRATEGIES, POOL_MAX_SIZE, POOL_MIN_SIZE
+
+_pool = None
+_pool_lock = None
+_connection = contextvars.ContextVar('connection', default=None)
+
+_tournament_ids = LRUCache()
+_player_ids = LRUCache()
+
+
+async def configurePool(database_name=DATABASE_NAME, minconn=POOL_MIN_SIZE,
+                        maxconn=POOL_MAX_SIZE, dsn=None):
+    """(Re)creates the module connection pool.
+
+    Args:
+      database_name: name of the database to connect to.
+      minconn: number of connections kept open while idle.
+      maxconn: maximum number of simultaneous connections.
+      dsn: full connection URI, overrides database_name.
+
+    Returns:
+      The new asyncpg pool.
+    """
+    global _pool
+
+    if dsn is None:
+        pool = await asyncpg.create_pool(
+            database=database_name, min_size=minconn, max_size=maxconn)
+    else:
+        pool = await asyncpg.create_pool(
+            dsn, min_size=minconn, max_size=maxconn)
+
+    old, _pool = _pool, pool
+    if old is not None:
+        await old.close()
+
+    return pool
+
+
+async def getPool():
+    """Returns the module connection pool, creating it on first use."""
+    global _pool_lock
+
+    if _pool is None:
+        if _pool_lock is None:
+            _pool_lock = asyncio.Lock()
+        async with _pool_lock:
+            if _pool is None:
+                await configurePool()
+
+    return _pool
+
+
+async def closePool():
+    """Closes the module connection pool."""
+    global _pool
+
+    pool, _pool = _pool, None
+    if pool is not None:
+        await pool.close()
+
+
+def poolStats():
+    """Returns the module connection pool counters.
+
+    Returns:
+      A dict with the keys in_use, idle, size, min_size and max_size.
+    """
+    if _pool is None:
+        return {'in_use': 0, 'idle': 0, 'size': 0,
+                'min_size': POOL_MIN_SIZE, 'max_size': POOL_MAX_SIZE}
+
+    return {
+        'in_use': _pool.get_size() - _pool.get_idle_size(),
+        'idle': _pool.get_idle_size(),
+        'size': _pool.get_size(),
+        'min_size': _pool.get_min_size(),
+        'max_size': _pool.get_max_size(),
+    }
+
+
+@asynccontextmanager
+async def transaction():
+    """Acquires a pooled connection and yields it inside a transaction.
+
+    Nested calls within the same task share the outer connection and
+    transaction, as tournament.transaction() does per thread.
+    """
+    current = _connection.get()
+    if current is not None:
+        yield current
+        return
+
+    pool = await getPool()
+    async with pool.acquire() as connection:
+        token = _connection.set(connection)
+        try:
+            async with connection.transaction():
+                yield connection
+        finally:
+            _connection.reset(token)
+
+
+@contextmanager
+def _refusingArchived(tid):
+    """Turns writes to the dropped partitions of tid into a ValueError.
+
+    See tournament._refusingArchived().
+    """
+    try:
+        yield
+    except asyncpg.CheckViolationError:
+        refuseArchived(tid)
+
+
+def clearCaches():
+    """Empties the tournament and player name-to-id caches."""
+    _tournament_ids.clear()
+    _player_ids.clear()
+
+
+async def deleteAllMatches():
+    """Remove all the match records from the database."""
+    async with transaction() as connection:
+        await connection.execute("TRUNCATE Matches")
+        await connection.execute(
+            "UPDATE PlayerStats SET wins = 0, losses = 0, " +
+            "has_had_bye = false WHERE wins <> 0 OR losses <> 0 " +
+            "OR has_had_bye")
+        await connection.execute("DELETE FROM RoundStandings")
+        await connection.execute("DELETE FROM RoundPairings")
+        await connection.execute(
+            "UPDATE Tournaments SET round = 0 WHERE round <> 0")
+
+
+async def deleteMatches(tournament=MAIN_TOURNAMENT):
+    """Remove all the match records from the database."""
+    async with transaction() as connection:
+        tid = await getTournamentId(tournament)
+
+        await connection.execute("SELECT DeleteTournamentMatches($1)", tid)
+        for table in ('RoundStandings', 'RoundPairings'):
+            query = "DELETE FROM {table} where tid=$1".format(table=table)
+            await connection.execute(query, tid)
+        query = "UPDATE Tournaments SET round = 0 WHERE id=$1"
+        await connection.execute(query, tid)
+
+    _tournament_ids.invalidate(tournament)
+
+
+async def deleteAllPlayers():
+    """Remove all the player records from the database."""
+    async with transaction() as connection:
+        await connection.execute("DELETE FROM PlayersTournaments")
+        await connection.execute("DELETE FROM ArchivedStandings")
+        await connection.execute("DELETE FROM Players")
+
+    _player_ids.clear()
+
+
+async def deletePlayers(tournament=MAIN_TOURNAMENT):
+    """Remove all the player records from the database."""
+    async with transaction() as connection:
+        tid = await getTournamentId(tournament)
+
+        query = "DELETE FROM PlayersTournaments where tid=$1"
+        await connection.execute(query, tid)
+
+    _tournament_ids.invalidate(tournament)
+
+
+async def countPlayers(tournament=MAIN_TOURNAMENT):
+    """Returns the number of players currently registered."""
+    async with transaction() as connection:
+        tid = await getTournamentId(tournament)
+
+        query = "SELECT count(*) FROM PlayersTournaments where tid=$1"
+        return await connection.fetchval(query, tid)
+
+
+async def _lookupId(cache, table, name):
+    """Returns the id of the named row of table, or None if there is none."""
+    id = cache.get(name)
+    if id is None:
+        async with transaction() as connection:
+            query = "SELECT id FROM {table} WHERE name = $1".format(
+                table=table)
+            id = await connection.fetchval(query, name)
+
+        if id is not None:
+            cache.put(name, id)
+
+    return id
+
+
+async def playerExists(name):
+    """Checks if a player exists or not already."""
+    return await _lookupId(_player_ids, 'Players', name) is not None
+
+
+async def getPlayerId(name):
+    """Gets player id."""
+    pid = await _lookupId(_player_ids, 'Players', name)
+    if pid is None:
+        raise ValueError(
+            "Player {name} does NOT exist.".format(name=name))
+
+    return pid
+
+
+async def tournamentExists(name):
+    """Checks if a tournament exists or not already."""
+    return await _lookupId(_tournament_ids, 'Tournaments', name) is not None
+
+
+async def getTournamentId(name):
+    """Gets the tournament id."""
+    tid = await _lookupId(_tournament_ids, 'Tournaments', name)
+    if tid is None:
+        raise ValueError(
+            "Tournament {name} does NOT exist.".format(name=name))
+
+    return tid
+
+
+async def _ensureTournament(name):
+    """Creates the named tournament unless it exists, in its own transaction.
+
+    See tournament._ensureTournament: creating the partitions of a
+    tournament locks Players until commit.
+    """
+    if await tournamentExists(name):
+        return
+
+    async with transaction() as connection:
+        # Another process may create it first.
+        query = "WITH created AS (" +\
+                "INSERT INTO Tournaments (name) VALUES ($1) " +\
+                "ON CONFLICT (name) DO NOTHING RETURNING id) " +\
+                "SELECT id FROM created " +\
+                "UNION ALL SELECT id FROM Tournaments WHERE name = $1"
+        _tournament_ids.put(name, await connection.fetchval(query, name))
+
+
+async def registerPlayer(name, tournament=MAIN_TOURNAMENT):
+    """Adds a player to the tournament database.
+
+    Args:
+      name: the player's full name.
+      tournament: name of the tournament where the player is participating.
+    """
+    await _ensureTournament(tournament)
+    tid = await getTournamentId(tournament)
+    try:
+        with _refusingArchived(tid):
+            async with transaction() as connection:
+                # Make sure the player doesn't exist in the Players table
+                if not await playerExists(name):
+                    query = "INSERT INTO Players (name) VALUES ($1) " +\
+                            "RETURNING id"
+                    _player_ids.put(
+                        name, await connection.fetchval(query, name))
+
+                pid = await getPlayerId(name)
+
+                # Make sure the player does not exist yet in the tournament.
+                query = "INSERT INTO PlayersTournaments (pid, tid) " +\
+                        "SELECT $1, $2 WHERE NOT EXISTS " +\
+                        "(SELECT 1 FROM PlayersTournaments " +\
+                        "WHERE pid = $1 AND tid = $2) RETURNING id"
+                if await connection.fetchval(query, pid, tid) is None:
+                    raise ValueError(
+                        "Player {name} already exists in tournament. "
+                        "Please check.".format(name=name))
+    except Exception:
+        # Ids cached above may belong to rows that were just rolled back.
+        _tournament_ids.invalidate(tournament)
+        _player_ids.invalidate(name)
+        raise
+
+
+async def playerStandings(tournament=MAIN_TOURNAMENT):
+    """Returns a list of the players and their win records, sorted by wins.
+
+    Args:
+      tournament: name of the tournament where the player is participating.
+
+    Returns:
+      A list of (id, name, wins, matches) tuples, as
+      tournament.playerStandings().
+    """
+    async with transaction() as connection:
+        tid = await getTournamentId(tournament)
+
+        query = "SELECT * FROM PlayerStandings($1)"
+        rows = await connection.fetch(query, tid)
+
+    return [(row[0], row[1], row[2], row[2] + row[3]) for row in rows]
+
+
+async def matchExists(winner, loser, tournament=MAIN_TOURNAMENT):
+    """Checks if 2 players already played or not.
+
+    Returns:
+      True, if two players played already. False, otherwise.
+    """
+    async with transaction() as connection:
+        tid = await getTournamentId(tournament)
+
+        query = "SELECT EXISTS (SELECT 1 FROM Matches WHERE tid = $1 " +\
+                "AND ((winner = $2 AND loser = $3) " +\
+                "OR (winner = $3 AND loser = $2)))"
+        return await connection.fetchval(query, tid, winner, loser)
+
+
+async def reportMatch(winner, loser, tournament=MAIN_TOURNAMENT):
+    """Records the outcome of a single match between two players.
+
+    Returns:
+      True if the match was recorded, False if the players already played.
+    """
+    tid = await getTournamentId(tournament)
+    with _refusingArchived(tid):
+        async with transaction() as connection:
+            # One statement checks and inserts, so concurrent reports of
+            # the same pair record it once.
+            query = "INSERT INTO Matches (winner, loser, tid, round) " +\
+                    "SELECT $1, $2, id, round FROM Tournaments " +\
+                    "WHERE id = $3 " +\
+                    "ON CONFLICT (tid, p1, p2) DO NOTHING RETURNING id"
+            recorded = await connection.fetchval(query, winner, loser, tid)
+
+    return recorded is not None
+
+
+async def givePlayerBye(player, tournament=MAIN_TOURNAMENT):
+    """Gives the player a bye. Automatic win!"""
+    await reportMatch(player, player, tournament)
+
+
+async def playedPairs(tournament=MAIN_TOURNAMENT):
+    """Returns the set of (id1, id2) pairs, id1 < id2, who already met."""
+    async with transaction() as connection:
+        tid = await getTournamentId(tournament)
+
+        query = "SELECT least(winner, loser), greatest(winner, loser) " +\
+                "FROM Matches WHERE tid = $1 AND winner <> loser"
+        rows = await connection.fetch(query, tid)
+
+    return set((row[0], row[1]) for row in rows)
+
+
+async def swissPairings(tournament=MAIN_TOURNAMENT, strategy='adjacent'):
+    """Returns a list of pairs of players for the next round of a match.
+
+    See tournament.swissPairings(); with an odd number of players the first
+    player without a bye is given one.
+
+    Returns:
+      A list of (id1, name1, id2, name2) tuples.
+    """
+    if strategy not in PAIRING_STRATEGIES:
+        raise ValueError(
+            "Unknown pairing strategy {name}.".format(name=strategy))
+    pair, needs_played = PAIRING_STRATEGIES[strategy]
+
+    async with transaction() as connection:
+        count = await countPlayers(tournament)
+        tid = await getTournamentId(tournament)
+
+        # Start the next round and keep the standings of the previous one.
+        query = "UPDATE Tournaments SET round = round + 1 WHERE id = $1 " +\
+                "RETURNING round"
+        round = await connection.fetchval(query, tid)
+        if round > 1:
+            query = "INSERT INTO RoundStandings " +\
+                    "(tid, round, pid, wins, losses) " +\
+                    "SELECT tid, $2, pid, wins, losses FROM PlayerStats " +\
+                    "WHERE tid = $1 ON CONFLICT DO NOTHING"
+            await connection.execute(query, tid, round - 1)
+
+        player_id = None
+        if count % 2:
+            query = "SELECT pid FROM PlayersWithoutBye WHERE tid=$1 LIMIT 1"
+            player_id = await connection.fetchval(query, tid)
+            await givePlayerBye(player_id, tournament)
+
+        standings = [row for row in await playerStandings(tournament)
+                     if row[0] != player_id]
+        played = await playedPairs(tournament) if needs_played else None
+
+        if needs_played:
+            # Matching large fields is CPU bound; keep it off the event loop.
+            loop = asyncio.get_event_loop()
+            pairings = await loop.run_in_executor(None, pair, standings,
+                                                  played)
+        else:
+            pairings = pair(standings, played)
+
+        query = "INSERT INTO RoundPairings " +\
+                "(tid, round, board, pid1, pid2) " +\
+                "SELECT $1, $2, board, pid1, pid2 " +\
+                "FROM unnest($3::int[], $4::int[]) " +\
+                "WITH ORDINALITY AS p(pid1, pid2, board)"
+        await connection.execute(query, tid, round,
+                                 [pairing[0] for pairing in pairings],
+                                 [pairing[2] for pairing in pairings])
+
+    return pairings
+
+
+async def subscribeStandings(tournament=MAIN_TOURNAMENT):
+    """Yields the standings of a tournament every time they change.
+
+    The current standings are yielded first. Changes committed while the
+    consumer is busy are folded into the next item. A pooled connection is
+    held for listening until the iteration stops.
+
+    Yields:
+      Tuples (standings, changed) as passed to the callbacks of
+      notifications.StandingsListener.
+    """
+    tid = await getTournamentId(tournament)
+    changes = asyncio.Event()
+
+    def notified(connection, pid, channel, payload):
+        if int(payload) == tid:
+            changes.set()
+
+    pool = await getPool()
+    async with pool.acquire() as connection:
+        await connection.add_listener(STANDINGS_CHANNEL, notified)
+        try:
+            previous = None
+            while True:
+                changes.clear()
+                standings = await playerStandings(tournament)
+                changed = standingsChanges(previous, standings)
+                previous = standings
+                if changed:
+                    yield standings, changed
+                await changes.wait()
+        finally:
+            await connection.remove_listener(STANDINGS_CHANNEL, notified)
@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+#
+# Test cases for tournament_async.py, which needs Python 3.7+ and asyncpg.
+# Run them on the test database, as tournament_test.py:
+#   python3 tournament_async_test.py
+#
+
+import asyncio
+
+import tournament
+import tournament_async
+
+
+async def playRound():
+    name = "Async"
+    await tournament_async.configurePool(minconn=1, maxconn=2)
+    try:
+        for player in ["Async A", "Async B", "Async C"]:
+            await tournament_async.registerPlayer(player, name)
+        try:
+            await tournament_async.registerPlayer("Async A", name)
+        except ValueError:
+            pass
+        else:
+            raise ValueError("Players should be registered once.")
+        if await tournament_async.countPlayers(name) != 3:
+            raise ValueError("After registering, countPlayers() should be 3.")
+
+        # Three players: one gets the bye, the other two play.
+        [(id1, name1, id2, name2)] = await tournament_async.swissPairings(
+            name)
+        if await tournament_async.reportMatch(id1, id2, name) != True or \
+                await tournament_async.reportMatch(id2, id1, name) != False:
+            raise ValueError("A pair should be reported once.")
+        if await tournament_async.matchExists(id2, id1, name) != True:
+            raise ValueError("The reported pair should have met.")
+
+        standings = await tournament_async.playerStandings(name)
+        if sorted(row[2] for row in standings) != [0, 1, 1] or \
+                [row[3] for row in standings] != [1, 1, 1]:
+            raise ValueError(
+                "Expected a bye and a win in the standings. Got {standings}"
+                .format(standings=standings))
+        if standings != tournament.playerStandings(name):
+            raise ValueError("Both modules should read the same standings.")
+
+        subscription = tournament_async.subscribeStandings(name)
+        try:
+            current, changed = await asyncio.wait_for(
+                subscription.__anext__(), 5)
+        finally:
+            await subscription.aclose()
+        if current != standings or len(changed) != 3:
+            raise ValueError("Subscribers should get the current standings.")
+    finally:
+        await tournament_async.closePool()
+
+
+async def writeArchived():
+    name = "Async archived"
+    await tournament_async.configurePool(minconn=1, maxconn=2)
+    try:
+        for player in ["Async archived A", "Async archived B"]:
+            await tournament_async.registerPlayer(player, name)
+        id1 = await tournament_async.getPlayerId("Async archived A")
+        id2 = await tournament_async.getPlayerId("Async archived B")
+        tournament.archiveTournament(name)
+
+        writes = [
+            lambda: tournament_async.registerPlayer("Async archived C", name),
+            lambda: tournament_async.reportMatch(id1, id2, name),
+            lambda: tournament_async.givePlayerBye(id1, name),
+        ]
+        for write in writes:
+            try:
+                await write()
+            except ValueError as error:
+                if "archived" not in str(error):
+                    raise
+            else:
+                raise ValueError(
+                    "Writes to an archived tournament should be refused.")
+    finally:
+        await tournament_async.closePool()
+
+
+def testAsyncRound():
+    """
+    Test that a round is registered, paired and reported through asyncpg.
+    """
+    asyncio.run(playRound())
+    print("1. A round is played through asyncpg.")
+
+
+def testAsyncArchivedWrites():
+    """
+    Test that writes to an archived tournament raise ValueError.
+    """
+    asyncio.run(writeArchived())
+    print("2. Archived tournaments refuse writes through asyncpg.")
+
+
+if __name__ == '__main__':
+    testAsyncRound()
+    testAsyncArchivedWrites()
+
+    print("Success!  All tests pass!")
@@ -0,0 +1,290 @@
+#!/usr/bin/env python
+#
+# tournament_bench.py -- benchmark for tournament.py
+#
+# Builds synthetic tournaments and times registerPlayer, reportMatch,
+# playerStandings and swissPairings, on PostgreSQL or on the in-memory
+# backend. Prints a JSON report with latency
+# percentiles, database round trips per operation (statements plus commits,
+# as counted by instrumentation.py) and throughput, so runs can be compared
+# across commits.
+#
+# Usage:
+#   python tournament_bench.py --players 1000 --rounds 5 --tournaments 4
+#   python tournament_bench.py --players 10000 --bulk --backend memory
+#
+
+import argparse
+import json
+import math
+import os
+import random
+import subprocess
+import sys
+import threading
+import time
+
+import tournament
+
+# Operations timed by the benchmark, in report order.
+OPERATIONS = ('registerPlayer', 'registerPlayers', 'swissPairings',
+              'reportMatch', 'reportMatches', 'playerStandings')
+
+# Backends the benchmark can run on.
+BACKENDS = ('postgres', 'memory')
+
+_calls = threading.local()
+
+
+def _recordCall(metrics):
+    """Metrics sink keeping the last call made by each thread."""
+    _calls.last = metrics
+
+
+class Recorder(object):
+    """Collects latency and round trip samples per operation."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.samples = dict((name, []) for name in OPERATIONS)
+        self.round_trips = dict((name, 0) for name in OPERATIONS)
+        self.rows = dict((name, 0) for name in OPERATIONS)
+
+    def call(self, name, function, *args, **kwargs):
+        """Runs function(*args, **kwargs), recording it under name."""
+        return self.callBatch(name, 1, function, *args, **kwargs)
+
+    def callBatch(self, name, rows, function, *args, **kwargs):
+        """Runs function(*args, **kwargs), recording it under name as a
+        call handling rows rows, e.g. the matches of a reportMatches call."""
+        _calls.last = None
+        start = time.time()
+        result = function(*args, **kwargs)
+        elapsed = time.time() - start
+        trips = _calls.last.round_trips if _calls.last is not None else 0
+
+        with self._lock:
+            self.samples[name].append(elapsed)
+            self.round_trips[name] += trips
+            self.rows[name] += rows
+
+        return result
+
+
+def percentile(values, fraction):
+    """Returns the nearest-rank percentile of a sorted list."""
+    if not values:
+        return None
+    rank = int(math.ceil(fraction * len(values)))
+    return values[max(0, min(len(values), rank) - 1)]
+
+
+def summarize(recorder, wall_time):
+    """Builds the per-operation report.
+
+    Args:
+      recorder: the Recorder used during the run.
+      wall_time: seconds the whole run took.
+
+    Returns:
+      A dict keyed by operation name.
+    """
+    report = {}
+    for name in OPERATIONS:
+        values = sorted(recorder.samples[name])
+        if not values:
+            continue
+        total = sum(values)
+        report[name] = {
+            'count': len(values),
+            'total_s': total,
+            'mean_ms': total / len(values) * 1000,
+            'p50_ms': percentile(values, 0.50) * 1000,
+            'p90_ms': percentile(values, 0.90) * 1000,
+            'p99_ms': percentile(values, 0.99) * 1000,
+            'max_ms': values[-1] * 1000,
+            'round_trips_per_op': float(recorder.round_trips[name]) /
+            len(values),
+            'ops_per_s': len(values) / wall_time,
+            'rows_per_s': recorder.rows[name] / total if total else None,
+        }
+
+    return report
+
+
+def runTournament(recorder, name, players, rounds, bulk, strategy, seed):
+    """Registers players and plays rounds in one synthetic tournament."""
+    rng = random.Random(seed)
+    names = ["{t}-player-{i}".format(t=name, i=i) for i in range(players)]
+
+    if bulk:
+        recorder.callBatch('registerPlayers', len(names),
+                           tournament.registerPlayers, names, name)
+    else:
+        for player in names:
+            recorder.call('registerPlayer', tournament.registerPlayer,
+                          player, name)
+
+    for round in range(rounds):
+        pairings = recorder.call('swissPairings', tournament.swissPairings,
+                                 name, strategy)
+        results = []
+        for (id1, name1, id2, name2) in pairings:
+            if rng.random() < 0.5:
+                id1, id2 = id2, id1
+            results.append((id1, id2))
+        if bulk:
+            recorder.callBatch('reportMatches', len(results),
+                               tournament.reportMatches, results, name)
+        else:
+            for id1, id2 in results:
+                recorder.call('reportMatch', tournament.reportMatch,
+                              id1, id2, name)
+        recorder.call('playerStandings', tournament.playerStandings, name)
+
+
+def cleanUp(names):
+    """Removes every row created for the benchmark tournaments."""
+    with tournament.transaction() as cursor:
+        for name in names:
+            if tournament.tournamentExists(name):
+                tournament.deleteMatches(name)
+                tournament.deletePlayers(name)
+
+            query = "DELETE FROM Players WHERE name LIKE %s"
+            parameter = (name + '-player-%',)
+            cursor.execute(query, parameter)
+
+            query = "DELETE FROM Tournaments WHERE name = %s"
+            parameter = (name,)
+            cursor.execute(query, parameter)
+
+    tournament.clearCaches()
+
+
+def gitRevision():
+    """Returns the current git commit, or None outside of a checkout."""
+    try:
+        return subprocess.check_output(
+            ['git', 'rev-parse', 'HEAD'],
+            stderr=subprocess.STDOUT).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(players=100, rounds=3, tournaments=1, bulk=False,
+        strategy='adjacent', database_name=tournament.DATABASE_NAME,
+        seed=0, keep=False, prepared=True, backend='postgres'):
+    """Runs the benchmark and returns its report as a dict.
+
+    Args:
+      players: number of players per tournament.
+      rounds: number of rounds played in every tournament.
+      tournaments: number of tournaments run concurrently, one thread each.
+      bulk: register players with registerPlayers and report each round with
+        reportMatches instead of registerPlayer and reportMatch.
+      strategy: the swissPairings strategy to use.
+      database_name: database to run against.
+      seed: seed for the random match outcomes.
+      keep: leave the benchmark data in the database.
+      prepared: run the hot queries as prepared statements.
+      backend: 'postgres', or 'memory' for the in-memory backend, which
+        ignores database_name, keep and prepared.
+    """
+    if backend not in BACKENDS:
+        raise ValueError("Unknown backend {backend}.".format(backend=backend))
+    if backend == 'memory':
+        previous = tournament.setBackend(
+            tournament.MemoryBackend(tournament.MAIN_TOURNAMENT))
+    else:
+        tournament.configurePool(database_name, minconn=tournaments,
+                                 maxconn=tournaments)
+        tournament.configureStatements(prepared)
+    tournament.clearCaches()
+    tournament.addMetricsSink(_recordCall)
+
+    prefix = "bench-{pid}".format(pid=os.getpid())
+    names = ["{prefix}-{i}".format(prefix=prefix, i=i)
+             for i in range(tournaments)]
+
+    recorder = Recorder()
+    threads = [threading.Thread(target=runTournament,
+                                args=(recorder, name, players, rounds, bulk,
+                                      strategy, seed + i))
+               for i, name in enumerate(names)]
+
+    start = time.time()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    wall_time = time.time() - start
+    tournament.removeMetricsSink(_recordCall)
+
+    report = {
+        'config': {
+            'players': players,
+            'rounds': rounds,
+            'tournaments': tournaments,
+            'bulk': bulk,
+            'strategy': strategy,
+            'seed': seed,
+            'prepared': prepared,
+            'backend': backend,
+        },
+        'revision': gitRevision(),
+        'wall_time_s': wall_time,
+        'operations': summarize(recorder, wall_time),
+    }
+
+    if backend == 'memory':
+        tournament.setBackend(previous)
+    else:
+        report['pool'] = tournament.poolStats()
+        if not keep:
+            cleanUp(names)
+
+    return report
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Benchmark the tournament module.")
+    parser.add_argument('--players', type=int, default=100,
+                        help="players per tournament (up to 100000)")
+    parser.add_argument('--rounds', type=int, default=3)
+    parser.add_argument('--tournaments', type=int, default=1,
+                        help="tournaments run concurrently")
+    parser.add_argument('--bulk', action='store_true',
+                        help="register players with registerPlayers and "
+                        "report rounds with reportMatches")
+    parser.add_argument('--strategy', default='adjacent',
+                        choices=sorted(tournament.PAIRING_STRATEGIES))
+    parser.add_argument('--database', default=tournament.DATABASE_NAME)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--keep', action='store_true',
+                        help="keep the benchmark data in the database")
+    parser.add_argument('--no-prepared', dest='prepared',
+                        action='store_false',
+                        help="send the hot queries as text every time")
+    parser.add_argument('--backend', default='postgres', choices=BACKENDS)
+    parser.add_argument('--output', help="write the JSON report to a file")
+    args = parser.parse_args(argv)
+
+    if not 2 <= args.players <= 100000:
+        parser.error("--players must be between 2 and 100000")
+
+    report = run(args.players, args.rounds, args.tournaments, args.bulk,
+                 args.strategy, args.database, args.seed, args.keep,
+                 args.prepared, args.backend)
+
+    if args.output:
+        with open(args.output, 'w') as output:
+            json.dump(report, output, indent=2, sort_keys=True)
+    else:
+        json.dump(report, sys.stdout, indent=2, sort_keys=True)
+        sys.stdout.write('\n')
+
+
+if __name__ == '__main__':
+    main()
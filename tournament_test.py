@@ -7,7 +7,20 @@
 # as appropriate to account for your module's added functionality.
 
 from tournament import *
+from notifications import StandingsListener
+from transfer import exportTournament, importTournament
 from operator import itemgetter
+from pairing import pairKey, pairPlayers
+from decimal import Decimal
+import os
+import psycopg2
+import random
+import shutil
+import simulator
+import tempfile
+import threading
+import time
+import tournament
 
 def testCount():
     """
@@ -23,25 +36,25 @@ def testCount():
             "countPlayers should return numeric zero, not string '0'.")
     if c != 0:
         raise ValueError("After deletion, countPlayers should return zero.")
-    print "1. countPlayers() returns 0 after initial deletePlayers() execution."
+    print("1. countPlayers() returns 0 after initial deletePlayers() execution.")
     registerPlayer("Chandra Nalaar")
     c = countPlayers()
     if c != 1:
         raise ValueError(
             "After one player registers, countPlayers() should be 1. Got {c}".format(c=c))
-    print "2. countPlayers() returns 1 after one player is registered."
+    print("2. countPlayers() returns 1 after one player is registered.")
     registerPlayer("Jace Beleren")
     c = countPlayers()
     if c != 2:
         raise ValueError(
             "After two players register, countPlayers() should be 2. Got {c}".format(c=c))
-    print "3. countPlayers() returns 2 after two players are registered."
+    print("3. countPlayers() returns 2 after two players are registered.")
     deletePlayers()
     c = countPlayers()
     if c != 0:
         raise ValueError(
             "After deletion, countPlayers should return zero.")
-    print "4. countPlayers() returns zero after registered players are deleted.\n5. Player records successfully deleted."
+    print("4. countPlayers() returns zero after registered players are deleted.\n5. Player records successfully deleted.")
 
 def testStandingsBeforeMatches():
     """
@@ -67,7 +80,7 @@ def testStandingsBeforeMatches():
     if set([name1, name2]) != set(["Melpomene Murray", "Randy Schwartz"]):
         raise ValueError("Registered players' names should appear in standings, "
                          "even if they have no matches played.")
-    print "6. Newly registered players appear in the standings with no matches."
+    print("6. Newly registered players appear in the standings with no matches.")
 
 def testReportMatches():
     """
@@ -92,7 +105,7 @@ def testReportMatches():
             raise ValueError("Each match winner should have one win recorded.")
         elif i in (id2, id4) and w != 0:
             raise ValueError("Each match loser should have zero wins recorded.")
-    print "7. After a match, players have updated standings."
+    print("7. After a match, players have updated standings.")
     deleteMatches()
     standings = playerStandings()
     if len(standings) != 4:
@@ -102,7 +115,7 @@ def testReportMatches():
             raise ValueError("After deleting matches, players should have zero matches recorded.")
         if w != 0:
             raise ValueError("After deleting matches, players should have zero wins recorded.")
-    print "8. After match deletion, player standings are properly reset.\n9. Matches are properly deleted."
+    print("8. After match deletion, player standings are properly reset.\n9. Matches are properly deleted.")
 
 def testPairings():
     """
@@ -145,7 +158,7 @@ def testPairings():
         if pair not in possible_pairs:
             raise ValueError(
                 "After one match, players with one win should be paired.")
-    print "10. After one match, players with one win are properly paired."
+    print("10. After one match, players with one win are properly paired.")
 
 
 # Below are added tests for the following (1) Rematches, (2) Odd number of pairings and (3) Different tournament.
@@ -338,6 +351,1005 @@ def testDifferentTournaments():
     checkStandings(standings, [1, 1, 0]) 
 
 
+def testConnectionPool():
+    """
+    Test that API calls reuse pooled connections and return them afterwards.
+    """
+    configurePool(minconn=1, maxconn=2)
+    deleteMatches()
+    deletePlayers()
+    registerPlayer("Pool A")
+    registerPlayer("Pool B")
+    swissPairings()
+    stats = poolStats()
+    if stats['in_use'] != 0:
+        raise ValueError(
+            "All connections should be returned to the pool. Got {n} in use".format(n=stats['in_use']))
+    if stats['created'] > 2:
+        raise ValueError(
+            "Pool should never open more than maxconn connections. Got {n}".format(n=stats['created']))
+    print("11. API calls share pooled connections.")
+
+def testNameCaches():
+    """
+    Test that repeated lookups are answered from the name-to-id caches.
+    """
+    clearCaches()
+    deleteMatches()
+    deletePlayers()
+    registerPlayer("Cache A")
+    registerPlayer("Cache B")
+    swissPairings()
+    misses = cacheStats()['tournaments']['misses']
+    swissPairings()
+    playerStandings()
+    if cacheStats()['tournaments']['misses'] != misses:
+        raise ValueError("Tournament lookups should be served from the cache.")
+    deleteAllMatches()
+    deleteAllPlayers()
+    if cacheStats()['players']['size'] != 0:
+        raise ValueError("Deleting all players should empty the player cache.")
+    print("12. Tournament and player ids are cached.")
+
+
+def testRegisterPlayers():
+    """
+    Test bulk registration, including names already in the tournament.
+    """
+    deleteMatches()
+    deletePlayers()
+    registerPlayer("Bulk A")
+    existing = registerPlayers(["Bulk A", "Bulk B", "Bulk C", "Bulk B"])
+    if existing != ["Bulk A"]:
+        raise ValueError(
+            "registerPlayers should report already registered players. Got {names}".format(names=existing))
+    c = countPlayers()
+    if c != 3:
+        raise ValueError(
+            "After bulk registration, countPlayers() should be 3. Got {c}".format(c=c))
+    print("13. registerPlayers() registers a roster and reports duplicates.")
+
+
+def testReportMatchesBatch():
+    """
+    Test that a round of results is recorded in one call, refusing rematches.
+    """
+    deleteMatches()
+    deletePlayers()
+    registerPlayers(["Batch A", "Batch B", "Batch C", "Batch D", "Batch E"])
+    standings = playerStandings()
+    [id1, id2, id3, id4, id5] = [row[0] for row in standings]
+    reportMatch(id1, id2)
+    results = reportMatches([(id2, id1), (id3, id4), (id4, id3), (id5, id5)])
+    if results != [False, True, False, True]:
+        raise ValueError(
+            "reportMatches should refuse rematches. Got {results}".format(results=results))
+    standings = playerStandings()
+    standings.sort(key=itemgetter(2), reverse=True)
+    checkStandings(standings, [1, 1, 1, 0, 0])
+    print("14. reportMatches() records a round and refuses rematches.")
+
+
+def testMatchingPairings():
+    """
+    Test that the matching strategy avoids the rematch adjacent pairing makes.
+    """
+    deleteMatches()
+    deletePlayers()
+    registerPlayers(["Match A", "Match B", "Match C", "Match D"])
+    standings = playerStandings()
+    [id1, id2, id3, id4] = [row[0] for row in standings]
+    reportMatches([(id1, id2), (id3, id4)])
+    reportMatches([(id1, id3), (id2, id4)])
+    # A: 2 wins, B and C: 1 win, D: 0 wins. Adjacent pairing repeats A-B, C-D.
+    pairings = swissPairings(strategy='matching')
+    actual_pairs = set([frozenset([pid1, pid2]) for (pid1, pname1, pid2, pname2) in pairings])
+    if actual_pairs != set([frozenset([id1, id4]), frozenset([id2, id3])]):
+        raise ValueError(
+            "Matching pairings should avoid rematches. Got {pairs}".format(pairs=pairings))
+    print("15. Matching pairings avoid rematches.")
+
+
+def testInstrumentation():
+    """
+    Test that registered metrics sinks see one record per public call.
+    """
+    deleteMatches()
+    deletePlayers()
+    aggregator = MetricsAggregator()
+    addMetricsSink(aggregator)
+    try:
+        registerPlayer("Metrics A")
+        registerPlayer("Metrics B")
+        playerStandings()
+    finally:
+        removeMetricsSink(aggregator)
+    metrics = aggregator.dump()
+    if metrics['registerPlayer']['calls'] != 2:
+        raise ValueError(
+            "Two registerPlayer calls should be recorded. Got {n}".format(n=metrics['registerPlayer']['calls']))
+    if 'getTournamentId' in metrics:
+        raise ValueError("Nested calls should be counted in the outer call.")
+    # The two standings rows, after the tournament's version.
+    if metrics['playerStandings']['rows'] != 3:
+        raise ValueError(
+            "playerStandings should fetch 3 rows. Got {n}".format(n=metrics['playerStandings']['rows']))
+    print("16. Metrics sinks record each public call.")
+
+
+def testMemoryBackend():
+    """
+    Test that the in-memory backend follows the same bye and rematch rules.
+    """
+    previous = setBackend(MemoryBackend(MAIN_TOURNAMENT))
+    try:
+        registerPlayers(["Memory A", "Memory B", "Memory C"])
+        pairings = swissPairings()
+        if len(pairings) != 1:
+            raise ValueError(
+                "For 3 players, swissPairings should return 1 pair. Got {pairs}".format(pairs=len(pairings)))
+        [(pid1, pname1, pid2, pname2)] = pairings
+        if reportMatch(pid1, pid2) != True or reportMatch(pid2, pid1) != False:
+            raise ValueError("The memory backend should refuse rematches.")
+        standings = playerStandings()
+        standings.sort(key=itemgetter(2), reverse=True)
+        checkStandings(standings, [1, 1, 0])
+    finally:
+        setBackend(previous)
+    print("17. The in-memory backend keeps the tournament rules.")
+
+
+def testTiebreaks():
+    """
+    Test that Buchholz and Sonneborn-Berger break ties on wins.
+    """
+    deleteMatches()
+    deletePlayers()
+    registerPlayers(["Tie A", "Tie B", "Tie C", "Tie D"])
+    standings = playerStandings()
+    [id1, id2, id3, id4] = [row[0] for row in standings]
+    # Round 1: A beats B, C beats D. Round 2: A beats D, B beats C.
+    # A: 2 wins, B: 1, C: 1, D: 0.
+    reportMatches([(id1, id2), (id3, id4)])
+    reportMatches([(id1, id4), (id2, id3)])
+    # B faced A (2) and C (1): Buchholz 3. C faced D (0) and B (1): 1.
+    standings = playerStandings(tiebreaks=['buchholz', 'sonneborn_berger'])
+    expected = [(id1, 2, 1, 1), (id2, 1, 3, 1), (id3, 1, 1, 0), (id4, 0, 3, 0)]
+    actual = [(row[0], row[2], row[4], row[5]) for row in standings]
+    if actual != expected:
+        raise ValueError(
+            "Expected tiebreak standings {expected}. Got {actual}".format(expected=expected, actual=actual))
+    print("18. Tiebreaks order players tied on wins.")
+
+
+def testStandingsPages():
+    """
+    Test that standings pages and the streamed standings match playerStandings.
+    """
+    deleteMatches()
+    deletePlayers()
+    registerPlayers(["Page {i}".format(i=i) for i in range(7)])
+    standings = playerStandings()
+    reportMatches([(standings[1][0], standings[0][0]),
+                   (standings[3][0], standings[2][0])])
+    standings = playerStandings()
+    pages = []
+    page, key = playerStandingsPage(limit=3)
+    pages.append(page)
+    while key is not None:
+        page, key = playerStandingsPage(after=key, limit=3)
+        pages.append(page)
+    if [row for page in pages for row in page] != standings:
+        raise ValueError("Standings pages should add up to playerStandings.")
+    if [len(page) for page in pages] != [3, 3, 1]:
+        raise ValueError(
+            "7 players should give pages of 3, 3 and 1. Got {pages}".format(pages=pages))
+    if list(iterPlayerStandings(batch_size=2)) != standings:
+        raise ValueError("iterPlayerStandings should yield playerStandings.")
+    if topPlayers(2) != standings[:2]:
+        raise ValueError("topPlayers should return the first standings rows.")
+    print("19. Standings can be paged and streamed.")
+
+
+def testRoundSnapshots():
+    """
+    Test that the standings and pairings of past rounds are kept.
+    """
+    deleteMatches()
+    deletePlayers()
+    registerPlayers(["Round A", "Round B", "Round C", "Round D"])
+    first = swissPairings()
+    reportMatches([(id1, id2) for (id1, name1, id2, name2) in first])
+    after_first = playerStandings()
+    second = swissPairings()
+    reportMatches([(id2, id1) for (id1, name1, id2, name2) in second])
+    if currentRound() != 2:
+        raise ValueError(
+            "Two pairings should make two rounds. Got {round}".format(round=currentRound()))
+    if roundStandings(1) != after_first:
+        raise ValueError("Round 1 standings should not change in round 2.")
+    if roundPairings(1) != first or roundPairings(2) != second:
+        raise ValueError("The pairings of every round should be kept.")
+    try:
+        roundStandings(2)
+        raise AssertionError("Round 2 is not complete yet.")
+    except ValueError:
+        pass
+    if completeRound() != 2 or roundStandings(2) != playerStandings():
+        raise ValueError("completeRound should keep the current standings.")
+    print("20. The standings and pairings of every round are kept.")
+
+
+def testStandingsNotifications():
+    """
+    Test that subscribers receive the standings when a match is reported.
+    """
+    deleteMatches()
+    deletePlayers()
+    registerPlayers(["Notify A", "Notify B"])
+    [id1, id2] = [row[0] for row in playerStandings()]
+    deliveries = []
+    delivered = threading.Event()
+
+    def received(standings, changed):
+        deliveries.append((standings, changed))
+        delivered.set()
+
+    listener = StandingsListener(poll_interval=0.1)
+    listener.subscribe(received)
+    listener.start()
+    try:
+        if not delivered.wait(5):
+            raise ValueError("Subscribers should get the current standings.")
+        delivered.clear()
+        reportMatch(id1, id2)
+        if not delivered.wait(5):
+            raise ValueError("Reporting a match should notify subscribers.")
+    finally:
+        listener.stop()
+    standings, changed = deliveries[-1]
+    if standings != playerStandings() or len(changed) != 2:
+        raise ValueError(
+            "Expected the new standings and 2 changed rows. Got {delivery}".format(delivery=deliveries[-1]))
+    print("21. Standings changes are pushed to subscribers.")
+
+
+def testArchiveTournament():
+    """
+    Test that an archived tournament keeps only its final standings.
+    """
+    registerPlayers(["Archive A", "Archive B"], "Archived")
+    [(id1, name1, id2, name2)] = swissPairings("Archived")
+    reportMatch(id1, id2, "Archived")
+    standings = playerStandings("Archived")
+    if archiveTournament("Archived") != True:
+        raise ValueError("archiveTournament should archive the tournament.")
+    if archiveTournament("Archived") != False:
+        raise ValueError("A tournament can only be archived once.")
+    if countPlayers("Archived") != 0 or playerStandings("Archived") != []:
+        raise ValueError("Archiving should drop registrations and matches.")
+    if archivedStandings("Archived") != standings:
+        raise ValueError(
+            "Expected archived standings {expected}. Got {actual}".format(expected=standings, actual=archivedStandings("Archived")))
+    print("22. Archived tournaments keep their final standings.")
+
+
+def testPreparedStatements():
+    """
+    Test that the hot queries are prepared once per pooled connection.
+    """
+    configurePool(minconn=1, maxconn=1)
+    clearCaches()
+    registerPlayers(["Prepared A", "Prepared B"], "Prepared")
+    [(id1, name1, id2, name2)] = swissPairings("Prepared")
+    reportMatch(id1, id2, "Prepared")
+    # Read the standings from the database, not the round's state.
+    clearCaches()
+    standings = playerStandings("Prepared")
+    with transaction() as cursor:
+        cursor.execute("SELECT name FROM pg_prepared_statements")
+        names = set(row[0] for row in cursor.fetchall())
+    expected = set(['find_tournament', 'record_match', 'standings'])
+    if not expected <= names:
+        raise ValueError(
+            "Expected prepared statements {expected}. Got {actual}".format(expected=sorted(expected), actual=sorted(names)))
+    configureStatements(prepared=False)
+    if playerStandings("Prepared") != standings:
+        raise ValueError("Standings should not depend on prepared statements.")
+    configureStatements(prepared=True)
+    # A new pool means new connections, which prepare the statements again.
+    configurePool(minconn=1, maxconn=1)
+    if playerStandings("Prepared") != standings:
+        raise ValueError("New connections should prepare statements again.")
+    print("23. Hot queries run as statements prepared per connection.")
+
+def testTournamentState():
+    """
+    Test that a round is answered from the state swissPairings loads.
+    """
+    registerPlayers(["State A", "State B", "State C"], "State")
+    [(id1, name1, id2, name2)] = swissPairings("State")
+    reportMatch(id1, id2, "State")
+    aggregator = MetricsAggregator()
+    addMetricsSink(aggregator)
+    try:
+        standings = playerStandings("State")
+        rematch = matchExists(id2, id1, "State")
+    finally:
+        removeMetricsSink(aggregator)
+    metrics = aggregator.dump()
+    # One statement each: the check of the tournament's version.
+    if metrics['playerStandings']['statements'] != 1 or \
+            metrics['matchExists']['statements'] != 1:
+        raise ValueError("Standings and rematches should be read from memory.")
+    if rematch != True:
+        raise ValueError("Rematches should be seen within the round.")
+    clearCaches()
+    if playerStandings("State") != standings:
+        raise ValueError(
+            "Expected the stored standings {expected}. Got {actual}".format(expected=standings, actual=playerStandings("State")))
+    print("24. A round is played from the state loaded with its pairings.")
+
+def testTransferTournament():
+    """
+    Test that a tournament exported through COPY imports as an equal one.
+    """
+    registerPlayers(["Transfer A", "Transfer B", "Transfer C"], "Transfer")
+    for (id1, name1, id2, name2) in swissPairings("Transfer"):
+        reportMatch(id1, id2, "Transfer")
+    standings = playerStandings("Transfer")
+    directory = tempfile.mkdtemp()
+    try:
+        for format in ('csv', 'binary'):
+            copy = "Transfer " + format
+            exported = exportTournament("Transfer", directory, format)
+            imported = importTournament(directory, copy, format)
+            if exported != imported or imported['matches'] != 2:
+                raise ValueError(
+                    "Expected 2 matches imported as exported. Got {imported}".format(imported=imported))
+            if playerStandings(copy) != standings:
+                raise ValueError(
+                    "Expected standings {expected}. Got {actual}".format(expected=standings, actual=playerStandings(copy)))
+            if currentRound(copy) != 1:
+                raise ValueError("Imported tournaments keep their round.")
+    finally:
+        shutil.rmtree(directory)
+    print("25. Tournaments are exported and imported through COPY.")
+
+def testConcurrentReports():
+    """
+    Test that a pair reported by many reporters at once is recorded once.
+    """
+    configurePool(minconn=1, maxconn=8)
+    registerPlayers(["Race A", "Race B"], "Race")
+    id1, id2 = getPlayerId("Race A"), getPlayerId("Race B")
+    start = threading.Event()
+    results = []
+    def report():
+        start.wait()
+        results.append(reportMatch(id1, id2, "Race"))
+    threads = [threading.Thread(target=report) for i in range(8)]
+    for thread in threads:
+        thread.start()
+    start.set()
+    for thread in threads:
+        thread.join()
+    if sorted(results) != [False] * 7 + [True]:
+        raise ValueError(
+            "Exactly one report should be recorded. Got {results}".format(results=results))
+    if reportMatch(id2, id1, "Race") != False:
+        raise ValueError("A rematch in the same tournament should be refused.")
+    if [row[3] for row in playerStandings("Race")] != [1, 1]:
+        raise ValueError("Each player should have played exactly once.")
+    print("26. Concurrent reports of a pair record one match.")
+
+def testPairNextRounds():
+    """
+    Test that many tournaments are paired at once as swissPairings would.
+    """
+    names = ["League 3", "League 4", "League 5"]
+    for name in names:
+        size = int(name[-1])
+        registerPlayers([name + " player " + str(i) for i in range(size)],
+                        name)
+    byes = {}
+    for round in (1, 2):
+        pairings = pairNextRounds(names, 'matching', processes=0)
+        for name in names:
+            paired = set()
+            for (id1, name1, id2, name2) in pairings[name]:
+                paired.update([id1, id2])
+                reportMatch(id1, id2, name)
+            unpaired = set(row[0] for row in playerStandings(name)) - paired
+            if len(unpaired) != int(name[-1]) % 2:
+                raise ValueError(
+                    "Every player but the bye should be paired. Unpaired: {ids}".format(ids=unpaired))
+            byes.setdefault(name, set()).update(unpaired)
+            if currentRound(name) != round or \
+                    roundPairings(round, name) != pairings[name]:
+                raise ValueError("Batched pairings should be kept per round.")
+    for name in ("League 3", "League 5"):
+        if len(byes[name]) != 2:
+            raise ValueError("A player should never get a second bye.")
+    print("27. Many tournaments are paired in one batch.")
+
+def testReadReplicas():
+    """
+    Test that reads go to the replicas, except right after a write.
+    """
+    # The database stands in for its own replica, told apart by the
+    # application name of its connections.
+    replica = "dbname=tournament application_name=replica"
+    def readServer():
+        with transaction(readonly=True) as cursor:
+            cursor.execute("SHOW application_name")
+            return cursor.fetchone()[0]
+    configurePool(minconn=1, maxconn=2, replicas=[replica],
+                  read_your_writes=60)
+    registerPlayers(["Replica A", "Replica B"], "Replicas")
+    if readServer() == "replica":
+        raise ValueError("Reads should stay on the primary after a write.")
+    configurePool(minconn=1, maxconn=2, replicas=[replica],
+                  read_your_writes=0)
+    if readServer() != "replica":
+        raise ValueError("Reads should go to the replica.")
+    with transaction() as cursor:
+        cursor.execute("SHOW application_name")
+        if cursor.fetchone()[0] == "replica":
+            raise ValueError("Writes should go to the primary.")
+    if countPlayers("Replicas") != 2 or \
+            len(playerStandings("Replicas")) != 2:
+        raise ValueError("The replica should serve the standings.")
+    if not replicaStats()[0]['created']:
+        raise ValueError("The replica pool should have been used.")
+    configurePool()
+    print("28. Reads are routed to replicas, writes to the primary.")
+
+def testVersionedResults():
+    """
+    Test that results are cached until their tournament's version changes.
+    """
+    clearCaches()
+    registerPlayers(["Versioned A", "Versioned B", "Versioned C",
+                     "Versioned D"], "Versioned")
+    preview = previewPairings("Versioned")
+    standings = playerStandings("Versioned")
+    hits = cacheStats()['results']['hits']
+    if playerStandings("Versioned") != standings or \
+            previewPairings("Versioned") != preview or \
+            cacheStats()['results']['hits'] != hits + 2:
+        raise ValueError("Unchanged results should come from the cache.")
+    if currentRound("Versioned") != 0:
+        raise ValueError("A preview should not start a round.")
+    # A match recorded behind the caches' back, as by another process.
+    (id1, name1, id2, name2) = preview[0]
+    with transaction() as cursor:
+        cursor.execute("INSERT INTO Matches (winner, loser, tid) "
+                       "VALUES (%s, %s, %s)",
+                       (id1, id2, getTournamentId("Versioned")))
+    stale = cacheStats()['results']['stale']
+    if playerStandings("Versioned")[0][:3] != (id1, name1, 1) or \
+            cacheStats()['results']['stale'] != stale + 1:
+        raise ValueError("A new version should invalidate the standings.")
+    # The version of a rolled back write is reused by the next one.
+    (id3, name3, id4, name4) = preview[1]
+    try:
+        with transaction():
+            reportMatch(id3, id4, "Versioned")
+            playerStandings("Versioned")
+            raise RuntimeError("Roll back.")
+    except RuntimeError:
+        pass
+    reportMatch(id4, id3, "Versioned")
+    winners = set(row[0] for row in playerStandings("Versioned")
+                  if row[2] == 1)
+    if winners != set([id1, id4]):
+        raise ValueError("Results of a rolled back write should be dropped.")
+    print("29. Results are cached per tournament version.")
+
+def testPreparedStatementErrors():
+    """
+    Test that a statement failing on first use stays usable on its connection.
+    """
+    configurePool(minconn=1, maxconn=1)
+    registerPlayers(["Failing A", "Failing B"], "Failing")
+    id1 = getPlayerId("Failing A")
+    id2 = getPlayerId("Failing B")
+    # Prepared, then failing on a player who does not exist.
+    try:
+        reportMatch(id1, 987654, "Failing")
+        raise ValueError("Reporting an unknown player should fail.")
+    except psycopg2.IntegrityError:
+        pass
+    if not reportMatch(id1, id2, "Failing"):
+        raise ValueError("The prepared statement should still be usable.")
+    configurePool()
+    print("30. Statements failing on first use stay prepared.")
+
+def testStaleTournamentState():
+    """
+    Test that a round's state gives way to writes made by other processes.
+    """
+    registerPlayers(["Stale A", "Stale B", "Stale C", "Stale D"], "Stale")
+    [(id1, name1, id2, name2), (id3, name3, id4, name4)] = \
+        swissPairings("Stale")
+    # Writes of this process keep the state current. (countPlayers also
+    # prepares the version check on the pooled connection.)
+    countPlayers("Stale")
+    reportMatch(id3, id4, "Stale")
+    aggregator = MetricsAggregator()
+    addMetricsSink(aggregator)
+    try:
+        standings = playerStandings("Stale")
+    finally:
+        removeMetricsSink(aggregator)
+    if aggregator.dump()['playerStandings']['statements'] != 1 or \
+            [row[2] for row in standings] != [1, 0, 0, 0]:
+        raise ValueError("Matches reported here should update the state.")
+    # Another process registers a player and reports a match.
+    tid = getTournamentId("Stale")
+    other = psycopg2.connect(getPool().dsn)
+    try:
+        cursor = other.cursor()
+        cursor.execute("INSERT INTO Players (name) VALUES ('Stale E') "
+                       "RETURNING id")
+        cursor.execute("INSERT INTO PlayersTournaments (pid, tid) "
+                       "VALUES (%s, %s)", (cursor.fetchone()[0], tid))
+        cursor.execute("INSERT INTO Matches (winner, loser, tid) "
+                       "VALUES (%s, %s, %s)", (id1, id2, tid))
+        other.commit()
+    finally:
+        other.close()
+    if countPlayers("Stale") != 5:
+        raise ValueError("Players registered elsewhere should be counted.")
+    if not matchExists(id1, id2, "Stale"):
+        raise ValueError("Matches reported elsewhere should be seen.")
+    if [row[2] for row in playerStandings("Stale")] != [1, 1, 0, 0, 0]:
+        raise ValueError("Standings should include matches reported elsewhere.")
+    print("31. Tournament states are checked against the database.")
+
+def testVersionCheckInRound():
+    """
+    Test that reads within a round see writes made in between elsewhere.
+    """
+    registerPlayers(["Checked A", "Checked B"], "Checked")
+    [(id1, name1, id2, name2)] = swissPairings("Checked")
+    before = playerStandings("Checked")
+    count = countPlayers("Checked")
+    other = psycopg2.connect(getPool().dsn)
+    try:
+        cursor = other.cursor()
+        cursor.execute("INSERT INTO Matches (winner, loser, tid) "
+                       "VALUES (%s, %s, %s)",
+                       (id2, id1, getTournamentId("Checked")))
+        cursor.execute("INSERT INTO Players (name) VALUES ('Checked C') "
+                       "RETURNING id")
+        cursor.execute("INSERT INTO PlayersTournaments (pid, tid) "
+                       "VALUES (%s, %s)",
+                       (cursor.fetchone()[0], getTournamentId("Checked")))
+        other.commit()
+    finally:
+        other.close()
+    after = playerStandings("Checked")
+    if [row[2] for row in before] != [0, 0] or \
+            after[0][:3] != (id2, name2, 1) or len(after) != 3:
+        raise ValueError("The second read should see the other connection's writes.")
+    if count != 2 or countPlayers("Checked") != 3:
+        raise ValueError("Counts should see the other connection's writes.")
+    hits = cacheStats()['results']['hits']
+    if playerStandings("Checked") != after or \
+            cacheStats()['results']['hits'] != hits + 1:
+        raise ValueError("Unchanged standings should come from the cache.")
+    print("32. Reads within a round check the tournament's version.")
+
+
+def testExactOpponentWinPct():
+    """
+    Test that the database and the memory backend order tiebreaks alike.
+    """
+    def play(name):
+        # Results drawn from a fixed seed; with floating point opponent
+        # win percentages, this field was ordered differently by the two.
+        rng = random.Random(303)
+        registerPlayers(["Pct {i:02d}".format(i=i) for i in range(13)], name)
+        for round in range(5):
+            results = [(id1, id2) if rng.random() < 0.5 else (id2, id1)
+                       for id1, name1, id2, name2 in swissPairings(name, 'matching')
+                       if id1 != id2]
+            reportMatches(results, name)
+        return [row[1:] for row in playerStandings(name, ['opponent_win_pct'])]
+    database = play("Exact Pct")
+    previous = setBackend(MemoryBackend(MAIN_TOURNAMENT))
+    try:
+        memory = play("Exact Pct")
+    finally:
+        setBackend(previous)
+    if database != memory:
+        raise ValueError(
+            "Expected the same tiebreaks from both backends. Got {database} and {memory}".format(database=database, memory=memory))
+    if not all(isinstance(row[3], Decimal) for row in database):
+        raise ValueError("Opponent win percentages should be exact decimals.")
+    print("33. Opponent win percentages are computed exactly.")
+
+
+def testArchivedWrites():
+    """
+    Test that registering and reporting into an archived tournament fail.
+    """
+    def archive():
+        registerPlayers(["Closed A", "Closed B"], "Closed")
+        [(id1, name1, id2, name2)] = swissPairings("Closed")
+        archiveTournament("Closed")
+        for write in (lambda: registerPlayer("Closed C", "Closed"),
+                      lambda: registerPlayers(["Closed D"], "Closed"),
+                      lambda: reportMatch(id1, id2, "Closed"),
+                      lambda: reportMatches([(id2, id1)], "Closed"),
+                      lambda: givePlayerBye(id1, "Closed")):
+            try:
+                write()
+            except ValueError:
+                pass
+            else:
+                raise ValueError("Archived tournaments should refuse writes.")
+        return archivedStandings("Closed")
+    expected = archive()
+    for backend in (MemoryBackend(MAIN_TOURNAMENT),
+                    SQLiteBackend(':memory:', main_tournament=MAIN_TOURNAMENT)):
+        previous = setBackend(backend)
+        try:
+            standings = archive()
+        finally:
+            setBackend(previous)
+        if [row[1:] for row in standings] != [row[1:] for row in expected]:
+            raise ValueError("Refused writes should leave the archive as it was.")
+    print("34. Archived tournaments refuse new players and matches.")
+
+
+def testTournamentCreationLocks():
+    """
+    Test that new tournaments do not lock Players while players register.
+    """
+    other = psycopg2.connect(getPool().dsn)
+    blocked = []
+    class ProbingBackend(PostgresBackend):
+        def enrollMany(self, names, tid):
+            # Another connection registers a new player meanwhile.
+            cursor = other.cursor()
+            try:
+                cursor.execute("SET lock_timeout = '1s'")
+                cursor.execute("INSERT INTO Players (name) VALUES ('Probe')")
+            except psycopg2.errors.LockNotAvailable:
+                blocked.append(tid)
+            finally:
+                other.rollback()
+            return PostgresBackend.enrollMany(self, names, tid)
+    previous = setBackend(ProbingBackend())
+    try:
+        registerPlayers(["Locks A", "Locks B"], "Locks")
+    finally:
+        setBackend(previous)
+        other.close()
+    if blocked or countPlayers("Locks") != 2:
+        raise ValueError("Creating a tournament should not block registrations.")
+    directory = tempfile.mkdtemp()
+    try:
+        exportTournament("Locks", directory)
+        with open(os.path.join(directory, 'registrations.csv'), 'a') as f:
+            f.write("-1\n")
+        try:
+            importTournament(directory, "Locks copy")
+        except ValueError:
+            pass
+        else:
+            raise ValueError("Registrations of unknown players should fail.")
+    finally:
+        shutil.rmtree(directory)
+    if tournamentExists("Locks copy"):
+        raise ValueError("A failed import should not leave its tournament.")
+    print("35. Tournaments are created in transactions of their own.")
+
+
+def testNotificationsReadPrimary():
+    """
+    Test that standings pushed on a notification are read from the primary.
+    """
+    registerPlayers(["Pinned A", "Pinned B"], "Pinned")
+    [id1, id2] = [row[0] for row in playerStandings("Pinned")]
+    replica = "dbname=tournament application_name=replica"
+    # No connection is opened to the replica until a read needs one.
+    configurePool(minconn=0, maxconn=2, replicas=[replica],
+                  read_your_writes=0)
+    replica_connections = []
+    delivered = threading.Event()
+    def received(standings, changed):
+        replica_connections.append(replicaStats()[0]['created'])
+        delivered.set()
+    listener = StandingsListener(poll_interval=0.1)
+    listener.subscribe(received, "Pinned")
+    listener.start()
+    try:
+        if not delivered.wait(5):
+            raise ValueError("Subscribers should get the current standings.")
+        delivered.clear()
+        reportMatch(id1, id2, "Pinned")
+        if not delivered.wait(5):
+            raise ValueError("Reporting a match should notify subscribers.")
+    finally:
+        listener.stop()
+        configurePool()
+    if replica_connections != [0, 0]:
+        raise ValueError("Notified standings should not be read from a replica.")
+    print("36. Notified standings are read from the primary.")
+
+
+def testSimulator():
+    """
+    Test that seeded simulations are repeatable and keep the rules.
+    """
+    previous = getBackend()
+    try:
+        ranking, leader_round = simulator.simulateTournament(
+            9, 4, simulator.Elo(), random.Random(12), 'matching')
+        tid = getTournamentId(MAIN_TOURNAMENT)
+        results = getBackend().results(tid)
+        standings = playerStandings()
+    finally:
+        setBackend(previous)
+    if sorted(ranking) != list(range(1, 10)):
+        raise ValueError("The ranking should list every seed once.")
+    pairs = [tuple(sorted(result)) for result in results]
+    if len(pairs) != len(set(pairs)):
+        raise ValueError("A simulated tournament should have no rematches.")
+    # 9 players, 4 rounds: 4 matches and a bye per round.
+    if len(results) != 20 or sum(row[2] for row in standings) != 20:
+        raise ValueError("Every match, bye included, should make one win.")
+    if [row[3] for row in standings] != [4] * 9:
+        raise ValueError("Every player should play every round.")
+
+    runs = [list(simulator.simulate(6, 3, 20, simulator.CoinFlip(), top=2,
+                                    processes=2, seed=5, chunk_size=7))
+            for run in range(2)]
+    stats = runs[0][-1]
+    if stats != runs[1][-1] or len(runs[0]) != 3:
+        raise ValueError("Equal seeds should give equal aggregates.")
+    if stats['simulations'] != 20 or sum(stats['firsts']) != 20 or \
+            sum(stats['top_finishes']) != 20 * 2 or \
+            sum(stats['place_sum']) != 20 * (1 + 2 + 3 + 4 + 5 + 6) or \
+            sum(stats['leader_rounds'].values()) != 20:
+        raise ValueError(
+            "Unexpected simulation aggregate {stats}".format(stats=stats))
+    print("37. Seeded simulations are repeatable and keep the rules.")
+
+
+def testPairNextRoundsOutsideTransaction():
+    """
+    Test that batched pairings reuse their workers and see late changes.
+    """
+    names = ["Batch 4", "Batch 6"]
+    for name in names:
+        registerPlayers([name + " player " + str(i)
+                         for i in range(int(name[-1]))], name)
+    other = psycopg2.connect(getPool().dsn)
+    other.autocommit = True
+    class LateBackend(PostgresBackend):
+        def startRounds(self, tids):
+            # Another writer registers a player once the pairings were
+            # computed, before they are saved.
+            cursor = other.cursor()
+            cursor.execute("INSERT INTO Players (name) VALUES ('Batch late') "
+                           "RETURNING id")
+            cursor.execute("INSERT INTO PlayersTournaments (pid, tid) "
+                           "VALUES (%s, %s)",
+                           (cursor.fetchone()[0], getTournamentId("Batch 4")))
+            return PostgresBackend.startRounds(self, tids)
+    chunk_size = tournament.PAIRING_CHUNK_SIZE
+    tournament.PAIRING_CHUNK_SIZE = 1
+    previous = setBackend(LateBackend())
+    try:
+        pairings = pairNextRounds(names, processes=2)
+    finally:
+        setBackend(previous)
+        other.close()
+    try:
+        pool = tournament._pairing_pools[2]
+        pairNextRounds(["Batch 6"], processes=2)
+        if tournament._pairing_pools[2] is not pool:
+            raise ValueError("Batched pairings should reuse their workers.")
+    finally:
+        tournament.PAIRING_CHUNK_SIZE = chunk_size
+    # Five players now: two pairs and a bye, the late player included.
+    paired = set()
+    for (id1, name1, id2, name2) in pairings["Batch 4"]:
+        paired.update([id1, id2])
+    players = set(row[0] for row in playerStandings("Batch 4"))
+    byes = [row for row in playerStandings("Batch 4") if row[2] == 1]
+    if len(paired) != 4 or len(players - paired) != 1 or len(byes) != 1 or \
+            roundPairings(1, "Batch 4") != pairings["Batch 4"]:
+        raise ValueError("Tournaments changed meanwhile should be paired again.")
+    print("38. Batched pairings are computed with no transaction open.")
+
+
+def testPoolTimeout():
+    """
+    Test that waiting for a connection times out despite other wakeups.
+    """
+    pool = ConnectionPool(minconn=0, maxconn=1)
+    held = pool.getconn()
+    stop = threading.Event()
+    def wakeUp():
+        # What returning a connection another waiter takes first looks
+        # like to this one, for 2s.
+        for _ in range(40):
+            if stop.wait(0.05):
+                break
+            with pool._cond:
+                pool._cond.notify_all()
+    thread = threading.Thread(target=wakeUp)
+    thread.start()
+    started = time.time()
+    try:
+        pool.getconn(timeout=0.5)
+    except PoolTimeout:
+        waited = time.time() - started
+    else:
+        raise ValueError("A full pool should time out.")
+    finally:
+        stop.set()
+        thread.join()
+        pool.putconn(held)
+        pool.closeall()
+    if not 0.5 <= waited < 1.5:
+        raise ValueError(
+            "Expected a timeout after 0.5s. Got {waited}s".format(waited=waited))
+    print("39. Pool timeouts count from the start of the wait.")
+
+
+def testPairingClusteredRematches():
+    """
+    Test that leaders who all met are paired apart quickly in a large field.
+    """
+    rand = random.Random(40)
+    for leaders in [5, 9]:
+        players = [(pid, 9) for pid in range(leaders)] + sorted(
+            [(pid, rand.randint(0, 8)) for pid in range(leaders, 10000)],
+            key=itemgetter(1), reverse=True)
+        played = set(pairKey(id1, id2) for id1 in range(leaders)
+                     for id2 in range(id1 + 1, leaders))
+        started = time.time()
+        pairs, rematches = pairPlayers(players, played)
+        elapsed = time.time() - started
+        if rematches or any(pairKey(*pair) in played for pair in pairs):
+            raise ValueError(
+                "{leaders} leaders who all met should not meet again."
+                .format(leaders=leaders))
+        if len(pairs) != 5000 or elapsed > 2:
+            raise ValueError(
+                "Expected 5000 pairs in under 2s. Got {pairs} in {elapsed}s"
+                .format(pairs=len(pairs), elapsed=elapsed))
+    print("40. Clustered rematches are avoided without pairing the whole "
+          "field again.")
+
+
+def testConcurrentReporters():
+    """
+    Test that reporters of one tournament do not wait for each other.
+    """
+    configurePool(minconn=1, maxconn=1)
+    registerPlayers(["Parallel A", "Parallel B", "Parallel C",
+                     "Parallel D"], "Parallel")
+    [(id1, name1, id2, name2), (id3, name3, id4, name4)] = \
+        swissPairings("Parallel")
+    tid = getTournamentId("Parallel")
+    version = getBackend().tournamentVersion(tid)
+    with transaction() as cursor:
+        cursor.execute("SELECT pg_backend_pid() % 64")
+        slot = cursor.fetchone()[0]
+    # Another process reports a match and has not committed yet. Its
+    # server process bumps another version slot than the pool's.
+    others = []
+    while True:
+        other = psycopg2.connect(getPool().dsn)
+        others.append(other)
+        cursor = other.cursor()
+        cursor.execute("SELECT pg_backend_pid() % 64")
+        if cursor.fetchone()[0] != slot:
+            break
+    try:
+        cursor.execute("INSERT INTO Matches (winner, loser, tid) "
+                       "VALUES (%s, %s, %s)", (id1, id2, tid))
+        started = time.time()
+        try:
+            with transaction() as pooled:
+                pooled.execute("SET LOCAL lock_timeout = '1s'")
+                reportMatch(id3, id4, "Parallel")
+        except psycopg2.errors.LockNotAvailable:
+            raise ValueError("Reporters should not wait for each other.")
+        if time.time() - started > 0.5:
+            raise ValueError("Reporters should not wait for each other.")
+        other.commit()
+    finally:
+        for other in others:
+            other.close()
+    configurePool()
+    if getBackend().tournamentVersion(tid) != version + 2:
+        raise ValueError("Each report should change the version.")
+    if [row[2] for row in playerStandings("Parallel")] != [1, 1, 0, 0]:
+        raise ValueError("Both reports should be in the standings.")
+    print("41. Concurrent reporters of a tournament do not wait for each "
+          "other.")
+
+
+def testNotificationErrors():
+    """
+    Test that a failing delivery does not stop the standings listener.
+    """
+    registerPlayers(["Robust A", "Robust B"], "Robust")
+    registerPlayers(["Vanishing A"], "Vanishing")
+    [id1, id2] = [row[0] for row in playerStandings("Robust")]
+    vanishing = getTournamentId("Vanishing")
+    deliveries = []
+    delivered = threading.Event()
+
+    def failing(standings, changed):
+        raise RuntimeError("A subscriber failed.")
+
+    def received(standings, changed):
+        deliveries.append((standings, changed))
+        delivered.set()
+
+    listener = StandingsListener(poll_interval=0.1)
+    listener.subscribe(failing, "Robust")
+    listener.subscribe(received, "Robust")
+    listener.subscribe(failing, "Vanishing")
+    listener.start()
+    try:
+        if not delivered.wait(5):
+            raise ValueError("Subscribers should get the current standings.")
+        delivered.clear()
+        # The tournament is deleted between its notification and its read.
+        deletePlayers("Vanishing")
+        with transaction() as cursor:
+            cursor.execute("DELETE FROM Tournaments WHERE id = %s",
+                           (vanishing,))
+        clearCaches()
+        with transaction() as cursor:
+            cursor.execute("SELECT pg_notify('standings_changed', %s)",
+                           (str(vanishing),))
+        time.sleep(0.5)
+        reportMatch(id1, id2, "Robust")
+        if not delivered.wait(5):
+            raise ValueError("Failed deliveries should not stop the listener.")
+    finally:
+        listener.stop()
+    if deliveries[-1][0] != playerStandings("Robust"):
+        raise ValueError("Expected the new standings of Robust.")
+    print("42. Failed deliveries do not stop the standings listener.")
+
+
+def testSimulatorRounds():
+    """
+    Test that the simulator refuses more rounds than a field can play.
+    """
+    try:
+        simulator.simulateTournament(3, 4, simulator.CoinFlip(),
+                                     random.Random(43))
+    except ValueError:
+        pass
+    else:
+        raise ValueError("3 players cannot play 4 rounds.")
+    try:
+        next(simulator.simulate(6, 6, 10, simulator.CoinFlip()))
+    except ValueError:
+        pass
+    else:
+        raise ValueError("6 players cannot play 6 rounds.")
+    ranking, leader_round = simulator.simulateTournament(
+        3, 3, simulator.CoinFlip(), random.Random(43))
+    if sorted(ranking) != [1, 2, 3]:
+        raise ValueError("3 players can play 3 rounds, a bye each.")
+    print("43. The simulator refuses more rounds than a field can play.")
+
+
 if __name__ == '__main__':
     testCount()
     testStandingsBeforeMatches()
@@ -346,5 +1358,38 @@ if __name__ == '__main__':
     testRematches()
     testOddNumberOfPlayers()
     testDifferentTournaments()
+    testConnectionPool()
+    testNameCaches()
+    testRegisterPlayers()
+    testReportMatchesBatch()
+    testMatchingPairings()
+    testInstrumentation()
+    testMemoryBackend()
+    testTiebreaks()
+    testStandingsPages()
+    testRoundSnapshots()
+    testStandingsNotifications()
+    testArchiveTournament()
+    testPreparedStatements()
+    testTournamentState()
+    testTransferTournament()
+    testConcurrentReports()
+    testPairNextRounds()
+    testReadReplicas()
+    testVersionedResults()
+    testPreparedStatementErrors()
+    testStaleTournamentState()
+    testVersionCheckInRound()
+    testExactOpponentWinPct()
+    testArchivedWrites()
+    testTournamentCreationLocks()
+    testNotificationsReadPrimary()
+    testSimulator()
+    testPairNextRoundsOutsideTransaction()
+    testPoolTimeout()
+    testPairingClusteredRematches()
+    testConcurrentReporters()
+    testNotificationErrors()
+    testSimulatorRounds()
 
-    print "Success!  All tests pass!"
+    print("Success!  All tests pass!")
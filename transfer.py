@@ -0,0 +1,245 @@
+#!/usr/bin/env python
+#
+# transfer.py -- move whole tournaments in and out through COPY
+#
+# exportTournament writes the players, registrations and matches of one
+# tournament to three files of a directory, in CSV or in PostgreSQL's
+# binary COPY format. importTournament loads such a directory as a new
+# tournament: players are matched to existing ones by name (or created),
+# and every id is remapped to the ids of this database. Rows are streamed
+# between the files and the server, never held in memory.
+#
+# Usage:
+#   python transfer.py export MAIN_TOURNAMENT /tmp/main --format binary
+#   python transfer.py import /tmp/main "MAIN copy" --format binary
+#
+
+import argparse
+import json
+import os
+import sys
+
+import tournament
+
+# COPY options of each supported file format, and the extension of its
+# files.
+FORMATS = {
+    'csv': ("(FORMAT csv, HEADER true)", 'csv'),
+    'binary': ("(FORMAT binary)", 'bin'),
+}
+
+# The files of an exported tournament in import order, with the columns of
+# the table each is loaded into before its ids are remapped.
+TABLES = (
+    ('players', "id INT PRIMARY KEY, name TEXT NOT NULL"),
+    ('registrations', "pid INT PRIMARY KEY"),
+    ('matches', "id INT PRIMARY KEY, winner INT NOT NULL, " +
+     "loser INT NOT NULL, round INT NOT NULL"),
+)
+
+# What is exported to each file. Players come last and include everyone
+# registered or in a match as of then, so every id the other two files
+# refer to is in it even if rows are added meanwhile.
+EXPORT_QUERIES = (
+    ('registrations',
+     "SELECT pid FROM PlayersTournaments WHERE tid = {tid} ORDER BY pid"),
+    ('matches',
+     "SELECT id, winner, loser, round FROM Matches WHERE tid = {tid} " +
+     "ORDER BY id"),
+    ('players',
+     "SELECT id, name FROM Players WHERE id IN " +
+     "(SELECT pid FROM PlayersTournaments WHERE tid = {tid} " +
+     "UNION SELECT winner FROM Matches WHERE tid = {tid} " +
+     "UNION SELECT loser FROM Matches WHERE tid = {tid}) ORDER BY id"),
+)
+
+
+def _copyFormat(format):
+    if format not in FORMATS:
+        raise ValueError(
+            "Unknown format {format}, expected one of {formats}.".format(
+                format=format, formats=", ".join(sorted(FORMATS))))
+    if not isinstance(tournament.getBackend(), tournament.PostgresBackend):
+        raise RuntimeError("Transfers need the PostgreSQL backend.")
+
+    return FORMATS[format]
+
+
+def _path(directory, name, extension):
+    return os.path.join(directory, "{name}.{extension}".format(
+        name=name, extension=extension))
+
+
+def exportTournament(tournament_name, directory, format='csv'):
+    """Writes the players, registrations and matches of a tournament.
+
+    Args:
+      tournament_name: name of the tournament to export.
+      directory: folder receiving players, registrations and matches files
+        (created if needed).
+      format: 'csv' (with a header line) or 'binary'.
+
+    Returns:
+      A dict with the number of rows written to each file, by file name.
+    """
+    options, extension = _copyFormat(format)
+    if not os.path.isdir(directory):
+        os.makedirs(directory)
+
+    counts = {}
+    with tournament.transaction() as cursor:
+        tid = tournament.getTournamentId(tournament_name)
+
+        for name, query in EXPORT_QUERIES:
+            # COPY takes no parameters; tid is an int, so it is safe to
+            # inline.
+            query = "COPY (" + query.format(tid=int(tid)) + ") " +\
+                    "TO STDOUT WITH " + options
+            with open(_path(directory, name, extension), 'wb') as output:
+                cursor.copy_expert(query, output)
+            counts[name] = cursor.rowcount
+
+    return counts
+
+
+def importTournament(directory, tournament_name, format='csv'):
+    """Loads a directory written by exportTournament as a new tournament.
+
+    Players are matched to existing players by name and created otherwise;
+    matches keep their order and rounds. The tournament is created and
+    committed first, in a short transaction of its own, since creating its
+    partitions locks Players (see migrations/008_partitions.sql); then
+    everything is imported in one transaction. If the import fails, the
+    tournament is deleted again.
+
+    Args:
+      directory: folder holding the exported files.
+      tournament_name: name of the tournament to create.
+      format: the format the files were exported in.
+
+    Returns:
+      A dict with the number of rows read from each file, by file name.
+
+    Raises:
+      ValueError: if the tournament exists, or if registrations or matches
+        refer to players missing from the players file.
+    """
+    options, extension = _copyFormat(format)
+
+    with tournament.transaction():
+        if tournament.tournamentExists(tournament_name):
+            raise ValueError(
+                "Tournament {name} already exists.".format(
+                    name=tournament_name))
+
+        tid = tournament.getBackend().createTournament(tournament_name)
+
+    try:
+        return _importRows(directory, tid, options, extension)
+    except Exception:
+        with tournament.transaction() as cursor:
+            query = "DELETE FROM Tournaments WHERE id = %s"
+            parameter = (tid,)
+            cursor.execute(query, parameter)
+        raise
+
+
+def _importRows(directory, tid, options, extension):
+    counts = {}
+    with tournament.transaction() as cursor:
+        for name, columns in TABLES:
+            cursor.execute("CREATE TEMP TABLE import_{name} ({columns}) "
+                           "ON COMMIT DROP".format(name=name,
+                                                   columns=columns))
+            query = "COPY import_{name} FROM STDIN WITH ".format(name=name) +\
+                    options
+            with open(_path(directory, name, extension), 'rb') as source:
+                cursor.copy_expert(query, source)
+            counts[name] = cursor.rowcount
+
+        query = "SELECT count(*) FROM import_registrations AS r " +\
+                "WHERE r.pid NOT IN (SELECT id FROM import_players)"
+        cursor.execute(query)
+        missing = cursor.fetchone()[0]
+        query = "SELECT count(*) FROM import_matches AS m " +\
+                "WHERE m.winner NOT IN (SELECT id FROM import_players) " +\
+                "OR m.loser NOT IN (SELECT id FROM import_players)"
+        cursor.execute(query)
+        missing += cursor.fetchone()[0]
+        if missing:
+            raise ValueError(
+                "{n} registrations or matches refer to players missing "
+                "from {path}.".format(
+                    n=missing, path=_path(directory, 'players', extension)))
+
+        # Create the players missing here, then map the exported ids to
+        # the ids of this database.
+        query = "INSERT INTO Players (name) " +\
+                "SELECT DISTINCT name FROM import_players AS i " +\
+                "WHERE NOT EXISTS " +\
+                "(SELECT 1 FROM Players AS p WHERE p.name = i.name)"
+        cursor.execute(query)
+        query = "CREATE TEMP TABLE import_ids ON COMMIT DROP AS " +\
+                "SELECT i.id AS old_id, p.id AS new_id " +\
+                "FROM import_players AS i " +\
+                "JOIN Players AS p ON p.name = i.name"
+        cursor.execute(query)
+        cursor.execute("ALTER TABLE import_ids ADD PRIMARY KEY (old_id)")
+
+        query = "INSERT INTO PlayersTournaments (pid, tid) " +\
+                "SELECT DISTINCT ids.new_id, %s " +\
+                "FROM import_registrations AS r " +\
+                "JOIN import_ids AS ids ON ids.old_id = r.pid"
+        parameter = (tid,)
+        cursor.execute(query, parameter)
+
+        query = "INSERT INTO Matches (winner, loser, tid, round) " +\
+                "SELECT w.new_id, l.new_id, %s, m.round " +\
+                "FROM import_matches AS m " +\
+                "JOIN import_ids AS w ON w.old_id = m.winner " +\
+                "JOIN import_ids AS l ON l.old_id = m.loser " +\
+                "ORDER BY m.id"
+        parameter = (tid,)
+        cursor.execute(query, parameter)
+
+        query = "UPDATE Tournaments SET round = " +\
+                "(SELECT COALESCE(max(round), 0) FROM import_matches) " +\
+                "WHERE id = %s"
+        parameter = (tid,)
+        cursor.execute(query, parameter)
+
+    return counts
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Export or import a tournament through COPY.")
+    subparsers = parser.add_subparsers(dest='action')
+    export = subparsers.add_parser('export')
+    export.add_argument('tournament')
+    export.add_argument('directory')
+    load = subparsers.add_parser('import')
+    load.add_argument('directory')
+    load.add_argument('tournament')
+    for subparser in (export, load):
+        subparser.add_argument('--format', default='csv',
+                               choices=sorted(FORMATS))
+        subparser.add_argument('--database', default=tournament.DATABASE_NAME)
+    args = parser.parse_args(argv)
+    if args.action is None:
+        parser.error("expected export or import")
+
+    tournament.configurePool(args.database)
+    if args.action == 'export':
+        counts = exportTournament(args.tournament, args.directory,
+                                  args.format)
+    else:
+        counts = importTournament(args.directory, args.tournament,
+                                  args.format)
+
+    json.dump(counts, sys.stdout, indent=2, sort_keys=True)
+    sys.stdout.write('\n')
+
+
+if __name__ == '__main__':
+    main()